@@ -44,6 +44,11 @@ if [ "$1" == "tests" ]; then
 	make all compress
 	py.test --reruns 5 -n 3 tests
 fi
+if [ "$1" == "tests-redis" ]; then
+	pip3 install -r src/requirements.txt --no-use-pep517 -Ur src/requirements/dev.txt
+	cd src
+	py.test --reruns 5 tests/base/test_locking.py
+fi
 if [ "$1" == "tests-cov" ]; then
 	pip3 install -r src/requirements.txt --no-use-pep517 -Ur src/requirements/dev.txt
 	cd src
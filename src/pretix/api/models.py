@@ -1,6 +1,8 @@
 from datetime import timedelta
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
@@ -96,6 +98,35 @@ class WebHookEventListener(models.Model):
         ordering = ("action_type",)
 
 
+def _invalidate_webhook_index(organizer_id):
+    from pretix.api.webhooks import invalidate_webhook_index
+
+    # Only invalidate once the change is visible to others, otherwise a concurrent request could fill the
+    # index with the old subscriptions again before we commit
+    transaction.on_commit(lambda: invalidate_webhook_index(organizer_id))
+
+
+@receiver(post_save, sender=WebHook, dispatch_uid="webhook_index_save")
+@receiver(post_delete, sender=WebHook, dispatch_uid="webhook_index_delete")
+def _webhook_changed(sender, instance, **kwargs):
+    _invalidate_webhook_index(instance.organizer_id)
+
+
+@receiver(post_save, sender=WebHookEventListener, dispatch_uid="webhook_index_listener_save")
+@receiver(post_delete, sender=WebHookEventListener, dispatch_uid="webhook_index_listener_delete")
+def _webhook_listener_changed(sender, instance, **kwargs):
+    try:
+        _invalidate_webhook_index(instance.webhook.organizer_id)
+    except WebHook.DoesNotExist:
+        pass  # Deleted together with its webhook, which already took care of it
+
+
+@receiver(m2m_changed, sender=WebHook.limit_events.through, dispatch_uid="webhook_index_limit_events")
+def _webhook_limit_events_changed(sender, instance, action, reverse, **kwargs):
+    if action.startswith('post_') and not reverse:
+        _invalidate_webhook_index(instance.organizer_id)
+
+
 class WebHookCall(models.Model):
     webhook = models.ForeignKey('WebHook', on_delete=models.CASCADE, related_name='calls')
     datetime = models.DateTimeField(auto_now_add=True)
@@ -928,6 +928,8 @@ class OrderCreateSerializer(I18nAwareModelSerializer):
             for cp in delete_cps:
                 cp.delete()
 
+            order._update_quota_counters(pos_map.values(), added_status=order.status)
+
         order.total = sum([p.price for p in order.positions.all()])
         for fee_data in fees_data:
             is_percentage = fee_data.pop('_treat_value_as_percentage', False)
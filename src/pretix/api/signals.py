@@ -1,11 +1,11 @@
 from datetime import timedelta
 
-from django.dispatch import Signal, receiver
+from django.dispatch import Signal
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
 from pretix.api.models import ApiCall, WebHookCall
-from pretix.base.signals import periodic_task
+from pretix.base.services.periodic import periodic_job
 
 register_webhook_events = Signal(
     providing_args=[]
@@ -17,13 +17,13 @@ instances.
 """
 
 
-@receiver(periodic_task)
+@periodic_job(interval=timedelta(hours=1))
 @scopes_disabled()
 def cleanup_webhook_logs(sender, **kwargs):
     WebHookCall.objects.filter(datetime__lte=now() - timedelta(days=30)).delete()
 
 
-@receiver(periodic_task)
+@periodic_job(interval=timedelta(hours=1))
 @scopes_disabled()
 def cleanup_api_logs(sender, **kwargs):
     ApiCall.objects.filter(created__lte=now() - timedelta(hours=24)).delete()
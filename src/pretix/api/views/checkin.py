@@ -1,5 +1,8 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
 from django.core.exceptions import ValidationError
-from django.db.models import Count, F, Max, OuterRef, Prefetch, Q, Subquery
+from django.db.models import F, Max, OuterRef, Prefetch, Q, Subquery
 from django.db.models.functions import Coalesce
 from django.http import Http404
 from django.shortcuts import get_object_or_404
@@ -7,7 +10,8 @@ from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
 from django_scopes import scopes_disabled
-from rest_framework import viewsets
+from pytz import UTC
+from rest_framework import serializers, viewsets
 from rest_framework.decorators import action
 from rest_framework.fields import DateTimeField
 from rest_framework.response import Response
@@ -22,6 +26,7 @@ from pretix.base.models import (
 )
 from pretix.base.services.checkin import (
     CheckInError, RequiredQuestionsError, perform_checkin,
+    perform_checkin_batch,
 )
 from pretix.helpers.database import FixedOrderBy
 
@@ -80,44 +85,23 @@ class CheckinListViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['GET'])
     def status(self, *args, **kwargs):
         clist = self.get_object()
-        cqs = Checkin.objects.filter(
-            position__order__event=clist.event,
-            position__order__status__in=[Order.STATUS_PAID] + ([Order.STATUS_PENDING] if clist.include_pending else []),
-            list=clist
-        )
-        pqs = OrderPosition.objects.filter(
-            order__event=clist.event,
-            order__status__in=[Order.STATUS_PAID] + ([Order.STATUS_PENDING] if clist.include_pending else []),
-            subevent=clist.subevent,
-        )
-        if not clist.all_products:
-            pqs = pqs.filter(item__in=clist.limit_products.values_list('id', flat=True))
-            cqs = cqs.filter(position__item__in=clist.limit_products.values_list('id', flat=True))
+        op_by_item = defaultdict(int)
+        op_by_variation = defaultdict(int)
+        c_by_item = defaultdict(int)
+        c_by_variation = defaultdict(int)
+        for (item, variation), (positions, checkins) in clist.checkin_status(clist.subevent).items():
+            op_by_item[item] += positions
+            op_by_variation[variation] += positions
+            c_by_item[item] += checkins
+            c_by_variation[variation] += checkins
 
         ev = clist.subevent or clist.event
         response = {
             'event': {
                 'name': str(ev.name),
             },
-            'checkin_count': cqs.count(),
-            'position_count': pqs.count()
-        }
-
-        op_by_item = {
-            p['item']: p['cnt']
-            for p in pqs.order_by().values('item').annotate(cnt=Count('id'))
-        }
-        op_by_variation = {
-            p['variation']: p['cnt']
-            for p in pqs.order_by().values('variation').annotate(cnt=Count('id'))
-        }
-        c_by_item = {
-            p['position__item']: p['cnt']
-            for p in cqs.order_by().values('position__item').annotate(cnt=Count('id'))
-        }
-        c_by_variation = {
-            p['position__variation']: p['cnt']
-            for p in cqs.order_by().values('position__variation').annotate(cnt=Count('id'))
+            'checkin_count': sum(c_by_item.values()),
+            'position_count': sum(op_by_item.values()),
         }
 
         if not clist.all_products:
@@ -147,6 +131,21 @@ class CheckinListViewSet(viewsets.ModelViewSet):
         return Response(response)
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def _encode_cursor(dt, order_id):
+    return '{}.{}'.format((dt - EPOCH) // timedelta(microseconds=1), order_id)
+
+
+def _decode_cursor(cursor):
+    try:
+        ts, order_id = cursor.split('.')
+        return EPOCH + timedelta(microseconds=int(ts)), int(order_id)
+    except (ValueError, OverflowError):
+        raise serializers.ValidationError({'cursor': ['Invalid cursor.']})
+
+
 with scopes_disabled():
     class CheckinOrderPositionFilter(OrderPositionFilter):
 
@@ -184,6 +183,14 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
     permission = 'can_view_orders'
     write_permission = 'can_change_orders'
 
+    # Number of changed orders returned per page of the change feed
+    changes_page_size = 500
+    # Transactions can commit in a different order than their timestamps suggest, so changes younger than this
+    # are sent again with the next request instead of being skipped
+    changes_overlap = timedelta(seconds=30)
+    # Maximum number of check-ins accepted by a single batch_redeem call
+    batch_redeem_size = 1000
+
     @cached_property
     def checkinlist(self):
         try:
@@ -248,6 +255,46 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
 
         return qs
 
+    @action(detail=False, methods=['GET'])
+    def changes(self, *args, **kwargs):
+        start = now()
+        cursor = None
+        orders = Order.objects.filter(event=self.request.event)
+        if self.request.query_params.get('cursor'):
+            cursor = _decode_cursor(self.request.query_params['cursor'])
+            orders = orders.filter(
+                Q(last_modified__gt=cursor[0]) | Q(last_modified=cursor[0], pk__gt=cursor[1])
+            )
+        orders = list(
+            orders.order_by('last_modified', 'pk').values_list('last_modified', 'pk')[:self.changes_page_size + 1]
+        )
+        has_more = len(orders) > self.changes_page_size
+        orders = orders[:self.changes_page_size]
+        order_ids = [pk for lm, pk in orders]
+
+        positions = []
+        removed = []
+        if order_ids:
+            positions = list(self.filter_queryset(self.get_queryset()).filter(order_id__in=order_ids))
+            removed = list(
+                OrderPosition.all.filter(order_id__in=order_ids).exclude(
+                    pk__in=[p.pk for p in positions]
+                ).values_list('pk', flat=True)
+            )
+
+        next_cursor = orders[-1] if orders else cursor
+        if not has_more:
+            settled = (start - self.changes_overlap, 0)
+            if next_cursor is None or next_cursor > settled:
+                next_cursor = max(settled, cursor) if cursor else settled
+
+        return Response({
+            'cursor': _encode_cursor(*next_cursor),
+            'has_more': has_more,
+            'results': self.get_serializer(positions, many=True).data,
+            'removed': removed,
+        })
+
     @action(detail=True, methods=['POST'])
     def redeem(self, *args, **kwargs):
         force = bool(self.request.data.get('force', False))
@@ -307,6 +354,75 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
                 'position': CheckinListOrderPositionSerializer(op, context=self.get_serializer_context()).data
             }, status=201)
 
+    @action(detail=False, methods=['POST'])
+    def batch_redeem(self, *args, **kwargs):
+        data = self.request.data
+        if not isinstance(data, list) or not all(isinstance(d, dict) and d.get('secret') for d in data):
+            raise serializers.ValidationError('Please submit a list of objects that each contain a secret.')
+        if len(data) > self.batch_redeem_size:
+            raise serializers.ValidationError(
+                'Please submit at most {} check-ins at once.'.format(self.batch_redeem_size)
+            )
+
+        positions = {
+            op.secret: op for op in self.get_queryset(ignore_status=True).filter(
+                secret__in={str(d['secret']) for d in data}
+            )
+        }
+        scans = []
+        for d in data:
+            op = positions.get(str(d['secret']))
+            if op:
+                scans.append({
+                    'position': op,
+                    'answers': d.get('answers') or {},
+                    'force': bool(d.get('force', False)),
+                    'ignore_unpaid': bool(d.get('ignore_unpaid', False)),
+                    'nonce': d.get('nonce'),
+                    'datetime': DateTimeField().to_internal_value(d['datetime']) if d.get('datetime') else None,
+                    'questions_supported': d.get('questions_supported', True),
+                    'canceled_supported': d.get('canceled_supported', False),
+                })
+        errors = perform_checkin_batch(
+            self.checkinlist, scans, user=self.request.user, auth=self.request.auth
+        ) if scans else []
+
+        serialized = {
+            p['id']: p for p in self.get_serializer(
+                self.get_queryset(ignore_status=True).filter(pk__in=[s['position'].pk for s in scans]), many=True
+            ).data
+        }
+        response = []
+        results = iter(zip(scans, errors))
+        for d in data:
+            if str(d['secret']) not in positions:
+                response.append({
+                    'secret': d['secret'],
+                    'status': 'error',
+                    'reason': 'not_found',
+                    'require_attention': False,
+                    'position': None,
+                })
+                continue
+
+            scan, error = next(results)
+            op = scan['position']
+            r = {
+                'secret': d['secret'],
+                'status': 'ok',
+                'require_attention': op.item.checkin_attention or op.order.checkin_attention,
+                'position': serialized.get(op.pk),
+            }
+            if isinstance(error, RequiredQuestionsError):
+                r['status'] = 'incomplete'
+                r['questions'] = [QuestionSerializer(q).data for q in error.questions]
+            elif error:
+                r['status'] = 'error'
+                r['reason'] = error.code
+            response.append(r)
+
+        return Response(response)
+
     def get_object(self, ignore_status=False):
         queryset = self.filter_queryset(self.get_queryset(ignore_status=ignore_status))
         if self.kwargs['pk'].isnumeric():
@@ -31,8 +31,9 @@ from pretix.api.serializers.order import (
 from pretix.base.i18n import language
 from pretix.base.models import (
     CachedCombinedTicket, CachedTicket, Device, Event, Invoice, InvoiceAddress,
-    Order, OrderFee, OrderPayment, OrderPosition, OrderRefund, Quota,
-    TeamAPIToken, generate_position_secret, generate_secret,
+    Order, OrderFee, OrderPayment, OrderPosition, OrderPositionSearchToken,
+    OrderRefund, Quota, TeamAPIToken, generate_position_secret,
+    generate_secret,
 )
 from pretix.base.payment import PaymentException
 from pretix.base.services import tickets
@@ -611,16 +612,7 @@ with scopes_disabled():
         search = django_filters.CharFilter(method='search_qs')
 
         def search_qs(self, queryset, name, value):
-            return queryset.filter(
-                Q(secret__istartswith=value)
-                | Q(attendee_name_cached__icontains=value)
-                | Q(addon_to__attendee_name_cached__icontains=value)
-                | Q(attendee_email__icontains=value)
-                | Q(addon_to__attendee_email__icontains=value)
-                | Q(order__code__istartswith=value)
-                | Q(order__invoice_address__name_cached__icontains=value)
-                | Q(order__email__icontains=value)
-            )
+            return OrderPositionSearchToken.search(queryset, self.request.event, value)
 
         def has_checkin_qs(self, queryset, name, value):
             return queryset.filter(checkins__isnull=not value)
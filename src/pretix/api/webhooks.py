@@ -1,11 +1,15 @@
 import json
 import logging
 import time
+import uuid
 from collections import OrderedDict
+from datetime import timedelta
+from urllib.parse import urlsplit
 
 import requests
 from celery.exceptions import MaxRetriesExceededError
-from django.db.models import Exists, OuterRef, Q
+from django.conf import settings
+from django.core.cache import cache
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from django_scopes import scope, scopes_disabled
@@ -13,12 +17,39 @@ from requests import RequestException
 
 from pretix.api.models import WebHook, WebHookCall, WebHookEventListener
 from pretix.api.signals import register_webhook_events
+from pretix.base.metrics import (
+    pretix_webhook_backlog, pretix_webhook_deliveries_total,
+    pretix_webhook_delivery_duration_seconds,
+)
 from pretix.base.models import LogEntry
+from pretix.base.services.periodic import periodic_job
 from pretix.base.services.tasks import ProfiledTask, TransactionAwareTask
 from pretix.celery_app import app
 
 logger = logging.getLogger(__name__)
 _ALL_EVENTS = None
+_TYPE_CACHE = {}
+_sessions = {}
+
+WEBHOOK_TIMEOUT = (5, 30)  # connect and read timeout in seconds
+BATCH_SIZE = 5  # deliveries per chunk, must finish within BATCH_SCHEDULE_TIMEOUT even if all of them time out
+BATCH_SCHEDULE_TIMEOUT = 300
+BATCH_TIME_LIMIT = 120  # seconds after which a batch task hands the queue over to a new task
+INDEX_TIMEOUT = 3600
+
+LUA_REFRESH_FLAG = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+LUA_RELEASE_FLAG = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
 
 
 class WebhookEvent:
@@ -69,6 +100,77 @@ def get_all_webhook_events():
     return types
 
 
+def get_webhook_type(action_type):
+    """
+    Returns the registered webhook event type that handles the given action type, either directly or
+    through a wildcard type like ``pretix.event.order.changed.*``, or ``None``. The result is memoized
+    per process, since the set of registered types does not change at runtime.
+    """
+    try:
+        return _TYPE_CACHE[action_type]
+    except KeyError:
+        pass
+
+    types = get_all_webhook_events()
+    notification_type = None
+    typepath = action_type
+    while not notification_type and '.' in typepath:
+        notification_type = types.get(typepath + ('.*' if typepath != action_type else ''))
+        typepath = typepath.rsplit('.', 1)[0]
+
+    _TYPE_CACHE[action_type] = notification_type
+    return notification_type
+
+
+def _index_key(organizer_id):
+    return 'pretix_webhook_index_{}'.format(organizer_id)
+
+
+def get_webhook_index(organizer_id) -> dict:
+    """
+    Returns a dictionary mapping each action type that an enabled webhook of the given organizer listens to
+    to a list of ``(webhook_id, event_ids)`` tuples, where ``event_ids`` is ``None`` for webhooks active for
+    all events. The index is kept in the cache and dropped whenever a webhook of the organizer changes.
+    """
+    key = _index_key(organizer_id)
+    index = cache.get(key)
+    if index is not None:
+        return index
+
+    limits = {}
+    for wh_id, event_id in WebHook.limit_events.through.objects.filter(
+        webhook__organizer_id=organizer_id, webhook__enabled=True, webhook__all_events=False
+    ).values_list('webhook_id', 'event_id'):
+        limits.setdefault(wh_id, set()).add(event_id)
+
+    index = {}
+    for wh_id, action_type, all_events in WebHookEventListener.objects.filter(
+        webhook__organizer_id=organizer_id, webhook__enabled=True
+    ).values_list('webhook_id', 'action_type', 'webhook__all_events').order_by('webhook_id'):
+        index.setdefault(action_type, []).append((wh_id, None if all_events else limits.get(wh_id, set())))
+
+    cache.set(key, index, INDEX_TIMEOUT)
+    return index
+
+
+def invalidate_webhook_index(organizer_id):
+    cache.delete(_index_key(organizer_id))
+
+
+def get_subscribed_webhooks(organizer_id, event_id, action_type):
+    """
+    Returns the IDs of all enabled webhooks of the organizer that should receive a log entry with the
+    given action type and event.
+    """
+    notification_type = get_webhook_type(action_type)
+    if not notification_type:
+        return []
+    return [
+        wh_id for wh_id, event_ids in get_webhook_index(organizer_id).get(notification_type.action_type, [])
+        if event_ids is None or not event_id or event_id in event_ids
+    ]
+
+
 class ParametrizedOrderWebhookEvent(WebhookEvent):
     def __init__(self, action_type, verbose_name):
         self._action_type = action_type
@@ -166,39 +268,203 @@ def register_default_webhook_events(sender, **kwargs):
 
 @app.task(base=TransactionAwareTask)
 def notify_webhooks(logentry_id: int):
-    logentry = LogEntry.all.get(id=logentry_id)
+    _notify_webhooks(LogEntry.all.get(id=logentry_id))
+
+
+@app.task(base=TransactionAwareTask)
+def notify_webhooks_bulk(logentry_ids: list):
+    for logentry in LogEntry.all.filter(id__in=logentry_ids).select_related('event__organizer').order_by('pk'):
+        _notify_webhooks(logentry)
+
 
+def _notify_webhooks(logentry: LogEntry):
+    logentry_id = logentry.pk
     if not logentry.organizer:
         return  # We need to know the organizer
 
-    types = get_all_webhook_events()
-    notification_type = None
-    typepath = logentry.action_type
-    while not notification_type and '.' in typepath:
-        notification_type = types.get(typepath + ('.*' if typepath != logentry.action_type else ''))
-        typepath = typepath.rsplit('.', 1)[0]
-
+    notification_type = get_webhook_type(logentry.action_type)
     if not notification_type:
         return  # Ignore, no webhooks for this event type
 
-    # All webhooks that registered for this notification
-    event_listener = WebHookEventListener.objects.filter(
-        webhook=OuterRef('pk'),
-        action_type=notification_type.action_type
-    )
+    for wh_id in get_subscribed_webhooks(logentry.organizer.pk, logentry.event_id, logentry.action_type):
+        if settings.HAS_REDIS:
+            enqueue_webhook(wh_id, logentry_id, notification_type.action_type)
+        else:
+            send_webhook.apply_async(args=(logentry_id, notification_type.action_type, wh_id))
 
-    webhooks = WebHook.objects.annotate(has_el=Exists(event_listener)).filter(
-        organizer=logentry.organizer,
-        has_el=True,
-        enabled=True
-    )
-    if logentry.event_id:
-        webhooks = webhooks.filter(
-            Q(all_events=True) | Q(limit_events__pk=logentry.event_id)
-        )
 
-    for wh in webhooks:
-        send_webhook.apply_async(args=(logentry_id, notification_type.action_type, wh.pk))
+def _get_session(url):
+    """
+    Returns a HTTP session for the host of the given URL. Sessions are kept for the lifetime of the
+    process, so consecutive deliveries to the same receiver can reuse an open connection.
+    """
+    key = urlsplit(url)[:2]
+    if key not in _sessions:
+        _sessions[key] = requests.Session()
+    return _sessions[key]
+
+
+def deliver_webhooks(webhook, deliveries, is_retry=False):
+    """
+    Sends the notifications given as a list of ``(logentry_id, action_type)`` tuples to the given
+    webhook, one after another on the same connection, and records all attempts at once.
+
+    :returns: The list of deliveries that failed and should be retried later.
+    """
+    types = get_all_webhook_events()
+    logentries = LogEntry.all.in_bulk([logentry_id for logentry_id, action_type in deliveries])
+    session = _get_session(webhook.target_url)
+    labels = {'webhook': str(webhook.pk)}
+    calls = []
+    failed = []
+
+    for logentry_id, action_type in deliveries:
+        event_type = types.get(action_type)
+        logentry = logentries.get(logentry_id)
+        if not event_type or not logentry or not webhook.enabled:
+            continue  # Ignore, e.g. plugin not installed
+
+        try:
+            payload = event_type.build_payload(logentry)
+        except Exception:
+            # Retrying would fail the same way, e.g. if the order has been deleted in the meantime
+            logger.exception('Could not build webhook payload for log entry {}'.format(logentry_id))
+            pretix_webhook_deliveries_total.inc(status='failure', **labels)
+            continue
+
+        t = time.time()
+        try:
+            resp = session.post(
+                webhook.target_url,
+                json=payload,
+                allow_redirects=False,
+                timeout=WEBHOOK_TIMEOUT,
+            )
+            calls.append(WebHookCall(
+                webhook=webhook,
+                action_type=logentry.action_type,
+                target_url=webhook.target_url,
+                is_retry=is_retry,
+                execution_time=time.time() - t,
+                return_code=resp.status_code,
+                payload=json.dumps(payload),
+                response_body=resp.text[:1024 * 1024],
+                success=200 <= resp.status_code <= 299
+            ))
+            if resp.status_code == 410:
+                webhook.enabled = False
+                webhook.save()
+            elif resp.status_code > 299:
+                failed.append((logentry_id, action_type))
+        except RequestException as e:
+            calls.append(WebHookCall(
+                webhook=webhook,
+                action_type=logentry.action_type,
+                target_url=webhook.target_url,
+                is_retry=is_retry,
+                execution_time=time.time() - t,
+                return_code=0,
+                payload=json.dumps(payload),
+                response_body=str(e)[:1024 * 1024]
+            ))
+            failed.append((logentry_id, action_type))
+
+        pretix_webhook_delivery_duration_seconds.observe(calls[-1].execution_time, **labels)
+        pretix_webhook_deliveries_total.inc(status='success' if calls[-1].success else 'failure', **labels)
+
+    WebHookCall.objects.bulk_create(calls)
+    return failed
+
+
+def enqueue_webhook(webhook_id: int, logentry_id: int, action_type: str):
+    """
+    Adds a notification to the queue of the given webhook in Redis and makes sure a task is
+    scheduled that works through the queue. There is at most one such task per webhook at a time,
+    so notifications are delivered in order and coalesced into batches while the receiver is busy.
+    """
+    from django_redis import get_redis_connection
+
+    rc = get_redis_connection("redis")
+    rc.rpush(_queue_key(webhook_id), json.dumps([logentry_id, action_type]))
+    _schedule_batch(rc, webhook_id)
+
+
+def _queue_key(webhook_id):
+    return 'pretix_webhook_queue_{}'.format(webhook_id)
+
+
+def _schedule_batch(rc, webhook_id):
+    # The flag holds a token of the task that owns the queue. It expires in case a worker dies
+    # while processing the queue and is refreshed before every chunk of deliveries.
+    token = uuid.uuid4().hex
+    if rc.set(_queue_key(webhook_id) + '_scheduled', token, nx=True, ex=BATCH_SCHEDULE_TIMEOUT):
+        send_webhook_batch.apply_async(args=(webhook_id, token))
+
+
+@app.task(base=ProfiledTask)
+def send_webhook_batch(webhook_id: int, token: str):
+    from django_redis import get_redis_connection
+
+    rc = get_redis_connection("redis")
+    queue = _queue_key(webhook_id)
+    flag = queue + '_scheduled'
+    refresh_flag = rc.register_script(LUA_REFRESH_FLAG)
+    release_flag = rc.register_script(LUA_RELEASE_FLAG)
+
+    try:
+        with scopes_disabled():
+            webhook = WebHook.objects.select_related('organizer').get(id=webhook_id)
+    except WebHook.DoesNotExist:
+        rc.delete(queue)
+        release_flag(keys=[flag], args=[token])
+        return
+
+    deadline = time.monotonic() + BATCH_TIME_LIMIT
+    while time.monotonic() < deadline:
+        if not refresh_flag(keys=[flag], args=[token, BATCH_SCHEDULE_TIMEOUT]):
+            # Our flag expired and another task took over the queue
+            return
+
+        # Deliveries are only removed from the queue once they have been attempted, so they are
+        # picked up again by the next task if this worker dies.
+        deliveries = rc.lrange(queue, 0, BATCH_SIZE - 1)
+        if not deliveries:
+            break
+        try:
+            with scope(organizer=webhook.organizer):
+                failed = deliver_webhooks(webhook, [tuple(json.loads(d.decode())) for d in deliveries])
+            for logentry_id, action_type in failed:
+                send_webhook.apply_async(args=(logentry_id, action_type, webhook_id), countdown=1, retries=1)
+        finally:
+            # Even if something unexpected went wrong, these entries must not block the queue forever
+            pipe = rc.pipeline()
+            pipe.ltrim(queue, len(deliveries), -1)
+            pipe.llen(queue)
+            _, backlog = pipe.execute()
+            pretix_webhook_backlog.set(backlog, webhook=str(webhook_id))
+
+    if release_flag(keys=[flag], args=[token]) and rc.llen(queue):
+        # More notifications came in while we were busy, or we ran out of time
+        _schedule_batch(rc, webhook_id)
+
+
+@periodic_job(interval=timedelta(minutes=5))
+def schedule_webhook_batches(sender, **kwargs):
+    """
+    Schedules a task for every webhook queue that still contains notifications but has no task,
+    e.g. because the worker working through it died.
+    """
+    if not settings.HAS_REDIS:
+        return
+    from django_redis import get_redis_connection
+
+    rc = get_redis_connection("redis")
+    prefix = _queue_key('')
+    for key in rc.scan_iter(match=prefix + '*', count=1000):
+        key = key.decode()
+        if key.endswith('_scheduled') or rc.exists(key + '_scheduled'):
+            continue
+        _schedule_batch(rc, int(key[len(prefix):]))
 
 
 @app.task(base=ProfiledTask, bind=True, max_retries=9)
@@ -207,49 +473,8 @@ def send_webhook(self, logentry_id: int, action_type: str, webhook_id: int):
     with scopes_disabled():
         webhook = WebHook.objects.get(id=webhook_id)
     with scope(organizer=webhook.organizer):
-        logentry = LogEntry.all.get(id=logentry_id)
-        types = get_all_webhook_events()
-        event_type = types.get(action_type)
-        if not event_type or not webhook.enabled:
-            return  # Ignore, e.g. plugin not installed
-
-        payload = event_type.build_payload(logentry)
-        t = time.time()
-
         try:
-            try:
-                resp = requests.post(
-                    webhook.target_url,
-                    json=payload,
-                    allow_redirects=False
-                )
-                WebHookCall.objects.create(
-                    webhook=webhook,
-                    action_type=logentry.action_type,
-                    target_url=webhook.target_url,
-                    is_retry=self.request.retries > 0,
-                    execution_time=time.time() - t,
-                    return_code=resp.status_code,
-                    payload=json.dumps(payload),
-                    response_body=resp.text[:1024 * 1024],
-                    success=200 <= resp.status_code <= 299
-                )
-                if resp.status_code == 410:
-                    webhook.enabled = False
-                    webhook.save()
-                elif resp.status_code > 299:
-                    raise self.retry(countdown=2 ** (self.request.retries * 2))
-            except RequestException as e:
-                WebHookCall.objects.create(
-                    webhook=webhook,
-                    action_type=logentry.action_type,
-                    target_url=webhook.target_url,
-                    is_retry=self.request.retries > 0,
-                    execution_time=time.time() - t,
-                    return_code=0,
-                    payload=json.dumps(payload),
-                    response_body=str(e)[:1024 * 1024]
-                )
+            if deliver_webhooks(webhook, [(logentry_id, action_type)], is_retry=self.request.retries > 0):
                 raise self.retry(countdown=2 ** (self.request.retries * 2))
         except MaxRetriesExceededError:
             pass
@@ -55,7 +55,11 @@ class NamespacedCache:
         )
 
     def get_many(self, keys: List[str]) -> Dict[str, str]:
-        values = self.cache.get_many([self._prefix_key(key) for key in keys])
+        keys = list(keys)
+        if not keys:
+            return {}
+        prefix = self._prefix_key(keys[0]) and self._last_prefix
+        values = self.cache.get_many([self._prefix_key(key, known_prefix=prefix) for key in keys])
         newvalues = {}
         for k, v in values.items():
             newvalues[self._strip_prefix(k)] = v
@@ -63,8 +67,10 @@ class NamespacedCache:
 
     def set_many(self, values: Dict[str, str], timeout=300):
         newvalues = {}
+        prefix = None
         for k, v in values.items():
-            newvalues[self._prefix_key(k)] = v
+            newvalues[self._prefix_key(k, known_prefix=prefix)] = v
+            prefix = self._last_prefix
         return self.cache.set_many(newvalues, timeout)
 
     def delete(self, key: str):  # NOQA
@@ -17,8 +17,9 @@ class BaseExporter:
     This is the base class for all data exporters
     """
 
-    def __init__(self, event):
+    def __init__(self, event, progress_callback=lambda v: None):
         self.event = event
+        self.progress_callback = progress_callback
 
     def __str__(self):
         return self.identifier
@@ -76,6 +77,9 @@ class BaseExporter:
         :param output_file: You can optionally accept a parameter that will be given a file handle to write the
                             output to. In this case, you can return None instead of the file content.
 
+        If rendering takes a while, you can report your progress by calling ``self.progress_callback`` with a
+        percentage between 0 and 100.
+
         Note: If you use a ``ModelChoiceField`` (or a ``ModelMultipleChoiceField``), the
         ``form_data`` will not contain the model instance but only it's primary key (or
         a list of primary keys) for reasons of internal serialization when using background
@@ -2,19 +2,32 @@ from django.conf import settings
 from django.core.management import call_command
 from django.core.management.base import BaseCommand
 
-from ...signals import periodic_task
+from ...services.periodic import get_jobs, schedule_jobs
 
 
 class Command(BaseCommand):
     help = "Run periodic tasks"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', action='store', type=str,
+                            help='Only run the jobs with the given names (comma-separated)')
+        parser.add_argument('--list-tasks', action='store_true', help='List the names of all jobs and exit')
+
     def handle(self, *args, **options):
-        for recv, resp in periodic_task.send_robust(self):
-            if isinstance(resp, Exception):
+        if options['list_tasks']:
+            for name in sorted(get_jobs()):
+                self.stdout.write(name)
+            return
+
+        names = options['tasks'].split(',') if options['tasks'] else None
+        for res in schedule_jobs(names):
+            # Without a task worker, the jobs have already been executed and we can report their errors here
+            if not settings.HAS_CELERY and res.failed():
                 if settings.SENTRY_ENABLED:
                     from sentry_sdk import capture_exception
-                    capture_exception(resp)
+                    capture_exception(res.result)
                 else:
-                    raise resp
+                    raise res.result
 
-        call_command('clearsessions')
+        if not names:
+            call_command('clearsessions')
@@ -1,13 +1,25 @@
+import atexit
+import logging
 import math
+import os
+import threading
+import time
 from collections import defaultdict
 
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import connections
+from django.dispatch import receiver
+from django_scopes import scopes_disabled
 
 if settings.HAS_REDIS:
     import django_redis
     redis = django_redis.get_redis_connection("redis")
 
+logger = logging.getLogger(__name__)
+
 REDIS_KEY = "pretix_metrics"
 _INF = float("inf")
 _MINUS_INF = float("-inf")
@@ -25,6 +37,111 @@ def _float_to_go_string(d):
         return repr(float(d))
 
 
+class MetricsBuffer:
+    """
+    Collects metric updates of this process in memory, so recording a metric does not need a
+    round-trip to Redis. The collected updates are written to Redis in a single pipeline once
+    ``METRICS_FLUSH_INTERVAL`` seconds have passed since the last write, once updates for
+    ``max_keys`` different keys have been collected, or when the process shuts down. A timer
+    makes sure updates are written within that interval even if the process then stays idle.
+    """
+    max_keys = 1000
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.increments = defaultdict(float)
+        self.values = {}
+        self.last_flush = time.monotonic()
+        # Timers do not survive a fork, so we forget about our parent's one
+        self.timer = None
+
+    def _check_fork(self):
+        if os.getpid() != self.pid:
+            # We have been forked. Whatever we collected so far will be written by our parent
+            self._reset()
+
+    def inc(self, key, amount):
+        self._check_fork()
+        with self.lock:
+            if key in self.values:
+                self.values[key] += amount
+            else:
+                self.increments[key] += amount
+        self._flush_if_due()
+
+    def set(self, key, value):
+        self._check_fork()
+        with self.lock:
+            self.increments.pop(key, None)
+            self.values[key] = value
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        if (
+            len(self.increments) + len(self.values) >= self.max_keys
+            or time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+        else:
+            self._schedule_flush()
+
+    def flush_if_due(self):
+        """
+        Writes all collected updates to Redis if ``METRICS_FLUSH_INTERVAL`` seconds have passed since
+        the last write, e.g. at the end of a request.
+        """
+        self._check_fork()
+        if time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def _schedule_flush(self):
+        with self.lock:
+            if self.timer is not None or not (self.increments or self.values):
+                return
+            self.timer = threading.Timer(settings.METRICS_FLUSH_INTERVAL, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """
+        Writes all collected updates to Redis.
+        """
+        self._check_fork()
+        with self.lock:
+            increments, values = self.increments, self.values
+            self.increments = defaultdict(float)
+            self.values = {}
+            self.last_flush = time.monotonic()
+            timer, self.timer = self.timer, None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+
+        if not settings.HAS_REDIS or not (increments or values):
+            return
+        pipe = redis.pipeline()
+        for key, value in values.items():
+            pipe.hset(REDIS_KEY, key, value)
+        for key, amount in increments.items():
+            pipe.hincrbyfloat(REDIS_KEY, key, amount)
+        try:
+            pipe.execute()
+        except Exception:
+            logger.exception('Could not write metrics to Redis')
+
+
+buffer = MetricsBuffer()
+atexit.register(buffer.flush)
+
+
+@receiver(request_finished, dispatch_uid="metrics_request_finished")
+def flush_after_request(sender, **kwargs):
+    buffer.flush_if_due()
+
+
 class Metric(object):
     """
     Base Metrics Object
@@ -70,6 +187,9 @@ class Metric(object):
         Increments given key in Redis.
         """
         if settings.HAS_REDIS:
+            if settings.METRICS_FLUSH_INTERVAL > 0:
+                buffer.inc(key, amount)
+                return
             if not pipeline:
                 pipeline = redis
             pipeline.hincrbyfloat(REDIS_KEY, key, amount)
@@ -79,16 +199,19 @@ class Metric(object):
         Sets given key in Redis.
         """
         if settings.HAS_REDIS:
+            if settings.METRICS_FLUSH_INTERVAL > 0:
+                buffer.set(key, value)
+                return
             if not pipeline:
                 pipeline = redis
             pipeline.hset(REDIS_KEY, key, value)
 
     def _get_redis_pipeline(self):
-        if settings.HAS_REDIS:
+        if settings.HAS_REDIS and settings.METRICS_FLUSH_INTERVAL <= 0:
             return redis.pipeline()
 
     def _execute_redis_pipeline(self, pipeline):
-        if settings.HAS_REDIS:
+        if pipeline is not None:
             return pipeline.execute()
 
 
@@ -203,30 +326,69 @@ class Histogram(Metric):
 
 def metric_values():
     """
-    Produces the the values to be presented to the monitoring system
+    Produces the the values to be presented to the monitoring system as ``(name, labels, value)``
+    tuples. Values are produced while we are still reading them from redis, so the whole set of
+    metrics never needs to be held in memory.
     """
-    metrics = defaultdict(dict)
+    aliases = {
+        'pretix_view_duration_seconds_count': 'pretix_view_requests_total'
+    }
 
     # Metrics from redis
     if settings.HAS_REDIS:
-        for key, value in redis.hscan_iter(REDIS_KEY):
-            dkey = key.decode("utf-8")
-            splitted = dkey.split("{", 2)
+        for key, value in redis.hscan_iter(REDIS_KEY, count=1000):
+            name, brace, labels = key.decode("utf-8").partition("{")
             value = float(value.decode("utf-8"))
-            metrics[splitted[0]]["{" + splitted[1]] = value
-
-    # Aliases
-    aliases = {
-        'pretix_view_requests_total': 'pretix_view_duration_seconds_count'
-    }
-    for a, atarget in aliases.items():
-        metrics[a] = metrics[atarget]
+            yield name, brace + labels, value
+            if name in aliases:
+                yield aliases[name], brace + labels, value
 
     # Throwaway metrics
-    for m in apps.get_models():  # Count all models
-        metrics['pretix_model_instances']['{model="%s"}' % m._meta] = m.objects.count()
+    for model, count in sorted(model_instance_counts().items()):
+        yield 'pretix_model_instances', '{model="%s"}' % model, count
 
-    return metrics
+
+def model_instance_counts():
+    """
+    Returns the approximate number of instances of every model. Counting the rows of large tables
+    is expensive, so we use the table statistics of the database where available, and keep the
+    result in the cache for a few minutes.
+    """
+    return cache.get_or_set('pretix_metrics_model_instances', _count_model_instances, 300)
+
+
+def _count_model_instances():
+    connection = connections[settings.DATABASE_REPLICA]
+    tables = defaultdict(list)
+    for m in apps.get_models():
+        tables[m._meta.db_table].append(str(m._meta))
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class "
+                "WHERE relkind IN ('r', 'p') AND pg_table_is_visible(oid) AND relname = ANY(%s)",
+                [list(tables)]
+            )
+            rows = dict(cursor.fetchall())
+    elif connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name, table_rows FROM information_schema.tables WHERE table_schema = DATABASE()"
+            )
+            rows = dict(cursor.fetchall())
+    else:
+        # No statistics available, but databases like SQLite are only used for small installations anyway
+        with scopes_disabled():
+            rows = {
+                m._meta.db_table: m._base_manager.using(settings.DATABASE_REPLICA).count()
+                for m in apps.get_models()
+            }
+
+    return {
+        model: max(int(rows.get(table) or 0), 0)
+        for table, models in tables.items() for model in models
+    }
 
 
 """
@@ -238,3 +400,33 @@ pretix_task_runs_total = Counter("pretix_task_runs_total", "Total calls to a cel
                                  ["task_name", "status"])
 pretix_task_duration_seconds = Histogram("pretix_task_duration_seconds", "Call time of a celery task",
                                          ["task_name"])
+pretix_quota_counter_drift_total = Counter("pretix_quota_counter_drift_total",
+                                           "Number of stored quota counters found out of sync and repaired",
+                                           ["counter"])
+pretix_lock_wait_seconds = Histogram("pretix_lock_wait_seconds", "Time spent waiting to obtain a booking lock",
+                                     ["lock_type", "status"])
+pretix_lock_hold_seconds = Histogram("pretix_lock_hold_seconds", "Time a booking lock was held",
+                                     ["lock_type"])
+pretix_lock_contentions_total = Counter("pretix_lock_contentions_total",
+                                        "Number of attempts to obtain a booking lock that found it already taken",
+                                        ["lock_type"])
+pretix_webhook_deliveries_total = Counter("pretix_webhook_deliveries_total", "Number of webhook delivery attempts",
+                                          ["webhook", "status"])
+pretix_webhook_delivery_duration_seconds = Histogram("pretix_webhook_delivery_duration_seconds",
+                                                     "Time until a webhook receiver responded",
+                                                     ["webhook"])
+pretix_webhook_backlog = Gauge("pretix_webhook_backlog", "Number of notifications waiting to be sent to a webhook",
+                               ["webhook"])
+pretix_ticket_cache_requests_total = Counter("pretix_ticket_cache_requests_total",
+                                             "Number of ticket files requested, labeled by whether they were cached",
+                                             ["provider", "status"])
+pretix_cleanup_deleted_total = Counter("pretix_cleanup_deleted_total", "Number of objects removed by cleanup jobs",
+                                       ["model"])
+pretix_cleanup_runs_total = Counter("pretix_cleanup_runs_total",
+                                    "Runs of cleanup jobs, labeled by whether they finished within their time budget",
+                                    ["job", "status"])
+pretix_periodic_job_runs_total = Counter("pretix_periodic_job_runs_total", "Runs of periodic jobs", ["job", "status"])
+pretix_periodic_job_duration_seconds = Histogram("pretix_periodic_job_duration_seconds",
+                                                 "Run time of successful periodic jobs", ["job"])
+pretix_periodic_job_lag_seconds = Gauge("pretix_periodic_job_lag_seconds",
+                                        "Time between scheduling a periodic job and its start", ["job"])
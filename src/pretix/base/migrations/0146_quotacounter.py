@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0145_auto_20200210_1038'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('paid_orders', models.PositiveIntegerField(default=0)),
+                ('pending_orders', models.PositiveIntegerField(default=0)),
+                ('waiting_list', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('quota', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='counter', to='pretixbase.Quota')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0146_quotacounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderPositionSearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('token', models.CharField(db_index=True, max_length=190)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Event')),
+                ('position', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='pretixbase.OrderPosition')),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-19 00:40
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def tokenize(*values):
+    # Copy of OrderPositionSearchToken.tokenize at the time of writing, later changes to the model must not
+    # change what this migration does
+    tokens = set()
+    for value in values:
+        for word in (value or '').lower().split():
+            tokens.add(word[:190])
+            if '@' in word:
+                tokens.add(word.split('@', 1)[1][:190])
+    tokens.discard('')
+    return tokens
+
+
+def fwd(app, schema_editor):
+    OrderPosition = app.get_model('pretixbase', 'OrderPosition')
+    OrderPositionSearchToken = app.get_model('pretixbase', 'OrderPositionSearchToken')
+
+    # Every batch is committed on its own, so large installations do not keep one huge transaction open. If the
+    # migration is interrupted, running it again rebuilds the tokens of every batch from scratch.
+    last_pk = 0
+    while True:
+        rows = list(OrderPosition.objects.filter(pk__gt=last_pk).values_list(
+            'pk', 'order__event_id', 'secret', 'attendee_name_cached', 'attendee_email', 'order__code',
+            'order__email', 'order__invoice_address__name_cached',
+        ).order_by('pk')[:BATCH_SIZE])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        with transaction.atomic():
+            OrderPositionSearchToken.objects.filter(position_id__in=[r[0] for r in rows]).delete()
+            OrderPositionSearchToken.objects.bulk_create([
+                OrderPositionSearchToken(position_id=r[0], event_id=r[1], token=t)
+                for r in rows
+                for t in tokenize(*r[2:])
+            ])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('pretixbase', '0147_orderpositionsearchtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(fwd, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.timezone import now
+
+
+def fwd(app, schema_editor):
+    # Marks the rollups of all existing events as outdated, they are built completely by the next run of the
+    # periodic tasks or when their numbers are read for the first time, whichever happens first
+    Event = app.get_model('pretixbase', 'Event')
+    SalesRollupInvalidation = app.get_model('pretixbase', 'SalesRollupInvalidation')
+    SalesRollupInvalidation.objects.bulk_create([
+        SalesRollupInvalidation(event_id=e, marked=now())
+        for e in Event.objects.filter(orders__isnull=False).values_list('pk', flat=True).distinct()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0148_orderpositionsearchtoken_fill'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupInvalidation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('order_id', models.IntegerField(db_index=True, null=True)),
+                ('order_datetime', models.DateTimeField(null=True)),
+                ('marked', models.DateTimeField()),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Event')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('order_date', models.DateField()),
+                ('payment_date', models.DateField(null=True)),
+                ('fee_type', models.CharField(max_length=100, null=True)),
+                ('fee_internal_type', models.CharField(max_length=255, null=True)),
+                ('status', models.CharField(max_length=3)),
+                ('canceled', models.BooleanField(default=False)),
+                ('count', models.PositiveIntegerField()),
+                ('gross', models.DecimalField(decimal_places=2, max_digits=13)),
+                ('net', models.DecimalField(decimal_places=2, max_digits=13)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='pretixbase.Event')),
+                ('item', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Item')),
+                ('subevent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.SubEvent')),
+                ('variation', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.ItemVariation')),
+            ],
+            options={
+                'index_together': {('event', 'order_date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('order_date', models.DateField()),
+                ('payment_date', models.DateField(null=True)),
+                ('status', models.CharField(max_length=3)),
+                ('count', models.PositiveIntegerField()),
+                ('total', models.DecimalField(decimal_places=2, max_digits=13)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_rollups', to='pretixbase.Event')),
+                ('subevent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.SubEvent')),
+            ],
+            options={
+                'index_together': {('event', 'order_date')},
+            },
+        ),
+        migrations.RunPython(fwd, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import Cast
+
+
+def seed_counters(app, schema_editor):
+    Invoice = app.get_model('pretixbase', 'Invoice')
+    InvoiceNumberCounter = app.get_model('pretixbase', 'InvoiceNumberCounter')
+    highest = Invoice.objects.exclude(invoice_no__contains='-').order_by().values('organizer', 'prefix').annotate(
+        max=Max(Cast('invoice_no', models.IntegerField()))
+    )
+    InvoiceNumberCounter.objects.bulk_create([
+        InvoiceNumberCounter(organizer_id=r['organizer'], prefix=r['prefix'], last_number=r['max'] or 0)
+        for r in highest
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0149_salesrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('prefix', models.CharField(max_length=160)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('organizer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_number_counters', to='pretixbase.Organizer')),
+            ],
+            options={
+                'unique_together': {('organizer', 'prefix')},
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0150_invoicenumbercounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubEventSortKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('locale', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=190)),
+                ('subevent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sort_keys', to='pretixbase.SubEvent')),
+            ],
+            options={
+                'unique_together': {('subevent', 'locale')},
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.28 on 2026-10-19 21:05
+
+import json
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, transaction
+from i18nfield.strings import LazyI18nString
+
+
+def normalize(name, locale):
+    # Copy of SubEventSortKey.normalize at the time of writing, later changes to the model must not change what
+    # this migration does
+    if not isinstance(name, LazyI18nString):
+        name = LazyI18nString(name)
+    return unicodedata.normalize('NFKC', name.localize(locale)).casefold()[:190]
+
+
+def fwd(app, schema_editor):
+    Event = app.get_model('pretixbase', 'Event')
+    SubEvent = app.get_model('pretixbase', 'SubEvent')
+    SubEventSortKey = app.get_model('pretixbase', 'SubEventSortKey')
+    Event_SettingsStore = app.get_model('pretixbase', 'Event_SettingsStore')
+    Organizer_SettingsStore = app.get_model('pretixbase', 'Organizer_SettingsStore')
+    GlobalSettingsObject_SettingsStore = app.get_model('pretixbase', 'GlobalSettingsObject_SettingsStore')
+
+    # The languages are looked up the same way the settings of an event are inherited
+    global_locales = GlobalSettingsObject_SettingsStore.objects.filter(key='locales').values_list('value', flat=True)
+    default_locales = json.loads(global_locales[0]) if global_locales else [settings.LANGUAGE_CODE]
+    organizer_locales = {
+        o: json.loads(v) for o, v in Organizer_SettingsStore.objects.filter(key='locales').values_list('object', 'value')
+    }
+    event_locales = {
+        e: json.loads(v) for e, v in Event_SettingsStore.objects.filter(key='locales').values_list('object', 'value')
+    }
+
+    # Every event is committed on its own, so large installations do not keep one huge transaction open. If the
+    # migration is interrupted, running it again only creates the keys that are still missing.
+    for event_id, organizer_id in Event.objects.filter(subevents__isnull=False).distinct().values_list(
+            'pk', 'organizer_id').iterator():
+        locales = event_locales.get(event_id) or organizer_locales.get(organizer_id) or default_locales
+        with transaction.atomic():
+            for locale in locales:
+                missing = SubEvent.objects.filter(event_id=event_id).exclude(sort_keys__locale=locale)
+                SubEventSortKey.objects.bulk_create([
+                    SubEventSortKey(subevent_id=pk, locale=locale, name=normalize(name, locale))
+                    for pk, name in missing.values_list('pk', 'name').iterator()
+                ], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('pretixbase', '0151_subeventsortkey'),
+    ]
+
+    operations = [
+        migrations.RunPython(fwd, migrations.RunPython.noop),
+    ]
@@ -5,10 +5,13 @@ from .checkin import Checkin, CheckinList
 from .devices import Device
 from .event import (
     Event, Event_SettingsStore, EventLock, EventMetaProperty, EventMetaValue,
-    RequiredAction, SubEvent, SubEventMetaValue, generate_invite_token,
+    RequiredAction, SubEvent, SubEventMetaValue, SubEventSortKey,
+    generate_invite_token,
 )
 from .giftcards import GiftCard, GiftCardAcceptance, GiftCardTransaction
-from .invoices import Invoice, InvoiceLine, invoice_filename
+from .invoices import (
+    Invoice, InvoiceLine, InvoiceNumberCounter, invoice_filename,
+)
 from .items import (
     Item, ItemAddOn, ItemBundle, ItemCategory, ItemMetaProperty, ItemMetaValue,
     ItemVariation, Question, QuestionOption, Quota, SubEventItem,
@@ -18,13 +21,15 @@ from .log import LogEntry
 from .notifications import NotificationSetting
 from .orders import (
     AbstractPosition, CachedCombinedTicket, CachedTicket, CartPosition,
-    InvoiceAddress, Order, OrderFee, OrderPayment, OrderPosition, OrderRefund,
-    QuestionAnswer, cachedcombinedticket_name, cachedticket_name,
-    generate_position_secret, generate_secret,
+    InvoiceAddress, Order, OrderFee, OrderPayment, OrderPosition,
+    OrderPositionSearchToken, OrderRefund, QuestionAnswer,
+    cachedcombinedticket_name, cachedticket_name, generate_position_secret,
+    generate_secret,
 )
 from .organizer import (
     Organizer, Organizer_SettingsStore, Team, TeamAPIToken, TeamInvite,
 )
+from .rollups import OrderRollup, SalesRollup, SalesRollupInvalidation
 from .seating import Seat, SeatCategoryMapping, SeatingPlan
 from .tax import TaxRule
 from .vouchers import Voucher
@@ -1,6 +1,7 @@
 import json
 import uuid
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models.constants import LOOKUP_SEP
@@ -55,7 +56,9 @@ class LoggingMixin:
         from .organizer import TeamAPIToken
         from ..notifications import get_all_notification_types
         from ..services.notifications import notify
-        from pretix.api.webhooks import get_all_webhook_events, notify_webhooks
+        from pretix.api.webhooks import (
+            get_subscribed_webhooks, get_webhook_type, notify_webhooks,
+        )
 
         event = None
         if isinstance(self, Event):
@@ -90,25 +93,41 @@ class LoggingMixin:
         elif data:
             raise TypeError("You should only supply dictionaries as log data.")
         if save:
-            logentry.save()
-
             no_types = get_all_notification_types()
-            wh_types = get_all_webhook_events()
 
             no_type = None
-            wh_type = None
             typepath = logentry.action_type
-            while (not no_type or not wh_types) and '.' in typepath:
-                wh_type = wh_type or wh_types.get(typepath + ('.*' if typepath != logentry.action_type else ''))
-                no_type = no_type or no_types.get(typepath + ('.*' if typepath != logentry.action_type else ''))
+            while not no_type and '.' in typepath:
+                no_type = no_types.get(typepath + ('.*' if typepath != logentry.action_type else ''))
                 typepath = typepath.rsplit('.', 1)[0]
 
-            if no_type:
-                notify.apply_async(args=(logentry.pk,))
-            if wh_type:
-                notify_webhooks.apply_async(args=(logentry.pk,))
+            has_webhooks = False
+            if get_webhook_type(logentry.action_type):
+                organizer_id = self._log_organizer_id(event)
+                # Without a shared cache, looking up the subscriptions would cost a query per log entry,
+                # so we leave the decision to the task in that case.
+                has_webhooks = (
+                    not settings.REAL_CACHE_USED or organizer_id is None or
+                    bool(get_subscribed_webhooks(organizer_id, logentry.event_id, logentry.action_type))
+                )
+
+            if not LogEntry._bulk_add(logentry, bool(no_type), has_webhooks):
+                logentry.save()
+                if no_type:
+                    notify.apply_async(args=(logentry.pk,))
+                if has_webhooks:
+                    notify_webhooks.apply_async(args=(logentry.pk,))
         return logentry
 
+    def _log_organizer_id(self, event):
+        from .organizer import Organizer
+
+        if event:
+            return event.organizer_id
+        elif isinstance(self, Organizer):
+            return self.pk
+        return getattr(self, 'organizer_id', None)
+
 
 class LoggedModel(models.Model, LoggingMixin):
 
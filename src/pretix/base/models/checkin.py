@@ -1,5 +1,5 @@
 from django.db import models
-from django.db.models import Exists, OuterRef
+from django.db.models import Count, Exists, OuterRef, Q
 from django.utils.timezone import now
 from django.utils.translation import pgettext_lazy, ugettext_lazy as _
 from django_scopes import ScopedManager
@@ -72,9 +72,41 @@ class CheckinList(LoggedModel):
             60
         )
 
+    def checkin_status(self, subevent):
+        """
+        Returns a dictionary mapping ``(item_id, variation_id)`` tuples to ``(position_count, checkin_count)`` tuples
+        for all valid positions of the given subevent on this list. Check-in devices poll this frequently, so it is
+        cached for a few seconds.
+        """
+        from . import OrderPosition, Order
+
+        key = 'checkin_list_{}_status'.format(self.pk)
+        status = self.event.cache.get(key) or {}
+        subevent_id = subevent.pk if subevent else None
+        if subevent_id in status:
+            return status[subevent_id]
+
+        qs = OrderPosition.objects.filter(
+            order__event=self.event,
+            order__status__in=[Order.STATUS_PAID, Order.STATUS_PENDING] if self.include_pending else [Order.STATUS_PAID],
+            subevent=subevent
+        )
+        if not self.all_products:
+            qs = qs.filter(item__in=self.limit_products.values_list('id', flat=True))
+        status[subevent_id] = {
+            (r['item'], r['variation']): (r['positions'], r['checkins'])
+            for r in qs.order_by().values('item', 'variation').annotate(
+                positions=Count('id', distinct=True),
+                checkins=Count('checkins', filter=Q(checkins__list_id=self.pk)),
+            )
+        }
+        self.event.cache.set(key, status, 10)
+        return status[subevent_id]
+
     def touch(self):
         self.event.cache.delete('checkin_list_{}_position_count'.format(self.pk))
         self.event.cache.delete('checkin_list_{}_checkin_count'.format(self.pk))
+        self.event.cache.delete('checkin_list_{}_status'.format(self.pk))
 
     @staticmethod
     def annotate_with_numbers(qs, event):
@@ -1,8 +1,9 @@
+import json
 import string
+import unicodedata
 import uuid
 from collections import OrderedDict
 from datetime import datetime, time, timedelta
-from operator import attrgetter
 from urllib.parse import urljoin
 
 import pytz
@@ -13,13 +14,16 @@ from django.core.mail import get_connection
 from django.core.validators import RegexValidator
 from django.db import models
 from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.signals import post_save
 from django.template.defaultfilters import date as _date
+from django.utils import translation
 from django.utils.crypto import get_random_string
 from django.utils.functional import cached_property
 from django.utils.timezone import make_aware, now
 from django.utils.translation import ugettext_lazy as _
 from django_scopes import ScopedManager, scopes_disabled
 from i18nfield.fields import I18nCharField, I18nTextField
+from i18nfield.strings import LazyI18nString
 
 from pretix.base.models.base import LoggedModel
 from pretix.base.reldate import RelativeDateWrapper
@@ -207,6 +211,28 @@ class EventMixin:
 
         if not hasattr(self, 'active_quotas'):
             raise TypeError("Call this only if you fetched the subevents via Event/SubEvent.annotated()")
+        return self._best_availability_state(
+            Quota.objects.compute_availability(self.active_quotas, allow_cache=True)
+        )
+
+    @staticmethod
+    def fill_best_availability_states(events):
+        """
+        Computes ``best_availability_state`` for a number of events or subevents fetched via
+        Event/SubEvent.annotated() with one batch of quota queries instead of one per event.
+        """
+        from .items import Quota
+
+        events = [e for e in events if 'best_availability_state' not in e.__dict__]
+        availabilities = Quota.objects.compute_availability(
+            [q for e in events for q in e.active_quotas], allow_cache=True
+        )
+        for e in events:
+            e.best_availability_state = e._best_availability_state(availabilities)
+
+    def _best_availability_state(self, availabilities):
+        from .items import Quota
+
         items_available = set()
         vars_available = set()
         items_reserved = set()
@@ -214,7 +240,7 @@ class EventMixin:
         items_gone = set()
         vars_gone = set()
         for q in self.active_quotas:
-            res = q.availability(allow_cache=True)
+            res = availabilities[q]
 
             if res[0] == Quota.AVAILABILITY_OK:
                 if q.active_items:
@@ -363,6 +389,13 @@ class Event(EventMixin, LoggedModel):
     def __str__(self):
         return str(self.name)
 
+    def __getstate__(self):
+        # Settings proxies, cache handles and locks belong to this process and can not be pickled
+        return {
+            k: v for k, v in super().__getstate__().items()
+            if not k.startswith('_hierarkey_proxy_') and k not in ('cache', '_lock')
+        }
+
     def set_defaults(self):
         """
         This will be called after event creation, but only if the event was not created by copying an existing one.
@@ -439,10 +472,13 @@ class Event(EventMixin, LoggedModel):
         OrderRefund.objects.filter(order__event=self).delete()
         OrderPayment.objects.filter(order__event=self).delete()
         self.orders.all().delete()
+        self.sales_rollups.all().delete()
+        self.order_rollups.all().delete()
 
     def save(self, *args, **kwargs):
         obj = super().save(*args, **kwargs)
         self.cache.clear()
+        self.organizer.cache.clear()
         return obj
 
     def get_plugins(self):
@@ -477,12 +513,18 @@ class Event(EventMixin, LoggedModel):
 
         return ObjectRelatedCache(self)
 
-    def lock(self):
+    def lock(self, quotas=None, vouchers=None, seats=None):
         """
         Returns a contextmanager that can be used to lock an event for bookings.
+
+        If any of ``quotas``, ``vouchers`` or ``seats`` is given and object locking is enabled
+        in the installation's configuration, only the given objects are locked instead of
+        the whole event. Unlimited quotas are ignored.
         """
         from pretix.base.services import locking
 
+        if settings.PRETIX_OBJECT_LOCKING and (quotas is not None or vouchers is not None or seats is not None):
+            return locking.ObjectLockManager(self, quotas=quotas or (), vouchers=vouchers or (), seats=seats or ())
         return locking.LockManager(self)
 
     def get_mail_backend(self, force_custom=False):
@@ -771,25 +813,29 @@ class Event(EventMixin, LoggedModel):
         return SubEvent.annotated(self.subevents, channel)
 
     def subevents_sorted(self, queryset):
+        """
+        Filters ``queryset`` to the subevents that should be listed on the front page and orders them as configured
+        in the event settings. The result is still a queryset, so it can be paginated in the database and
+        expensive annotations like ``SubEvent.annotated`` only need to be evaluated for the visible subevents.
+        """
         ordering = self.settings.get('frontpage_subevent_ordering', default='date_ascending', as_type=str)
-        orderfields = {
-            'date_ascending': ('date_from', 'name'),
-            'date_descending': ('-date_from', 'name'),
-            'name_ascending': ('name', 'date_from'),
-            'name_descending': ('-name', 'date_from'),
-        }[ordering]
         subevs = queryset.filter(
             Q(active=True) & Q(is_public=True) & (
                 Q(Q(date_to__isnull=True) & Q(date_from__gte=now() - timedelta(hours=24)))
                 | Q(date_to__gte=now() - timedelta(hours=24))
             )
-        )  # order_by doesn't make sense with I18nField
-        for f in reversed(orderfields):
-            if f.startswith('-'):
-                subevs = sorted(subevs, key=attrgetter(f[1:]), reverse=True)
-            else:
-                subevs = sorted(subevs, key=attrgetter(f))
-        return subevs
+        )
+        if ordering in ('date_ascending', 'date_descending'):
+            return subevs.order_by('-date_from' if ordering == 'date_descending' else 'date_from', 'pk')
+
+        # order_by doesn't make sense with I18nField, since all translations are stored as JSON in one column, so
+        # we sort by a normalized copy of the name in the current language that is kept in a separate table.
+        locale = translation.get_language()
+        if locale not in self.settings.locales:
+            locale = self.settings.locale
+        return subevs.filter(sort_keys__locale=locale).order_by(
+            '-sort_keys__name' if ordering == 'name_descending' else 'sort_keys__name', 'date_from', 'pk'
+        )
 
     @property
     def meta_data(self):
@@ -1109,11 +1155,14 @@ class SubEvent(EventMixin, LoggedModel):
         super().delete(*args, **kwargs)
         if self.event:
             self.event.cache.clear()
+            self.event.organizer.cache.clear()
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         if self.event:
             self.event.cache.clear()
+            self.event.organizer.cache.clear()
+        SubEventSortKey.update_for(self)
 
     @staticmethod
     def clean_items(event, items):
@@ -1253,6 +1302,57 @@ class EventMetaValue(LoggedModel):
             self.event.cache.clear()
 
 
+class SubEventSortKey(models.Model):
+    """
+    A normalized version of a sub-event's name in one language, which allows to sort sub-events by name in the
+    database. There is a key for every language of the event. Keys are updated whenever a sub-event is saved and
+    created for all sub-events when the languages of the event change.
+
+    :param subevent: The sub-event this key belongs to
+    :type subevent: SubEvent
+    :param locale: The language code
+    :type locale: str
+    :param name: The normalized name
+    :type name: str
+    """
+    subevent = models.ForeignKey('SubEvent', on_delete=models.CASCADE, related_name='sort_keys')
+    locale = models.CharField(max_length=50)
+    name = models.CharField(max_length=190)
+
+    class Meta:
+        unique_together = ('subevent', 'locale')
+
+    @staticmethod
+    def normalize(name, locale):
+        if not isinstance(name, LazyI18nString):
+            name = LazyI18nString(name)
+        return unicodedata.normalize('NFKC', name.localize(locale)).casefold()[:190]
+
+    @classmethod
+    def update_for(cls, subevent):
+        keys = {k.locale: k for k in subevent.sort_keys.all()}
+        new_keys = []
+        for locale in subevent.event.settings.locales:
+            name = cls.normalize(subevent.name, locale)
+            if locale not in keys:
+                new_keys.append(cls(subevent=subevent, locale=locale, name=name))
+            elif keys[locale].name != name:
+                keys[locale].name = name
+                keys[locale].save(update_fields=['name'])
+        cls.objects.bulk_create(new_keys, ignore_conflicts=True)
+
+    @classmethod
+    def fill_missing(cls, event, locales=None):
+        """
+        Creates the keys of all sub-events of the event in languages that have been added to the event.
+        """
+        for locale in locales or event.settings.locales:
+            missing = event.subevents.exclude(sort_keys__locale=locale).only('pk', 'name')
+            cls.objects.bulk_create([
+                cls(subevent=se, locale=locale, name=cls.normalize(se.name, locale)) for se in missing.iterator()
+            ], batch_size=500, ignore_conflicts=True)
+
+
 class SubEventMetaValue(LoggedModel):
     """
     A meta-data value assigned to a sub-event.
@@ -1282,3 +1382,12 @@ class SubEventMetaValue(LoggedModel):
         super().save(*args, **kwargs)
         if self.subevent:
             self.subevent.event.cache.clear()
+
+
+def _event_settings_saved(sender, instance, **kwargs):
+    if instance.key == 'locales':
+        # The cached settings of the event might not contain the new value yet
+        SubEventSortKey.fill_missing(instance.object, json.loads(instance.value))
+
+
+post_save.connect(_event_settings_saved, sender='pretixbase.Event_SettingsStore')
@@ -2,7 +2,7 @@ import string
 from decimal import Decimal
 
 import pycountry
-from django.db import DatabaseError, models, transaction
+from django.db import DatabaseError, IntegrityError, models, transaction
 from django.db.models import Max
 from django.db.models.functions import Cast
 from django.utils import timezone
@@ -10,7 +10,7 @@ from django.utils.crypto import get_random_string
 from django.utils.functional import cached_property
 from django.utils.translation import pgettext
 from django_countries.fields import CountryField
-from django_scopes import ScopedManager
+from django_scopes import ScopedManager, scopes_disabled
 
 from pretix.base.settings import COUNTRIES_WITH_STATE_IN_ADDRESS
 
@@ -170,16 +170,10 @@ class Invoice(models.Model):
         ]
         return '\n'.join([p.strip() for p in parts if p and p.strip()])
 
-    def _get_numeric_invoice_number(self):
-        numeric_invoices = Invoice.objects.filter(
-            event__organizer=self.event.organizer,
-            prefix=self.prefix,
-        ).exclude(invoice_no__contains='-').annotate(
-            numeric_number=Cast('invoice_no', models.IntegerField())
-        ).aggregate(
-            max=Max('numeric_number')
-        )['max'] or 0
-        return self._to_numeric_invoice_number(numeric_invoices + 1)
+    def _get_numeric_invoice_number(self, resync=False):
+        return self._to_numeric_invoice_number(
+            InvoiceNumberCounter.next_number(self.event.organizer, self.prefix, resync=resync)
+        )
 
     def _get_invoice_number_from_order(self):
         return '{order}-{count}'.format(
@@ -205,12 +199,14 @@ class Invoice(models.Model):
             if self.order.testmode:
                 self.prefix += 'TEST-'
             for i in range(10):
-                if self.event.settings.get('invoice_numbers_consecutive'):
-                    self.invoice_no = self._get_numeric_invoice_number()
-                else:
-                    self.invoice_no = self._get_invoice_number_from_order()
                 try:
                     with transaction.atomic():
+                        if self.event.settings.get('invoice_numbers_consecutive'):
+                            # The number needs to be allocated within the same transaction as the invoice is
+                            # stored in, otherwise a failed save would leave a gap in the numbers.
+                            self.invoice_no = self._get_numeric_invoice_number(resync=i > 0)
+                        else:
+                            self.invoice_no = self._get_invoice_number_from_order()
                         return super().save(*args, **kwargs)
                 except DatabaseError:
                     # Suppress duplicate key errors and try again
@@ -250,6 +246,67 @@ class Invoice(models.Model):
         return '<Invoice {} / {}>'.format(self.full_invoice_no, self.pk)
 
 
+class InvoiceNumberCounter(models.Model):
+    """
+    Stores the last consecutive invoice number that has been handed out for an invoice number prefix of an
+    organizer, so new numbers can be allocated without looking at all existing invoices.
+
+    :param organizer: The organizer the invoices belong to
+    :type organizer: Organizer
+    :param prefix: The invoice number prefix, including a possible ``TEST-`` suffix
+    :type prefix: str
+    :param last_number: The last number that has been used
+    :type last_number: int
+    """
+    organizer = models.ForeignKey('Organizer', related_name='invoice_number_counters', on_delete=models.CASCADE)
+    prefix = models.CharField(max_length=160)
+    last_number = models.PositiveIntegerField(default=0)
+
+    objects = ScopedManager(organizer='organizer')
+
+    class Meta:
+        unique_together = ('organizer', 'prefix')
+
+    @staticmethod
+    def get_highest_number(organizer, prefix):
+        """
+        Returns the highest consecutive invoice number that exists in the database for the given prefix.
+        """
+        return Invoice.objects.filter(
+            organizer=organizer,
+            prefix=prefix,
+        ).exclude(invoice_no__contains='-').annotate(
+            numeric_number=Cast('invoice_no', models.IntegerField())
+        ).aggregate(
+            max=Max('numeric_number')
+        )['max'] or 0
+
+    @classmethod
+    @scopes_disabled()
+    def next_number(cls, organizer, prefix, resync=False):
+        """
+        Returns the next consecutive invoice number for the given prefix. This must be called in the transaction
+        that creates the invoice: the counter row stays locked until the transaction ends, and the number is
+        released again if the transaction is rolled back.
+
+        :param resync: Skip all numbers that are already in use, e.g. after the last number turned out to be taken.
+        """
+        counter = cls.objects.select_for_update().filter(organizer=organizer, prefix=prefix).first()
+        if counter is None:
+            try:
+                with transaction.atomic():
+                    counter = cls.objects.create(organizer=organizer, prefix=prefix,
+                                                 last_number=cls.get_highest_number(organizer, prefix))
+            except IntegrityError:
+                # Another transaction created the counter in the meantime
+                counter = cls.objects.select_for_update().get(organizer=organizer, prefix=prefix)
+        elif resync:
+            counter.last_number = max(counter.last_number, cls.get_highest_number(organizer, prefix))
+        counter.last_number += 1
+        counter.save(update_fields=['last_number'])
+        return counter.last_number
+
+
 class InvoiceLine(models.Model):
     """
     One position listed on an Invoice.
@@ -1,6 +1,6 @@
 import sys
 import uuid
-from collections import Counter, OrderedDict
+from collections import Counter, OrderedDict, defaultdict
 from datetime import date, datetime, time
 from decimal import Decimal, DecimalException
 from typing import Tuple
@@ -10,15 +10,18 @@ import pytz
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
-from django.db.models import F, Func, Q, Sum
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Func, Q, Sum
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.utils import formats
 from django.utils.crypto import get_random_string
 from django.utils.functional import cached_property
 from django.utils.timezone import is_naive, make_aware, now
 from django.utils.translation import pgettext_lazy, ugettext_lazy as _
 from django_countries.fields import Country
-from django_scopes import ScopedManager
+from django_scopes import ScopedManager, scopes_disabled
 from i18nfield.fields import I18nCharField, I18nTextField
 
 from pretix.base.models import fields
@@ -159,15 +162,18 @@ class SubEventItemVariation(models.Model):
             self.subevent.event.cache.clear()
 
 
-def filter_available(qs, channel='web', voucher=None, allow_addons=False):
+def filter_available(qs, channel='web', voucher=None, allow_addons=False, ignore_dates=False):
     q = (
         # IMPORTANT: If this is updated, also update the ItemVariation query
         # in models/event.py: EventMixin.annotated()
         Q(active=True)
-        & Q(Q(available_from__isnull=True) | Q(available_from__lte=now()))
-        & Q(Q(available_until__isnull=True) | Q(available_until__gte=now()))
         & Q(sales_channels__contains=channel) & Q(require_bundling=False)
     )
+    if not ignore_dates:
+        q &= (
+            Q(Q(available_from__isnull=True) | Q(available_from__lte=now()))
+            & Q(Q(available_until__isnull=True) | Q(available_until__gte=now()))
+        )
     if not allow_addons:
         q &= Q(Q(category__isnull=True) | Q(category__is_addon=False))
 
@@ -183,8 +189,8 @@ def filter_available(qs, channel='web', voucher=None, allow_addons=False):
 
 
 class ItemQuerySet(models.QuerySet):
-    def filter_available(self, channel='web', voucher=None, allow_addons=False):
-        return filter_available(self, channel, voucher, allow_addons)
+    def filter_available(self, channel='web', voucher=None, allow_addons=False, ignore_dates=False):
+        return filter_available(self, channel, voucher, allow_addons, ignore_dates)
 
 
 class ItemQuerySetManager(ScopedManager(organizer='event__organizer').__class__):
@@ -192,8 +198,8 @@ class ItemQuerySetManager(ScopedManager(organizer='event__organizer').__class__)
         super().__init__()
         self._queryset_class = ItemQuerySet
 
-    def filter_available(self, channel='web', voucher=None, allow_addons=False):
-        return filter_available(self.get_queryset(), channel, voucher, allow_addons)
+    def filter_available(self, channel='web', voucher=None, allow_addons=False, ignore_dates=False):
+        return filter_available(self.get_queryset(), channel, voucher, allow_addons, ignore_dates)
 
 
 class Item(LoggedModel):
@@ -1218,6 +1224,328 @@ class QuestionOption(models.Model):
         ordering = ('position', 'id')
 
 
+class QuotaManager(ScopedManager(organizer='event__organizer').__class__):
+
+    def compute_availability(self, quotas, now_dt: datetime=None, count_waitinglist=True, allow_cache=False,
+                             _cache=None) -> dict:
+        """
+        Computes the availability of a number of quotas at once. In contrast to calling
+        :py:meth:`Quota.availability` on every quota, this will use a constant number of
+        grouped database queries regardless of the number of quotas passed.
+
+        The results are passed through the ``quota_availability`` signal and written to
+        the long-term cache of the quotas, exactly like :py:meth:`Quota.availability` would
+        do it.
+
+        :param quotas: An iterable of :py:class:`Quota` objects
+        :param count_waitinglist: Whether or not take waiting list reservations into account. Defaults
+                                  to ``True``.
+        :param allow_cache: Allow for values to be returned from the longer-term cache, see also
+                            the documentation of the :py:class:`Quota` model class.
+        :param _cache: A dictionary mapping quota IDs to availabilities in the format used by
+                       :py:meth:`Quota.availability`. Quotas already contained in the dictionary
+                       will not be computed again, all other results will be added to it.
+        :returns: a dictionary mapping every given quota to a tuple of one of the
+                  ``Quota.AVAILABILITY_`` constants and the number of available tickets.
+        """
+        now_dt = now_dt or now()
+        if _cache and count_waitinglist is not _cache.get('_count_waitinglist', True):
+            _cache.clear()
+
+        results = {}
+        todo = []
+        for q in set(quotas):
+            if allow_cache and count_waitinglist and q.cache_is_hot():
+                results[q] = q.cached_availability_state, q.cached_availability_number
+            elif _cache is not None and q.pk in _cache:
+                results[q] = _cache[q.pk]
+            else:
+                todo.append(q)
+
+        # Quotas of the same event share one event object, so it is only loaded once
+        events = {}
+        for q in todo:
+            if q.event_id in events:
+                q.event = events[q.event_id]
+            else:
+                events[q.event_id] = q.event
+
+        rewrite = []
+        for q, res in self._compute_raw(todo, now_dt, count_waitinglist).items():
+            results[q], rewrite_cache = q._prepare_availability(res, now_dt, count_waitinglist)
+            if rewrite_cache:
+                rewrite.append(q)
+            if _cache is not None:
+                _cache[q.pk] = results[q]
+                _cache['_count_waitinglist'] = count_waitinglist
+
+        # Write the long-term cache of all quotas with one query instead of saving them one by one
+        if rewrite:
+            with scopes_disabled():
+                self.using('default').bulk_update(rewrite, Quota.CACHED_AVAILABILITY_FIELDS)
+        for event in events.values():
+            event.cache.delete('item_quota_cache')
+        return results
+
+    def _compute_raw(self, quotas, now_dt, count_waitinglist):
+        results = {}
+        for q in quotas:
+            if q.closed:
+                results[q] = Quota.AVAILABILITY_ORDERED, 0
+            elif q.size is None:
+                results[q] = Quota.AVAILABILITY_OK, None
+
+        # Quotas without a size limit still need to know their number of paid orders for the cache
+        counts = self.get_counts(quotas, now_dt, count_waitinglist)
+        for q, c in counts.items():
+            q.cached_availability_paid_orders = c['paid_orders']
+            if q not in results:
+                results[q] = q._availability_from_counts(
+                    paid_orders=c['paid_orders'],
+                    pending_orders=c['pending_orders'],
+                    blocking_vouchers=c['blocking_vouchers'],
+                    waiting_list=c['waiting_list'] if count_waitinglist else 0,
+                    in_cart=c['in_cart'],
+                )
+        return results
+
+    def get_counts(self, quotas, now_dt: datetime=None, count_waitinglist=True) -> dict:
+        """
+        Returns the usage numbers of the given quotas as a dictionary mapping every quota to
+        a dictionary with the keys ``paid_orders``, ``pending_orders``, ``blocking_vouchers``,
+        ``waiting_list`` and ``in_cart``.
+
+        If quota counters are enabled in the installation's configuration, the numbers of orders
+        and waiting list entries are taken from the stored counters, which are created on first use.
+        """
+        now_dt = now_dt or now()
+        quotas = list(quotas)
+        if not settings.PRETIX_QUOTA_COUNTERS or not quotas:
+            return self._compute_counts(quotas, now_dt, count_waitinglist)
+
+        stored = {
+            c.quota_id: c for c in QuotaCounter.objects.filter(quota__in=quotas)
+        }
+        missing = [q for q in quotas if q.pk not in stored]
+        if missing:
+            stored.update(self._create_counters(missing)[0])
+        counts = self._compute_counts(quotas, now_dt, count_waitinglist, fields=QuotaCounter.LIVE_FIELDS)
+        for q in quotas:
+            counts[q].update(stored[q.pk].counts)
+        return counts
+
+    def for_positions(self, positions):
+        """
+        Returns a queryset of all quotas that might count the given cart or order positions.
+        """
+        lookup = Q()
+        for p in positions:
+            if p.variation_id:
+                lookup |= Q(variations__id=p.variation_id, subevent_id=p.subevent_id)
+            else:
+                lookup |= Q(items__id=p.item_id, subevent_id=p.subevent_id)
+        if not lookup:
+            return self.none()
+        return self.filter(lookup).distinct()
+
+    def update_counters(self, positions, **deltas):
+        """
+        Adds the given numbers to the stored counters of all quotas counting one of the given cart
+        positions, order positions or waiting list entries, once for every position. This needs to be
+        called right after every change that makes positions count or stop counting, e.g.::
+
+            Quota.objects.update_counters(order.positions.all(), pending_orders=-1, paid_orders=1)
+
+        Does nothing if quota counters are not enabled in the installation's configuration.
+        """
+        if not settings.PRETIX_QUOTA_COUNTERS:
+            return
+        with scopes_disabled():
+            positions = list(positions)
+            matching_quotas = self._position_matcher(self.for_positions(positions))[0]
+            quota_deltas = defaultdict(Counter)
+            for p in positions:
+                for q in matching_quotas({'item_id': p.item_id, 'variation_id': p.variation_id,
+                                          'subevent_id': p.subevent_id}):
+                    quota_deltas[q].update(deltas)
+            self.apply_counter_deltas(quota_deltas)
+
+    def apply_counter_deltas(self, deltas):
+        """
+        Adds numbers to the stored counters of quotas. ``deltas`` maps quotas to dictionaries mapping
+        counter fields to the number that should be added.
+
+        The counters are locked until the end of the current transaction. Counters that do not exist yet
+        are created from a fresh count instead, which already includes the changes of the current transaction.
+        Does nothing if quota counters are not enabled in the installation's configuration.
+        """
+        if not settings.PRETIX_QUOTA_COUNTERS:
+            return
+        deltas = {q: {k: v for k, v in d.items() if v} for q, d in deltas.items()}
+        deltas = {q: d for q, d in deltas.items() if d}
+        if not deltas:
+            return
+        with transaction.atomic(), scopes_disabled():
+            existing = set(
+                QuotaCounter.objects.select_for_update().filter(
+                    quota__in=deltas.keys()
+                ).order_by('quota_id').values_list('quota_id', flat=True)
+            )
+            created = set()
+            missing = [q for q in deltas if q.pk not in existing]
+            if missing:
+                created = self._create_counters(missing)[1]
+            for q, d in sorted(deltas.items(), key=lambda i: i[0].pk):
+                if q.pk in created:
+                    continue
+                QuotaCounter.objects.filter(quota_id=q.pk).update(
+                    **{k: Greatest(0, F(k) + v) for k, v in d.items()}
+                )
+
+    def reset_counters(self, quotas):
+        """
+        Deletes the stored counters of the given quotas, e.g. because the products or the date they count
+        have changed. The counters are created again from a fresh count when they are next needed.
+        """
+        with scopes_disabled():
+            QuotaCounter.objects.filter(quota__in=quotas).delete()
+
+    def _create_counters(self, quotas):
+        """
+        Creates the counters of the given quotas from a fresh count. Returns a dictionary mapping the
+        IDs of all given quotas to their counters and the set of IDs for which the counters have actually
+        been created here and not concurrently by somebody else.
+        """
+        counts = self._compute_counts(quotas, now(), True, fields=QuotaCounter.FIELDS)
+        counters = {}
+        for q, c in counts.items():
+            try:
+                with transaction.atomic():
+                    counters[q.pk] = QuotaCounter.objects.create(quota=q, **c)
+            except IntegrityError:
+                pass
+        created = set(counters)
+        if len(counters) < len(counts):
+            counters.update({
+                c.quota_id: c for c in QuotaCounter.objects.filter(quota__in=[q for q in counts if q.pk not in created])
+            })
+        return counters, created
+
+    def _position_matcher(self, quotas):
+        """
+        Returns a function mapping a dictionary with the keys ``item_id``, ``variation_id`` and
+        ``subevent_id`` to the set of the given quotas that count it, as well as the IDs of all items and
+        variations contained in the given quotas.
+        """
+        quota_ids = {q.pk: q for q in quotas}
+        quotas_by_item = defaultdict(set)
+        quotas_by_variation = defaultdict(set)
+        for quota_id, item_id in Quota.items.through.objects.filter(
+                quota_id__in=quota_ids
+        ).values_list('quota_id', 'item_id'):
+            quotas_by_item[item_id].add(quota_ids[quota_id])
+        for quota_id, var_id in Quota.variations.through.objects.filter(
+                quota_id__in=quota_ids
+        ).values_list('quota_id', 'itemvariation_id'):
+            quotas_by_variation[var_id].add(quota_ids[quota_id])
+
+        def matching_quotas(row):
+            if row['variation_id']:
+                candidates = quotas_by_variation[row['variation_id']]
+            else:
+                candidates = quotas_by_item[row['item_id']]
+            return {q for q in candidates if q.subevent_id == row['subevent_id']}
+
+        return matching_quotas, quotas_by_item.keys(), quotas_by_variation.keys()
+
+    def _compute_counts(self, quotas, now_dt, count_waitinglist, fields=None):
+        from pretix.base.models import (
+            CartPosition, Order, OrderPosition, Voucher, WaitingListEntry,
+        )
+
+        counted = list(quotas)
+        if not counted:
+            return {}
+        fields = fields or QuotaCounter.FIELDS + QuotaCounter.LIVE_FIELDS
+
+        quota_ids = {q.pk: q for q in counted}
+        event_ids = {q.event_id for q in counted}
+        matching_quotas, item_ids, variation_ids = self._position_matcher(counted)
+
+        position_lookup = (
+            Q(variation__isnull=True, item_id__in=item_ids) |
+            Q(variation_id__in=variation_ids)
+        )
+        subevent_ids = {q.subevent_id for q in counted}
+        subevent_lookup = Q(subevent_id__in=[s for s in subevent_ids if s])
+        if None in subevent_ids:
+            subevent_lookup |= Q(subevent__isnull=True)
+
+        counts = {
+            q: {k: 0 for k in fields}
+            for q in counted
+        }
+
+        if 'paid_orders' in fields:
+            op_counts = OrderPosition.objects.filter(
+                position_lookup, subevent_lookup,
+                order__status__in=[Order.STATUS_PAID, Order.STATUS_PENDING], order__event_id__in=event_ids,
+            ).order_by().values('item_id', 'variation_id', 'subevent_id').annotate(
+                paid=Count('id', filter=Q(order__status=Order.STATUS_PAID)),
+                pending=Count('id', filter=Q(order__status=Order.STATUS_PENDING)),
+            )
+            for row in op_counts:
+                for q in matching_quotas(row):
+                    counts[q]['paid_orders'] += row['paid']
+                    counts[q]['pending_orders'] += row['pending']
+
+        limited = [q for q in counted if q.size is not None and not q.closed]
+        if not limited and not settings.PRETIX_QUOTA_COUNTERS:
+            return counts
+
+        if 'blocking_vouchers' in fields:
+            if 'sqlite3' in settings.DATABASES['default']['ENGINE']:
+                func = 'MAX'
+            else:  # NOQA
+                func = 'GREATEST'
+            voucher_sums = Voucher.objects.filter(
+                Q(position_lookup | Q(quota_id__in=quota_ids)) & subevent_lookup &
+                Q(event_id__in=event_ids) & Q(block_quota=True) &
+                Q(Q(valid_until__isnull=True) | Q(valid_until__gte=now_dt))
+            ).order_by().values('quota_id', 'item_id', 'variation_id', 'subevent_id').annotate(
+                free=Sum(Func(F('max_usages') - F('redeemed'), 0, function=func)),
+            )
+            for row in voucher_sums:
+                matches = matching_quotas(row) if row['item_id'] else set()
+                if row['quota_id'] in quota_ids and quota_ids[row['quota_id']].subevent_id == row['subevent_id']:
+                    matches.add(quota_ids[row['quota_id']])
+                for q in matches:
+                    counts[q]['blocking_vouchers'] += row['free'] or 0
+
+        if count_waitinglist and 'waiting_list' in fields:
+            wl_counts = WaitingListEntry.objects.filter(
+                position_lookup, subevent_lookup, voucher__isnull=True, event_id__in=event_ids,
+            ).order_by().values('item_id', 'variation_id', 'subevent_id').annotate(c=Count('id'))
+            for row in wl_counts:
+                for q in matching_quotas(row):
+                    counts[q]['waiting_list'] += row['c']
+
+        if 'in_cart' in fields:
+            cart_counts = CartPosition.objects.filter(
+                Q(event_id__in=event_ids) & subevent_lookup & position_lookup &
+                Q(expires__gte=now_dt) &
+                Q(
+                    Q(voucher__isnull=True)
+                    | Q(voucher__block_quota=False)
+                    | Q(voucher__valid_until__lt=now_dt)
+                )
+            ).order_by().values('item_id', 'variation_id', 'subevent_id').annotate(c=Count('id'))
+            for row in cart_counts:
+                for q in matching_quotas(row):
+                    counts[q]['in_cart'] += row['c']
+        return counts
+
+
 class Quota(LoggedModel):
     """
     A quota is a "pool of tickets". It is there to limit the number of items
@@ -1281,6 +1609,11 @@ class Quota(LoggedModel):
     AVAILABILITY_RESERVED = 20
     AVAILABILITY_OK = 100
 
+    CACHED_AVAILABILITY_FIELDS = [
+        'cached_availability_state', 'cached_availability_number', 'cached_availability_time',
+        'cached_availability_paid_orders'
+    ]
+
     event = models.ForeignKey(
         Event,
         on_delete=models.CASCADE,
@@ -1329,7 +1662,7 @@ class Quota(LoggedModel):
     )
     closed = models.BooleanField(default=False)
 
-    objects = ScopedManager(organizer='event__organizer')
+    objects = QuotaManager()
 
     class Meta:
         verbose_name = _("Quota")
@@ -1345,9 +1678,20 @@ class Quota(LoggedModel):
         if self.event:
             self.event.cache.clear()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._subevent_id_in_db = instance.__dict__.get('subevent_id')
+        return instance
+
     def save(self, *args, **kwargs):
         clear_cache = kwargs.pop('clear_cache', True)
-        super().save(*args, **kwargs)
+        subevent_changed = self.pk and getattr(self, '_subevent_id_in_db', self.subevent_id) != self.subevent_id
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if subevent_changed:
+                Quota.objects.reset_counters([self])
+        self._subevent_id_in_db = self.subevent_id
         if self.event and clear_cache:
             self.event.cache.clear()
 
@@ -1390,6 +1734,26 @@ class Quota(LoggedModel):
             return _cache[self.pk]
         now_dt = now_dt or now()
         res = self._availability(now_dt, count_waitinglist)
+        res = self._process_availability(res, now_dt, count_waitinglist, count_paid=self.size is None)
+
+        if _cache is not None:
+            _cache[self.pk] = res
+            _cache['_count_waitinglist'] = count_waitinglist
+        return res
+
+    def _process_availability(self, res, now_dt, count_waitinglist, count_paid=False):
+        res, rewrite_cache = self._prepare_availability(res, now_dt, count_waitinglist, count_paid)
+        self.event.cache.delete('item_quota_cache')
+        if rewrite_cache:
+            self.save(update_fields=self.CACHED_AVAILABILITY_FIELDS, clear_cache=False, using='default')
+        return res
+
+    def _prepare_availability(self, res, now_dt, count_waitinglist, count_paid=False):
+        """
+        Passes a freshly computed availability through the ``quota_availability`` signal, closes the quota
+        if necessary and updates the long-term cache fields in memory. Returns the availability and whether
+        the cache fields need to be written to the database.
+        """
         for recv, resp in quota_availability.send(sender=self.event, quota=self, result=res,
                                                   count_waitinglist=count_waitinglist):
             res = resp
@@ -1399,7 +1763,6 @@ class Quota(LoggedModel):
             self.save(update_fields=['closed'])
             self.log_action('pretix.event.quota.closed')
 
-        self.event.cache.delete('item_quota_cache')
         rewrite_cache = count_waitinglist and (
             not self.cache_is_hot(now_dt) or res[0] > self.cached_availability_state
         )
@@ -1407,21 +1770,9 @@ class Quota(LoggedModel):
             self.cached_availability_state = res[0]
             self.cached_availability_number = res[1]
             self.cached_availability_time = now_dt
-            if self.size is None:
+            if count_paid:
                 self.cached_availability_paid_orders = self.count_paid_orders()
-            self.save(
-                update_fields=[
-                    'cached_availability_state', 'cached_availability_number', 'cached_availability_time',
-                    'cached_availability_paid_orders'
-                ],
-                clear_cache=False,
-                using='default'
-            )
-
-        if _cache is not None:
-            _cache[self.pk] = res
-            _cache['_count_waitinglist'] = count_waitinglist
-        return res
+        return res, rewrite_cache
 
     def _availability(self, now_dt: datetime=None, count_waitinglist=True, ignore_closed=False):
         now_dt = now_dt or now()
@@ -1432,6 +1783,13 @@ class Quota(LoggedModel):
         if size_left is None:
             return Quota.AVAILABILITY_OK, None
 
+        if settings.PRETIX_QUOTA_COUNTERS:
+            counts = Quota.objects.get_counts([self], now_dt)[self]
+            self.cached_availability_paid_orders = counts['paid_orders']
+            if not count_waitinglist:
+                counts['waiting_list'] = 0
+            return self._availability_from_counts(**counts)
+
         paid_orders = self.count_paid_orders()
         self.cached_availability_paid_orders = paid_orders
         size_left -= paid_orders
@@ -1457,6 +1815,21 @@ class Quota(LoggedModel):
 
         return Quota.AVAILABILITY_OK, size_left
 
+    def _availability_from_counts(self, paid_orders, pending_orders, blocking_vouchers, waiting_list, in_cart):
+        size_left = self.size - paid_orders
+        if size_left <= 0:
+            return Quota.AVAILABILITY_GONE, 0
+
+        size_left -= pending_orders + blocking_vouchers + waiting_list
+        if size_left <= 0:
+            return Quota.AVAILABILITY_ORDERED, 0
+
+        size_left -= in_cart
+        if size_left <= 0:
+            return Quota.AVAILABILITY_RESERVED, 0
+
+        return Quota.AVAILABILITY_OK, size_left
+
     def count_blocking_vouchers(self, now_dt: datetime=None) -> int:
         from pretix.base.models import Voucher
 
@@ -1554,6 +1927,36 @@ class Quota(LoggedModel):
                 raise ValidationError(_('The subevent does not belong to this event.'))
 
 
+class QuotaCounter(models.Model):
+    """
+    Stores the number of paid and pending order positions and waiting list entries counted by a quota.
+    These counters are only used if ``quota_counters`` is enabled in the installation's configuration.
+
+    A counter is created from a full count when it is first needed. Afterwards, every change only adds
+    its difference to the locked counter row, see ``QuotaManager.update_counters``. Cart positions and
+    blocking vouchers stop counting at some point in time without any change to the database, so they are
+    not stored but counted whenever the availability is calculated.
+    """
+    quota = models.OneToOneField(
+        Quota,
+        on_delete=models.CASCADE,
+        related_name='counter',
+    )
+    paid_orders = models.PositiveIntegerField(default=0)
+    pending_orders = models.PositiveIntegerField(default=0)
+    waiting_list = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = ScopedManager(organizer='quota__event__organizer')
+
+    FIELDS = ('paid_orders', 'pending_orders', 'waiting_list')
+    LIVE_FIELDS = ('blocking_vouchers', 'in_cart')
+
+    @property
+    def counts(self) -> dict:
+        return {k: getattr(self, k) for k in self.FIELDS}
+
+
 class ItemMetaProperty(LoggedModel):
     """
     An event can have ItemMetaProperty objects attached to define meta information fields
@@ -1606,3 +2009,30 @@ class ItemMetaValue(LoggedModel):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+
+
+@receiver(post_save, sender=ItemBundle)
+@receiver(post_delete, sender=ItemBundle)
+@receiver(post_save, sender=ItemAddOn)
+@receiver(post_delete, sender=ItemAddOn)
+def itemrelation_changed(sender, instance, **kwargs):
+    instance.base_item.event.cache.clear()
+
+
+@receiver(m2m_changed, sender=Quota.items.through)
+@receiver(m2m_changed, sender=Quota.variations.through)
+def quota_products_changed(sender, instance, action, pk_set, **kwargs):
+    # The stored counters do not include positions of products that have just been added
+    # and still include those of products that have just been removed.
+    if isinstance(instance, Quota):
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Quota.objects.reset_counters([instance])
+    elif action == 'pre_clear':
+        with scopes_disabled():
+            Quota.objects.reset_counters(list(instance.quotas.all()))
+    elif action in ('post_add', 'post_remove'):
+        Quota.objects.reset_counters(pk_set)
+
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        event = instance.item.event if isinstance(instance, ItemVariation) else instance.event
+        event.cache.clear()
@@ -1,8 +1,10 @@
 import json
+import threading
+from contextlib import contextmanager
 
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import connection, models
 from django.urls import reverse
 from django.utils.functional import cached_property
 from django.utils.html import escape
@@ -10,6 +12,8 @@ from django.utils.translation import pgettext_lazy, ugettext_lazy as _
 
 from pretix.base.signals import logentry_object_link
 
+_bulk = threading.local()
+
 
 class VisibleOnlyManager(models.Manager):
     def get_queryset(self):
@@ -185,3 +189,85 @@ class LogEntry(models.Model):
 
     def delete(self, using=None, keep_parents=False):
         raise TypeError("Logs cannot be deleted.")
+
+    @classmethod
+    @contextmanager
+    def bulk_log(cls, batch_size=500):
+        """
+        Context manager that collects all log entries created through ``log_action()`` within its block
+        instead of saving them one by one. They are written with ``bulk_create`` whenever ``batch_size``
+        entries are pending, when ``flush_bulk_log()`` is called and when the block is left successfully.
+        Entries that have not been written yet when the block is left with an exception are discarded.
+        Notifications and webhooks for all written entries are dispatched through a single task each
+        when the block is left.
+
+        Log entries returned by ``log_action()`` inside the block might not have a primary key yet. Nested
+        blocks are merged into the outermost one::
+
+            with LogEntry.bulk_log():
+                for order in orders:
+                    order.log_action('pretix.event.order.expired')
+        """
+        if getattr(_bulk, 'entries', None) is not None:
+            yield
+            return
+
+        _bulk.entries = []
+        _bulk.notify_ids = []
+        _bulk.webhook_ids = []
+        _bulk.batch_size = batch_size
+        try:
+            yield
+            cls.flush_bulk_log()
+        finally:
+            notify_ids, webhook_ids = _bulk.notify_ids, _bulk.webhook_ids
+            _bulk.entries = _bulk.notify_ids = _bulk.webhook_ids = None
+            cls._bulk_dispatch(notify_ids, webhook_ids)
+
+    @classmethod
+    def flush_bulk_log(cls):
+        """
+        Writes all log entries collected by the active ``bulk_log()`` block right away, e.g. to store them
+        in the same transaction as the change they describe. Does nothing outside of such a block.
+        """
+        entries = getattr(_bulk, 'entries', None)
+        if entries:
+            cls._bulk_save(entries)
+            entries.clear()
+
+    @classmethod
+    def _bulk_add(cls, logentry, notify, webhooks):
+        """
+        Queues a log entry if ``bulk_log()`` is active and returns whether it did so.
+        """
+        entries = getattr(_bulk, 'entries', None)
+        if entries is None:
+            return False
+        entries.append((logentry, notify, webhooks))
+        if len(entries) >= _bulk.batch_size:
+            cls.flush_bulk_log()
+        return True
+
+    @classmethod
+    def _bulk_save(cls, entries):
+        if connection.features.can_return_ids_from_bulk_insert:
+            cls.all.bulk_create([le for le, n, w in entries])
+        else:
+            # We need primary keys for everything we pass on to the notification tasks
+            cls.all.bulk_create([le for le, n, w in entries if not n and not w])
+            for le, n, w in entries:
+                if n or w:
+                    le.save()
+
+        _bulk.notify_ids += [le.pk for le, n, w in entries if n]
+        _bulk.webhook_ids += [le.pk for le, n, w in entries if w]
+
+    @classmethod
+    def _bulk_dispatch(cls, notify_ids, webhook_ids):
+        from ..services.notifications import notify_bulk
+        from pretix.api.webhooks import notify_webhooks_bulk
+
+        if notify_ids:
+            notify_bulk.apply_async(args=(notify_ids,))
+        if webhook_ids:
+            notify_webhooks_bulk.apply_async(args=(webhook_ids,))
@@ -4,6 +4,7 @@ import json
 import logging
 import os
 import string
+from collections import Counter
 from datetime import datetime, time, timedelta
 from decimal import Decimal
 from typing import Any, Dict, List, Union
@@ -46,6 +47,7 @@ from pretix.base.signals import order_gracefully_delete
 from .base import LockModel, LoggedModel
 from .event import Event, SubEvent
 from .items import Item, ItemVariation, Question, QuestionOption, Quota
+from .rollups import SalesRollupInvalidation
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +61,57 @@ def generate_position_secret():
     return get_random_string(length=settings.ENTROPY['ticket_secret'], allowed_chars='abcdefghjkmnpqrstuvwxyz23456789')
 
 
+def _remember_values(instance, fields, attr, update_fields=None):
+    # Deferred fields are not loaded just for this
+    values = {}
+    for f in fields:
+        attname = instance._meta.get_field(f).attname
+        if attname in instance.__dict__ and (update_fields is None or f in update_fields):
+            values[f] = instance.__dict__[attname]
+    if update_fields is None or getattr(instance, attr, None) is None:
+        setattr(instance, attr, values)
+    else:
+        getattr(instance, attr).update(values)
+
+
+def _values_changed(instance, fields, attr, update_fields=None):
+    in_db = getattr(instance, attr)
+    for f in fields:
+        attname = instance._meta.get_field(f).attname
+        if attname in instance.__dict__ and (update_fields is None or f in update_fields):
+            if f not in in_db or instance.__dict__[attname] != in_db[f]:
+                return True
+    return False
+
+
+def _remember_search_values(instance, update_fields=None):
+    _remember_values(instance, instance.SEARCH_FIELDS, '_search_in_db', update_fields)
+
+
+def _search_values_changed(instance, update_fields=None):
+    """
+    Returns whether saving the instance changes one of the fields its search tokens are built from.
+    """
+    if getattr(instance, '_search_in_db', None) is None:
+        # New instance
+        return any(getattr(instance, f) for f in instance.SEARCH_FIELDS)
+    return _values_changed(instance, instance.SEARCH_FIELDS, '_search_in_db', update_fields)
+
+
+def _remember_rollup_values(instance, update_fields=None):
+    _remember_values(instance, instance.ROLLUP_FIELDS, '_rollup_in_db', update_fields)
+
+
+def _rollup_values_changed(instance, update_fields=None):
+    """
+    Returns whether saving the instance changes one of the fields the sales rollups are built from.
+    """
+    if getattr(instance, '_rollup_in_db', None) is None:
+        # New instance
+        return True
+    return _values_changed(instance, instance.ROLLUP_FIELDS, '_rollup_in_db', update_fields)
+
+
 class Order(LockModel, LoggedModel):
     """
     An order is created when a user clicks 'buy' on his cart. It holds
@@ -120,6 +173,10 @@ class Order(LockModel, LoggedModel):
         (STATUS_EXPIRED, _("expired")),
         (STATUS_CANCELED, _("canceled")),
     )
+    QUOTA_COUNTER_FIELDS = {
+        STATUS_PAID: 'paid_orders',
+        STATUS_PENDING: 'pending_orders',
+    }
 
     code = models.CharField(
         max_length=16,
@@ -195,6 +252,9 @@ class Order(LockModel, LoggedModel):
 
     objects = ScopedManager(organizer='event__organizer')
 
+    SEARCH_FIELDS = ('code', 'email')
+    ROLLUP_FIELDS = ('datetime', 'status', 'total')
+
     class Meta:
         verbose_name = _("Order")
         verbose_name_plural = _("Orders")
@@ -226,13 +286,16 @@ class Order(LockModel, LoggedModel):
         GiftCardTransaction.objects.filter(refund__in=self.refunds.all()).update(refund=None)
         GiftCardTransaction.objects.filter(order=self).update(order=None)
         GiftCard.objects.filter(issued_in__in=self.positions.all()).update(issued_in=None)
+        positions = list(self.positions.all())
         OrderPosition.all.filter(order=self, addon_to__isnull=False).delete()
         OrderPosition.all.filter(order=self).delete()
         OrderFee.all.filter(order=self).delete()
         self.refunds.all().delete()
         self.payments.all().delete()
         self.event.cache.delete('complain_testmode_orders')
+        SalesRollupInvalidation.mark(self)
         self.delete()
+        self._update_quota_counters(positions, removed_status=self.status)
 
     def email_confirm_hash(self):
         return hashlib.sha256(settings.SECRET_KEY.encode() + self.secret.encode()).hexdigest()[:9]
@@ -370,6 +433,22 @@ class Order(LockModel, LoggedModel):
     def changable(self):
         return self.status in (Order.STATUS_PAID, Order.STATUS_PENDING)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._status_in_db = instance.__dict__.get('status')
+        _remember_search_values(instance)
+        _remember_rollup_values(instance)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        # The values from_db remembered are outdated now, too
+        if fields is None or 'status' in fields:
+            self._status_in_db = self.__dict__.get('status')
+        _remember_search_values(self, fields)
+        _remember_rollup_values(self, fields)
+
     def save(self, **kwargs):
         if 'update_fields' in kwargs and 'last_modified' not in kwargs['update_fields']:
             kwargs['update_fields'] = list(kwargs['update_fields']) + ['last_modified']
@@ -379,11 +458,40 @@ class Order(LockModel, LoggedModel):
             self.datetime = now()
         if not self.expires:
             self.set_expires()
+        status_in_db = getattr(self, '_status_in_db', self.status)
+        status_changed = status_in_db != self.status
+        search_changed = not self._state.adding and _search_values_changed(self, kwargs.get('update_fields'))
+        rollup_changed = _rollup_values_changed(self, kwargs.get('update_fields'))
         super().save(**kwargs)
+        self._status_in_db = self.status
+        _remember_search_values(self, kwargs.get('update_fields'))
+        _remember_rollup_values(self, kwargs.get('update_fields'))
+        if status_changed:
+            with scopes_disabled():
+                self._update_quota_counters(self.positions.all(), removed_status=status_in_db,
+                                            added_status=self.status)
+        if search_changed:
+            OrderPositionSearchToken.index_order(self.pk)
+        if rollup_changed:
+            SalesRollupInvalidation.mark(self)
 
     def touch(self):
         self.save(update_fields=['last_modified'])
 
+    def _update_quota_counters(self, positions, removed_status=None, added_status=None):
+        """
+        Updates the stored quota counters after the given positions of this order stopped counting
+        with status ``removed_status`` and/or started counting with status ``added_status``.
+        """
+        deltas = Counter()
+        if removed_status in self.QUOTA_COUNTER_FIELDS:
+            deltas[self.QUOTA_COUNTER_FIELDS[removed_status]] -= 1
+        if added_status in self.QUOTA_COUNTER_FIELDS:
+            deltas[self.QUOTA_COUNTER_FIELDS[added_status]] += 1
+        if deltas:
+            with scopes_disabled():
+                Quota.objects.update_counters(positions, **deltas)
+
     def set_expires(self, now_dt=None, subevents=None):
         now_dt = now_dt or now()
         tz = pytz.timezone(self.event.settings.timezone)
@@ -700,10 +808,23 @@ class Order(LockModel, LoggedModel):
             'voucher_budget': _('The voucher "{voucher}" no longer has sufficient budget.'),
         }
         now_dt = now_dt or now()
-        positions = self.positions.all().select_related('item', 'variation', 'seat', 'voucher')
+        positions = list(self.positions.all().select_related('item', 'variation', 'seat', 'voucher'))
         quota_cache = {}
+        position_quotas = {}
         v_budget = {}
         try:
+            if not force:
+                # Compute the availability of all relevant quotas at once instead of quota by quota
+                for op in positions:
+                    position_quotas[op.pk] = list(op.quotas)
+                    for quota in position_quotas[op.pk]:
+                        quota_cache.setdefault(quota.id, quota)
+                availabilities = Quota.objects.compute_availability(
+                    quota_cache.values(), now_dt, count_waitinglist=count_waitinglist
+                )
+                for quota, avail in availabilities.items():
+                    quota.cached_availability = avail[1]
+
             for i, op in enumerate(positions):
                 if op.seat:
                     if not op.seat.is_available(ignore_orderpos=op):
@@ -721,19 +842,15 @@ class Order(LockModel, LoggedModel):
                         ))
                     v_budget[op.voucher] -= disc
 
-                quotas = list(op.quotas)
+                quotas = position_quotas[op.pk]
                 if len(quotas) == 0:
                     raise Quota.QuotaExceededException(error_messages['unavailable'].format(
                         item=str(op.item) + (' - ' + str(op.variation) if op.variation else '')
                     ))
 
                 for quota in quotas:
-                    if quota.id not in quota_cache:
-                        quota_cache[quota.id] = quota
-                        quota.cached_availability = quota.availability(now_dt, count_waitinglist=count_waitinglist)[1]
-                    else:
-                        # Use cached version
-                        quota = quota_cache[quota.id]
+                    # Use cached version
+                    quota = quota_cache[quota.id]
                     if quota.cached_availability is not None:
                         quota.cached_availability -= 1
                         if quota.cached_availability < 0:
@@ -1220,6 +1337,8 @@ class OrderPayment(models.Model):
 
     objects = ScopedManager(organizer='order__event__organizer')
 
+    ROLLUP_FIELDS = ('state', 'payment_date')
+
     class Meta:
         ordering = ('local_id',)
 
@@ -1452,10 +1571,24 @@ class OrderPayment(models.Model):
         """
         return '{}-P-{}'.format(self.order.code, self.local_id)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        _remember_rollup_values(instance)
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.local_id:
             self.local_id = (self.order.payments.aggregate(m=Max('local_id'))['m'] or 0) + 1
+        # Only confirmed and refunded payments are part of the rollups
+        counted = (OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED)
+        rollup_changed = _rollup_values_changed(self, kwargs.get('update_fields')) and (
+            self.state in counted or (getattr(self, '_rollup_in_db', None) or {}).get('state') in counted
+        )
         super().save(*args, **kwargs)
+        _remember_rollup_values(self, kwargs.get('update_fields'))
+        if rollup_changed:
+            SalesRollupInvalidation.mark(self.order)
 
     def create_external_refund(self, amount=None, execution_date=None, info='{}'):
         """
@@ -1727,6 +1860,8 @@ class OrderFee(models.Model):
     all = ScopedManager(organizer='order__event__organizer')
     objects = ActivePositionManager()
 
+    ROLLUP_FIELDS = ('canceled', 'fee_type', 'internal_type', 'value', 'tax_value')
+
     @property
     def net_value(self):
         return self.value - self.tax_value
@@ -1763,15 +1898,27 @@ class OrderFee(models.Model):
             self.tax_value = Decimal('0.00')
             self.tax_rate = Decimal('0.00')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        _remember_rollup_values(instance)
+        return instance
+
     def save(self, *args, **kwargs):
         if self.tax_rate is None:
             self._calculate_tax()
         self.order.touch()
-        return super().save(*args, **kwargs)
+        rollup_changed = _rollup_values_changed(self, kwargs.get('update_fields'))
+        r = super().save(*args, **kwargs)
+        _remember_rollup_values(self, kwargs.get('update_fields'))
+        if rollup_changed:
+            SalesRollupInvalidation.mark(self.order)
+        return r
 
     def delete(self, **kwargs):
         self.order.touch()
         super().delete(**kwargs)
+        SalesRollupInvalidation.mark(self.order)
 
 
 class OrderPosition(AbstractPosition):
@@ -1832,6 +1979,9 @@ class OrderPosition(AbstractPosition):
     all = ScopedManager(organizer='order__event__organizer')
     objects = ActivePositionManager()
 
+    SEARCH_FIELDS = ('secret', 'attendee_name_cached', 'attendee_email')
+    ROLLUP_FIELDS = ('canceled', 'subevent', 'item', 'variation', 'price', 'tax_value')
+
     class Meta:
         verbose_name = _("Order position")
         verbose_name_plural = _("Order positions")
@@ -1928,7 +2078,23 @@ class OrderPosition(AbstractPosition):
         if not self.pseudonymization_id:
             self.assign_pseudonymization_id()
 
-        return super().save(*args, **kwargs)
+        rollup_changed = _rollup_values_changed(self, kwargs.get('update_fields'))
+        r = super().save(*args, **kwargs)
+        # attendee_name_cached is only updated by the parent class
+        if _search_values_changed(self, kwargs.get('update_fields')):
+            OrderPositionSearchToken.index([self.pk])
+            _remember_search_values(self, kwargs.get('update_fields'))
+        _remember_rollup_values(self, kwargs.get('update_fields'))
+        if rollup_changed:
+            SalesRollupInvalidation.mark(self.order)
+        return r
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        _remember_search_values(instance)
+        _remember_rollup_values(instance)
+        return instance
 
     @scopes_disabled()
     def assign_pseudonymization_id(self):
@@ -2016,6 +2182,71 @@ class OrderPosition(AbstractPosition):
             )
 
 
+class OrderPositionSearchToken(models.Model):
+    """
+    A normalized, lower-cased word that an order position can be found by, taken e.g. from its secret, the attendee
+    name or the order's email address. Searches match these tokens by prefix, which the database can answer from an
+    index, while substring searches on the original columns need to scan all positions of the event.
+
+    Tokens are updated whenever one of the source fields is changed through ``save()``. If you change them through
+    ``QuerySet.update()``, you need to call ``index()`` yourself.
+    """
+    event = models.ForeignKey(Event, related_name='+', on_delete=models.CASCADE)
+    position = models.ForeignKey(OrderPosition, related_name='search_tokens', on_delete=models.CASCADE)
+    token = models.CharField(max_length=190, db_index=True)
+
+    objects = ScopedManager(organizer='event__organizer')
+
+    @staticmethod
+    def tokenize(*values):
+        tokens = set()
+        for value in values:
+            for word in (value or '').lower().split():
+                tokens.add(word[:190])
+                if '@' in word:
+                    # Allow to search for the domain part of email addresses as well
+                    tokens.add(word.split('@', 1)[1][:190])
+        tokens.discard('')
+        return tokens
+
+    @classmethod
+    @scopes_disabled()
+    def index(cls, position_ids):
+        """
+        Rebuilds the tokens of the order positions with the given IDs. Accepts a list or a queryset.
+        """
+        rows = OrderPosition.all.filter(pk__in=position_ids).values_list(
+            'pk', 'order__event_id', 'secret', 'attendee_name_cached', 'attendee_email', 'order__code',
+            'order__email', 'order__invoice_address__name_cached',
+        )
+        cls.objects.filter(position_id__in=position_ids).delete()
+        cls.objects.bulk_create([
+            cls(position_id=r[0], event_id=r[1], token=t)
+            for r in rows.iterator()
+            for t in cls.tokenize(*r[2:])
+        ], batch_size=1000)
+
+    @classmethod
+    @scopes_disabled()
+    def index_order(cls, order_id):
+        """
+        Rebuilds the tokens of all positions of the order with the given ID.
+        """
+        cls.index(OrderPosition.all.filter(order_id=order_id).values_list('pk', flat=True))
+
+    @classmethod
+    @scopes_disabled()
+    def search(cls, qs, event, query):
+        """
+        Filters a queryset of order positions to the ones where every word of the query is the beginning of one of
+        the position's tokens, or of one of the tokens of the position it is an add-on to.
+        """
+        for word in cls.tokenize(query):
+            matches = cls.objects.filter(event=event, token__startswith=word).values('position_id')
+            qs = qs.filter(Q(pk__in=matches) | Q(addon_to__in=matches))
+        return qs
+
+
 class CartPosition(AbstractPosition):
     """
     A cart position is similar to an order line, except that it is not
@@ -2107,6 +2338,8 @@ class InvoiceAddress(models.Model):
 
     objects = ScopedManager(organizer='order__event__organizer')
 
+    SEARCH_FIELDS = ('name_cached',)
+
     def save(self, **kwargs):
         if self.order:
             self.order.touch()
@@ -2116,7 +2349,17 @@ class InvoiceAddress(models.Model):
         else:
             self.name_cached = ""
             self.name_parts = {}
+        search_changed = self.order_id and _search_values_changed(self, kwargs.get('update_fields'))
         super().save(**kwargs)
+        if search_changed:
+            OrderPositionSearchToken.index_order(self.order_id)
+        _remember_search_values(self, kwargs.get('update_fields'))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        _remember_search_values(instance)
+        return instance
 
     @property
     def is_empty(self):
@@ -54,6 +54,13 @@ class Organizer(LoggedModel):
     def __str__(self) -> str:
         return self.name
 
+    def __getstate__(self):
+        # Settings proxies and cache handles belong to this process and can not be pickled
+        return {
+            k: v for k, v in super().__getstate__().items()
+            if not k.startswith('_hierarkey_proxy_') and k != 'cache'
+        }
+
     def save(self, *args, **kwargs):
         obj = super().save(*args, **kwargs)
         self.get_cache().clear()
@@ -0,0 +1,83 @@
+from django.db import models
+from django.utils.timezone import now
+from django_scopes import ScopedManager, scopes_disabled
+
+from .event import Event, SubEvent
+from .items import Item, ItemVariation
+
+
+class SalesRollup(models.Model):
+    """
+    Pre-aggregated sales numbers of an event. Every row sums up all order positions (or fees, if ``item`` is not set)
+    of the orders placed on ``order_date`` that share the same subevent, product, variation, order status,
+    cancellation state and day of the last successful payment. All dates are calculated in the event's timezone.
+
+    Rows are never changed directly, instead all rows of an order date are rebuilt from the orders after an order of
+    that day has changed, both before the rows are read and by a periodic job. See ``SalesRollupInvalidation`` and
+    ``pretix.base.services.stats.refresh_sales_rollups``.
+    """
+    event = models.ForeignKey(Event, related_name='sales_rollups', on_delete=models.CASCADE)
+    order_date = models.DateField()
+    payment_date = models.DateField(null=True)
+    subevent = models.ForeignKey(SubEvent, null=True, related_name='+', on_delete=models.CASCADE)
+    item = models.ForeignKey(Item, null=True, related_name='+', on_delete=models.CASCADE)
+    variation = models.ForeignKey(ItemVariation, null=True, related_name='+', on_delete=models.CASCADE)
+    fee_type = models.CharField(max_length=100, null=True)
+    fee_internal_type = models.CharField(max_length=255, null=True)
+    status = models.CharField(max_length=3)
+    canceled = models.BooleanField(default=False)
+    count = models.PositiveIntegerField()
+    gross = models.DecimalField(max_digits=13, decimal_places=2)
+    net = models.DecimalField(max_digits=13, decimal_places=2)
+
+    objects = ScopedManager(organizer='event__organizer')
+
+    class Meta:
+        index_together = (('event', 'order_date'),)
+
+
+class OrderRollup(models.Model):
+    """
+    Pre-aggregated number and total value of the orders of an event, grouped by the day they were placed, the day
+    of their last successful payment and their status. Rows without a ``subevent`` count all orders of the event,
+    rows with a ``subevent`` only count the orders with at least one position in that subevent that has not been
+    canceled. Maintained together with ``SalesRollup``.
+    """
+    event = models.ForeignKey(Event, related_name='order_rollups', on_delete=models.CASCADE)
+    order_date = models.DateField()
+    payment_date = models.DateField(null=True)
+    subevent = models.ForeignKey(SubEvent, null=True, related_name='+', on_delete=models.CASCADE)
+    status = models.CharField(max_length=3)
+    count = models.PositiveIntegerField()
+    total = models.DecimalField(max_digits=13, decimal_places=2)
+
+    objects = ScopedManager(organizer='event__organizer')
+
+    class Meta:
+        index_together = (('event', 'order_date'),)
+
+
+class SalesRollupInvalidation(models.Model):
+    """
+    Marks the rollup rows of an order's day as outdated. Rows without an order mark all rollup rows of the event
+    as outdated.
+    """
+    event = models.ForeignKey(Event, related_name='+', on_delete=models.CASCADE)
+    order_id = models.IntegerField(null=True, db_index=True)
+    order_datetime = models.DateTimeField(null=True)
+    marked = models.DateTimeField()
+
+    objects = ScopedManager(organizer='event__organizer')
+
+    @classmethod
+    @scopes_disabled()
+    def mark(cls, order):
+        """
+        Marks the rollup rows of the day an order was placed on as outdated. This needs to be called whenever one
+        of the ``ROLLUP_FIELDS`` of the order or one of its positions, fees or payments changes.
+        """
+        # Every order has its own row that is refreshed on every change, so we never need to wait for another
+        # order's transaction and can later tell whether the order changed while the rollups were rebuilt.
+        if not cls.objects.filter(order_id=order.pk).update(marked=now()):
+            cls.objects.create(event_id=order.event_id, order_id=order.pk, order_datetime=order.datetime,
+                               marked=now())
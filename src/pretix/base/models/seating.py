@@ -6,6 +6,8 @@ from django.contrib.staticfiles import finders
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.deconstruct import deconstructible
 from django.utils.timezone import now
 from django.utils.translation import gettext, ugettext_lazy as _
@@ -174,3 +176,9 @@ class Seat(models.Model):
         if ignore_voucher_id:
             vqs = vqs.exclude(pk=ignore_voucher_id)
         return not opqs.exists() and (ignore_cart is True or not cpqs.exists()) and not vqs.exists()
+
+
+@receiver(post_save, sender=SeatCategoryMapping)
+@receiver(post_delete, sender=SeatCategoryMapping)
+def seatcategorymapping_changed(sender, instance, **kwargs):
+    instance.event.cache.clear()
@@ -13,7 +13,7 @@ from pretix.base.services.mail import mail
 
 from .base import LoggedModel
 from .event import Event, SubEvent
-from .items import Item, ItemVariation
+from .items import Item, ItemVariation, Quota
 
 
 class WaitingListException(Exception):
@@ -78,6 +78,24 @@ class WaitingListEntry(LoggedModel):
     def __str__(self):
         return '%s waits for %s' % (str(self.email), str(self.item))
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted_in_db = instance.__dict__.get('voucher_id') is None
+        return instance
+
+    def save(self, *args, **kwargs):
+        counted_in_db = getattr(self, '_counted_in_db', False)
+        super().save(*args, **kwargs)
+        self._counted_in_db = self.voucher_id is None
+        if self._counted_in_db != counted_in_db:
+            Quota.objects.update_counters([self], waiting_list=1 if self._counted_in_db else -1)
+
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        if getattr(self, '_counted_in_db', False):
+            Quota.objects.update_counters([self], waiting_list=-1)
+
     def clean(self):
         WaitingListEntry.clean_duplicate(self.email, self.item, self.variation, self.subevent, self.pk)
         WaitingListEntry.clean_itemvar(self.event, self.item, self.variation)
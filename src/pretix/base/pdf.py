@@ -1,24 +1,31 @@
 import copy
+import hashlib
 import itertools
 import logging
 import os
 import subprocess
 import tempfile
-import uuid
+import threading
 from collections import OrderedDict
-from functools import partial
+from functools import lru_cache, partial
 from io import BytesIO
 
+import billiard
 from arabic_reshaper import ArabicReshaper
 from bidi.algorithm import get_display
 from django.conf import settings
 from django.contrib.staticfiles import finders
+from django.db import connections
 from django.dispatch import receiver
 from django.utils.formats import date_format
 from django.utils.html import conditional_escape
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from PyPDF2 import PdfFileReader
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject,
+    NameObject, NumberObject, RectangleObject,
+)
 from pytz import timezone
 from reportlab.graphics import renderPDF
 from reportlab.graphics.barcode.qr import QrCodeWidget
@@ -356,59 +363,232 @@ def get_variables(event):
     return v
 
 
+def get_variables_cached(event):
+    """
+    Like ``get_variables``, but only computes the variables once per event object.
+    """
+    if not hasattr(event, '_cached_pdf_variables'):
+        event._cached_pdf_variables = get_variables(event)
+    return event._cached_pdf_variables
+
+
+_registered_fonts = set()
+_backgrounds = threading.local()
+BACKGROUND_CACHE_SIZE = 16
+_reshaper = ArabicReshaper(configuration={
+    'delete_harakat': True,
+    'support_ligatures': False,
+})
+_align_map = {
+    'left': TA_LEFT,
+    'center': TA_CENTER,
+    'right': TA_RIGHT
+}
+
+
+def _register_font(name, path):
+    # Parsing TrueType files is expensive, so every font is only registered once per process
+    if name not in _registered_fonts:
+        pdfmetrics.registerFont(TTFont(name, finders.find(path)))
+        _registered_fonts.add(name)
+
+
+def _get_background_pdf(bg_bytes):
+    # PdfFileReader reads its input lazily and is not safe to share between threads, so we keep one cache per thread
+    cache = getattr(_backgrounds, 'cache', None)
+    if cache is None:
+        cache = _backgrounds.cache = OrderedDict()
+    key = hashlib.sha1(bg_bytes).hexdigest()
+    if key in cache:
+        cache.move_to_end(key)
+    else:
+        cache[key] = PdfFileReader(BytesIO(bg_bytes), strict=False)
+        if len(cache) > BACKGROUND_CACHE_SIZE:
+            cache.popitem(last=False)
+    return cache[key]
+
+
+@lru_cache(maxsize=256)
+def _get_paragraph_style(font, fontsize, color, align):
+    return ParagraphStyle(
+        name='{}-{}-{}-{}'.format(font, fontsize, '-'.join(str(c) for c in color), align),
+        fontName=font,
+        fontSize=fontsize,
+        leading=fontsize,
+        autoLeading="max",
+        textColor=Color(color[0] / 255, color[1] / 255, color[2] / 255),
+        alignment=_align_map[align]
+    )
+
+
+@lru_cache(maxsize=16)
+def _get_poweredby_image(content, size):
+    ir = ThumbnailingImageReader(finders.find('pretixpresale/pdf/powered_by_pretix_{}.png'.format(content)))
+    try:
+        width, height = ir.resize(None, size * mm, 300)
+    except:
+        logger.exception("Can not resize image")
+        width, height = None, size * mm
+    return ir, width, height
+
+
+def _get_page_attr(page, name, default=None):
+    """
+    Returns an attribute of a page, which might also be inherited from one of the page tree nodes above it.
+    """
+    node, seen = page, set()
+    while node is not None and id(node) not in seen:
+        if name in node:
+            return node.raw_get(name)
+        seen.add(id(node))
+        node = node['/Parent'] if '/Parent' in node else None
+    return default
+
+
+def _get_background_form(bg_pdf):
+    form = getattr(bg_pdf, '_pretix_background_form', None)
+    if form is None:
+        page = bg_pdf.getPage(0)
+        contents = page['/Contents'] if '/Contents' in page else ArrayObject()
+        if isinstance(contents, ArrayObject):
+            data = b'\n'.join(c.getObject().getData() for c in contents)
+        else:
+            data = contents.getData()
+        form = DecodedStreamObject()
+        form.setData(data)
+        form = form.flateEncode()
+        x0, y0, x1, y1 = [float(v) for v in _get_page_attr(page, '/MediaBox').getObject()]
+        form.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/BBox'): RectangleObject([x0, y0, x1, y1]),
+            NameObject('/Resources'): _get_page_attr(page, '/Resources', DictionaryObject()),
+        })
+        # A rotated page is shown turned clockwise, the form needs to be drawn the same way
+        rotate = int(_get_page_attr(page, '/Rotate', NumberObject(0)).getObject()) % 360
+        matrix = {
+            90: [0, -1, 1, 0, -y0, x1],
+            180: [-1, 0, 0, -1, x1, y1],
+            270: [0, 1, -1, 0, y1, -x0],
+        }.get(rotate)
+        if matrix:
+            form[NameObject('/Matrix')] = ArrayObject([FloatObject(v) for v in matrix])
+        if rotate in (90, 270):
+            bg_pdf._pretix_background_box = RectangleObject([0, 0, y1 - y0, x1 - x0])
+        elif rotate == 180:
+            bg_pdf._pretix_background_box = RectangleObject([0, 0, x1 - x0, y1 - y0])
+        else:
+            bg_pdf._pretix_background_box = RectangleObject([x0, y0, x1, y1])
+        bg_pdf._pretix_background_form = form
+    return form
+
+
+def get_background_box(bg_pdf):
+    """
+    Returns the page box of a background PDF as it is shown, i.e. with its rotation applied.
+    """
+    _get_background_form(bg_pdf)
+    return bg_pdf._pretix_background_box
+
+
+class BackgroundOverlay:
+    """
+    Places background pages below the pages added to a ``PdfFileWriter``. Every background is only parsed once and
+    stored once per output file as a Form XObject that all pages refer to, so no content streams need to be merged.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._forms = {}
+
+    def _get_form_ref(self, bg_pdf):
+        if id(bg_pdf) not in self._forms:
+            # The writer rewrites the references of all objects it is given, so it needs its own copy
+            self._forms[id(bg_pdf)] = self.writer._addObject(copy.copy(_get_background_form(bg_pdf)))
+        return self._forms[id(bg_pdf)]
+
+    def add_page(self, page, backgrounds):
+        """
+        Adds ``page`` to the output file. ``backgrounds`` is a list of tuples of a background ``PdfFileReader`` and
+        the x and y offset of its lower left corner on the page.
+        """
+        if '/Resources' not in page:
+            page[NameObject('/Resources')] = DictionaryObject()
+        resources = page['/Resources']
+        if '/XObject' not in resources:
+            resources[NameObject('/XObject')] = DictionaryObject()
+        xobjects = resources['/XObject']
+
+        ops = []
+        for i, (bg_pdf, tx, ty) in enumerate(backgrounds):
+            name = '/PretixBackground{}'.format(i)
+            xobjects[NameObject(name)] = self._get_form_ref(bg_pdf)
+            ops.append('q 1 0 0 1 {:f} {:f} cm {} Do Q\n'.format(tx, ty, name))
+
+        prefix = DecodedStreamObject()
+        prefix.setData(''.join(ops).encode())
+        contents = [self.writer._addObject(prefix)]
+        if '/Contents' in page:
+            raw = page.raw_get('/Contents')
+            if isinstance(raw.getObject(), ArrayObject):
+                contents += list(raw.getObject())
+            else:
+                contents.append(raw)
+        page[NameObject('/Contents')] = ArrayObject(contents)
+        self.writer.addPage(page)
+
+
 class Renderer:
 
     def __init__(self, event, layout, background_file):
         self.layout = layout
         self.background_file = background_file
-        self.variables = get_variables(event)
+        self.variables = get_variables_cached(event)
         if self.background_file:
             self.bg_bytes = self.background_file.read()
-            self.bg_pdf = PdfFileReader(BytesIO(self.bg_bytes), strict=False)
+            self.bg_pdf = _get_background_pdf(self.bg_bytes)
         else:
             self.bg_bytes = None
             self.bg_pdf = None
 
     @classmethod
     def _register_fonts(cls):
-        pdfmetrics.registerFont(TTFont('Open Sans', finders.find('fonts/OpenSans-Regular.ttf')))
-        pdfmetrics.registerFont(TTFont('Open Sans I', finders.find('fonts/OpenSans-Italic.ttf')))
-        pdfmetrics.registerFont(TTFont('Open Sans B', finders.find('fonts/OpenSans-Bold.ttf')))
-        pdfmetrics.registerFont(TTFont('Open Sans B I', finders.find('fonts/OpenSans-BoldItalic.ttf')))
+        _register_font('Open Sans', 'fonts/OpenSans-Regular.ttf')
+        _register_font('Open Sans I', 'fonts/OpenSans-Italic.ttf')
+        _register_font('Open Sans B', 'fonts/OpenSans-Bold.ttf')
+        _register_font('Open Sans B I', 'fonts/OpenSans-BoldItalic.ttf')
 
         for family, styles in get_fonts().items():
-            pdfmetrics.registerFont(TTFont(family, finders.find(styles['regular']['truetype'])))
+            _register_font(family, styles['regular']['truetype'])
             if 'italic' in styles:
-                pdfmetrics.registerFont(TTFont(family + ' I', finders.find(styles['italic']['truetype'])))
+                _register_font(family + ' I', styles['italic']['truetype'])
             if 'bold' in styles:
-                pdfmetrics.registerFont(TTFont(family + ' B', finders.find(styles['bold']['truetype'])))
+                _register_font(family + ' B', styles['bold']['truetype'])
             if 'bolditalic' in styles:
-                pdfmetrics.registerFont(TTFont(family + ' B I', finders.find(styles['bolditalic']['truetype'])))
+                _register_font(family + ' B I', styles['bolditalic']['truetype'])
 
     def _draw_poweredby(self, canvas: Canvas, op: OrderPosition, o: dict):
         content = o.get('content', 'dark')
         if content not in ('dark', 'white'):
             content = 'dark'
-        img = finders.find('pretixpresale/pdf/powered_by_pretix_{}.png'.format(content))
-
-        ir = ThumbnailingImageReader(img)
-        try:
-            width, height = ir.resize(None, float(o['size']) * mm, 300)
-        except:
-            logger.exception("Can not resize image")
-            pass
+        ir, width, height = _get_poweredby_image(content, float(o['size']))
         canvas.drawImage(ir,
                          float(o['left']) * mm, float(o['bottom']) * mm,
                          width=width, height=height,
                          preserveAspectRatio=True, anchor='n',
                          mask='auto')
 
-    def _draw_barcodearea(self, canvas: Canvas, op: OrderPosition, o: dict):
+    def _get_barcode_content(self, op: OrderPosition, o: dict):
         content = o.get('content', 'secret')
         if content == 'secret':
             content = op.secret
         elif content == 'pseudonymization_id':
             content = op.pseudonymization_id
+        return content
+
+    def _draw_barcodearea(self, canvas: Canvas, op: OrderPosition, o: dict, content=None):
+        if content is None:
+            content = self._get_barcode_content(op, o)
 
         reqs = float(o['size']) * mm
         qrw = QrCodeWidget(content, barLevel='H', barHeight=reqs, barWidth=reqs)
@@ -443,39 +623,23 @@ class Renderer:
                 return '(error)'
         return ''
 
-    def _draw_textarea(self, canvas: Canvas, op: OrderPosition, order: Order, o: dict):
+    def _draw_textarea(self, canvas: Canvas, op: OrderPosition, order: Order, o: dict, text=None):
         font = o['fontfamily']
         if o['bold']:
             font += ' B'
         if o['italic']:
             font += ' I'
 
-        align_map = {
-            'left': TA_LEFT,
-            'center': TA_CENTER,
-            'right': TA_RIGHT
-        }
-        style = ParagraphStyle(
-            name=uuid.uuid4().hex,
-            fontName=font,
-            fontSize=float(o['fontsize']),
-            leading=float(o['fontsize']),
-            autoLeading="max",
-            textColor=Color(o['color'][0] / 255, o['color'][1] / 255, o['color'][2] / 255),
-            alignment=align_map[o['align']]
-        )
+        style = _get_paragraph_style(font, float(o['fontsize']), tuple(o['color'][:3]), o['align'])
+        if text is None:
+            text = self._get_text_content(op, order, o)
         text = conditional_escape(
-            self._get_text_content(op, order, o) or "",
+            text or "",
         ).replace("\n", "<br/>\n")
 
         # reportlab does not support RTL, ligature-heavy scripts like Arabic. Therefore, we use ArabicReshaper
         # to resolve all ligatures and python-bidi to switch RTL texts.
-        configuration = {
-            'delete_harakat': True,
-            'support_ligatures': False,
-        }
-        reshaper = ArabicReshaper(configuration=configuration)
-        text = "<br/>".join(get_display(reshaper.reshape(l)) for l in text.split("<br/>"))
+        text = "<br/>".join(get_display(_reshaper.reshape(l)) for l in text.split("<br/>"))
 
         p = Paragraph(text, style=style)
         w, h = p.wrapOn(canvas, float(o['width']) * mm, 1000 * mm)
@@ -494,16 +658,34 @@ class Renderer:
             p.drawOn(canvas, 0, -h - ad[1])
         canvas.restoreState()
 
-    def draw_page(self, canvas: Canvas, order: Order, op: OrderPosition, show_page=True):
+    def get_content(self, order: Order, op: OrderPosition) -> list:
+        """
+        Evaluates the dynamic content of all layout elements for the given order position. The result only
+        consists of strings and can be passed to ``draw_page`` to draw the page without any database access.
+        """
+        content = []
         for o in self.layout:
             if o['type'] == "barcodearea":
-                self._draw_barcodearea(canvas, op, o)
+                content.append(str(self._get_barcode_content(op, o)))
+            elif o['type'] == "textarea":
+                content.append(str(self._get_text_content(op, order, o) or ""))
+            else:
+                content.append(None)
+        return content
+
+    def draw_page(self, canvas: Canvas, order: Order, op: OrderPosition, show_page=True, content=None):
+        if content is None:
+            content = self.get_content(order, op)
+        for o, c in zip(self.layout, content):
+            if o['type'] == "barcodearea":
+                self._draw_barcodearea(canvas, op, o, c)
             elif o['type'] == "textarea":
-                self._draw_textarea(canvas, op, order, o)
+                self._draw_textarea(canvas, op, order, o, c)
             elif o['type'] == "poweredby":
                 self._draw_poweredby(canvas, op, o)
             if self.bg_pdf:
-                canvas.setPageSize((self.bg_pdf.getPage(0).mediaBox[2], self.bg_pdf.getPage(0).mediaBox[3]))
+                box = get_background_box(self.bg_pdf)
+                canvas.setPageSize((box[2], box[3]))
         if show_page:
             canvas.showPage()
 
@@ -531,11 +713,12 @@ class Renderer:
             buffer.seek(0)
             new_pdf = PdfFileReader(buffer)
             output = PdfFileWriter()
+            overlay = BackgroundOverlay(output)
+            box = get_background_box(self.bg_pdf)
 
             for page in new_pdf.pages:
-                bg_page = copy.copy(self.bg_pdf.getPage(0))
-                bg_page.mergePage(page)
-                output.addPage(bg_page)
+                page[NameObject('/MediaBox')] = RectangleObject(box)
+                overlay.add_page(page, [(self.bg_pdf, 0, 0)])
 
             output.addMetadata({
                 '/Title': str(title),
@@ -545,3 +728,81 @@ class Renderer:
             output.write(outbuffer)
             outbuffer.seek(0)
             return outbuffer
+
+
+_worker_render_chunk = None
+_worker_inherited_connections = []
+_render_pool_unavailable = False
+
+
+def _init_render_worker(render_chunk):
+    global _worker_render_chunk
+    # The worker inherited the database connections of its parent. They must never be used from here, so any
+    # accidental query should run on a connection of its own. Deallocating an inherited connection object would
+    # close the socket it shares with the parent, which ends the parent's database session. We therefore keep
+    # a reference to every one of them for the lifetime of the worker, which exits without running finalizers.
+    for conn in connections.all():
+        if conn.connection is not None:
+            _worker_inherited_connections.append(conn.connection)
+            conn.connection = None
+    _worker_render_chunk = render_chunk
+
+
+def _render_chunk_in_worker(chunk):
+    return _worker_render_chunk(chunk)
+
+
+def render_chunks(render_chunk, chunks: list, progress_callback=None, metadata=None) -> BytesIO:
+    """
+    Renders a large PDF file in independent chunks and concatenates the results. ``render_chunk`` is called
+    with every element of ``chunks`` and needs to return the PDF file for this chunk as ``bytes``.
+
+    If ``PDF_RENDER_PROCESSES`` is configured to be larger than one, the chunks are rendered in parallel by a pool
+    of forked worker processes. ``render_chunk`` must therefore not access the database, all dynamic content
+    should be computed beforehand using ``Renderer.get_content``.
+    """
+    global _render_pool_unavailable
+    from PyPDF2 import PdfFileMerger
+
+    merger = PdfFileMerger()
+
+    def _append(results):
+        for i, data in enumerate(results):
+            merger.append(BytesIO(data))
+            if progress_callback:
+                progress_callback(round(100 * (i + 1) / len(chunks)))
+
+    processes = min(settings.PDF_RENDER_PROCESSES, len(chunks))
+    if processes > 1 and _render_pool_unavailable:
+        processes = 1
+    if processes > 1:
+        try:
+            # We use celery's fork of multiprocessing, since only this one allows the daemonic processes of a celery
+            # worker to start processes of their own.
+            pool = billiard.get_context('fork').Pool(
+                processes, initializer=_init_render_worker, initargs=(render_chunk,)
+            )
+        except (AssertionError, ValueError) as e:
+            # In daemonic processes or on platforms without fork(), this will not change for the lifetime of this
+            # process, so we only warn once and do not try again.
+            logger.warning('Could not start PDF rendering processes (%s), rendering PDF files sequentially in this '
+                           'process from now on. See the render_processes option in the documentation.', e)
+            _render_pool_unavailable = True
+            processes = 1
+        except OSError as e:
+            # e.g. a temporary lack of resources
+            logger.warning('Could not start PDF rendering processes (%s), rendering sequentially.', e)
+            processes = 1
+        else:
+            with pool:
+                _append(pool.imap(_render_chunk_in_worker, chunks))
+    if processes <= 1:
+        _append(render_chunk(c) for c in chunks)
+
+    if metadata:
+        merger.addMetadata(metadata)
+    outbuffer = BytesIO()
+    merger.write(outbuffer)
+    merger.close()
+    outbuffer.seek(0)
+    return outbuffer
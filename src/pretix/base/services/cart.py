@@ -1,6 +1,7 @@
 from collections import Counter, defaultdict, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
@@ -15,7 +16,7 @@ from django_scopes import scopes_disabled
 from pretix.base.channels import get_all_sales_channels
 from pretix.base.i18n import language
 from pretix.base.models import (
-    CartPosition, Event, InvoiceAddress, Item, ItemVariation, Seat,
+    CartPosition, Event, InvoiceAddress, Item, ItemVariation, Quota, Seat,
     SeatCategoryMapping, Voucher,
 )
 from pretix.base.models.event import SubEvent
@@ -205,24 +206,41 @@ class CartManager:
         })
 
     def _update_items_cache(self, item_ids: List[int], variation_ids: List[int]):
-        self._items_cache.update({
-            i.pk: i
+        # Products rarely change, so we keep a copy of every product in the event's cache, which is
+        # cleared whenever a product or anything related to it changes.
+        keys = (
+            ['cart_item:{}'.format(i) for i in item_ids if i and i not in self._items_cache] +
+            ['cart_variation:{}'.format(i) for i in variation_ids if i and i not in self._variations_cache]
+        )
+        if not keys:
+            return
+        for k, v in self.event.cache.get_many(keys).items():
+            if k.startswith('cart_item:'):
+                self._items_cache[v.pk] = v
+            else:
+                self._variations_cache[v.pk] = v
+
+        missing_items = [i for i in item_ids if i and i not in self._items_cache]
+        missing_variations = [i for i in variation_ids if i and i not in self._variations_cache]
+        fetched = {}
+        if missing_items:
             for i in self.event.items.select_related('category').prefetch_related(
                 'addons', 'bundles', 'addons__addon_category', 'quotas'
             ).annotate(
                 has_variations=Count('variations'),
             ).filter(
-                id__in=[i for i in item_ids if i and i not in self._items_cache]
-            )
-        })
-        self._variations_cache.update({
-            v.pk: v
+                id__in=missing_items
+            ):
+                self._items_cache[i.pk] = fetched['cart_item:{}'.format(i.pk)] = i
+        if missing_variations:
             for v in ItemVariation.objects.filter(item__event=self.event).prefetch_related(
                 'quotas'
             ).select_related('item', 'item__event').filter(
-                id__in=[i for i in variation_ids if i and i not in self._variations_cache]
-            )
-        })
+                id__in=missing_variations
+            ):
+                self._variations_cache[v.pk] = fetched['cart_variation:{}'.format(v.pk)] = v
+        if fetched:
+            self.event.cache.set_many(fetched, 300)
 
     def _check_max_cart_size(self):
         if not get_all_sales_channels()[self._sales_channel].unlimited_items_per_order:
@@ -728,10 +746,14 @@ class CartManager:
 
     def _get_quota_availability(self):
         quotas_ok = defaultdict(int)
+        availabilities = Quota.objects.compute_availability(
+            [quota for quota, count in self._quota_diff.items() if count > 0], self.now_dt
+        )
         for quota, count in self._quota_diff.items():
             if count <= 0:
-                quotas_ok[quota] = 0
-            avail = quota.availability(self.now_dt)
+                quotas_ok[quota] = count
+                continue
+            avail = availabilities[quota]
             if avail[1] is not None and avail[1] < count:
                 quotas_ok[quota] = min(count, avail[1])
             else:
@@ -1000,7 +1022,12 @@ class CartManager:
 
         lockfn = NoLockManager
         if self._require_locking():
-            lockfn = self.event.lock
+            lockfn = partial(
+                self.event.lock,
+                quotas=[q for q, c in self._quota_diff.items() if c > 0],
+                vouchers=[v for v, c in self._voucher_use_diff.items() if c > 0],
+                seats=[o.seat for o in self._operations if getattr(o, 'seat', None)],
+            )
 
         with lockfn() as now_dt:
             with transaction.atomic():
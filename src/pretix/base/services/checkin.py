@@ -1,11 +1,13 @@
-from django.db import transaction
-from django.db.models import Prefetch
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.dispatch import receiver
 from django.utils.timezone import now
 from django.utils.translation import ugettext as _
 
 from pretix.base.models import (
-    Checkin, CheckinList, Order, OrderPosition, Question, QuestionOption,
+    Checkin, CheckinList, LogEntry, Order, OrderPosition, Question,
+    QuestionOption,
 )
 from pretix.base.signals import checkin_created, order_placed
 
@@ -59,6 +61,63 @@ def _save_answers(op, answers, given_answers):
                 op.answers.create(question=q, answer=str(a))
 
 
+def _clean_answers(op, raw_answers):
+    given_answers = {}
+    for q in op.item.checkin_questions:
+        if str(q.pk) in raw_answers:
+            try:
+                given_answers[q] = q.clean_answer(raw_answers[str(q.pk)])
+            except ValidationError:
+                pass
+    return given_answers
+
+
+def _validate_checkin(op, clist, product_ids, given_answers, force, ignore_unpaid, questions_supported,
+                      canceled_supported):
+    if op.canceled or op.order.status not in (Order.STATUS_PAID, Order.STATUS_PENDING):
+        raise CheckInError(
+            _('This order position has been canceled.'),
+            'canceled' if canceled_supported else 'unpaid'
+        )
+
+    answers = {a.question: a for a in op.answers.all()}
+    require_answers = []
+    for q in op.item.checkin_questions:
+        if q not in given_answers and q not in answers:
+            require_answers.append(q)
+
+    if product_ids is not None and op.item_id not in product_ids:
+        raise CheckInError(
+            _('This order position has an invalid product for this check-in list.'),
+            'product'
+        )
+    elif op.order.status != Order.STATUS_PAID and not force and not (
+        ignore_unpaid and clist.include_pending and op.order.status == Order.STATUS_PENDING
+    ):
+        raise CheckInError(
+            _('This order is not marked as paid.'),
+            'unpaid'
+        )
+    elif require_answers and not force and questions_supported:
+        raise RequiredQuestionsError(
+            _('You need to answer questions to complete this check-in.'),
+            'incomplete',
+            require_answers
+        )
+    return answers
+
+
+def _log_checkin(op, clist, dt, first, forced, user, auth):
+    op.order.log_action('pretix.event.checkin', data={
+        'position': op.id,
+        'positionid': op.positionid,
+        'first': first,
+        'forced': forced,
+        'datetime': dt,
+        'list': clist.pk
+    }, user=user, auth=auth)
+
+
 @transaction.atomic
 def perform_checkin(op: OrderPosition, clist: CheckinList, given_answers: dict, force=False,
                     ignore_unpaid=False, nonce=None, datetime=None, questions_supported=True,
@@ -92,57 +151,23 @@ def perform_checkin(op: OrderPosition, clist: CheckinList, given_answers: dict,
         'answers'
     ).get(pk=op.pk)
 
-    if op.canceled or op.order.status not in (Order.STATUS_PAID, Order.STATUS_PENDING):
-        raise CheckInError(
-            _('This order position has been canceled.'),
-            'canceled' if canceled_supported else 'unpaid'
-        )
-
-    answers = {a.question: a for a in op.answers.all()}
-    require_answers = []
-    for q in op.item.checkin_questions:
-        if q not in given_answers and q not in answers:
-            require_answers.append(q)
-
+    answers = _validate_checkin(
+        op, clist, None if clist.all_products else [i.pk for i in clist.limit_products.all()], given_answers,
+        force, ignore_unpaid, questions_supported, canceled_supported
+    )
     _save_answers(op, answers, given_answers)
 
-    if not clist.all_products and op.item_id not in [i.pk for i in clist.limit_products.all()]:
-        raise CheckInError(
-            _('This order position has an invalid product for this check-in list.'),
-            'product'
-        )
-    elif op.order.status != Order.STATUS_PAID and not force and not (
-        ignore_unpaid and clist.include_pending and op.order.status == Order.STATUS_PENDING
-    ):
-        raise CheckInError(
-            _('This order is not marked as paid.'),
-            'unpaid'
-        )
-    elif require_answers and not force and questions_supported:
-        raise RequiredQuestionsError(
-            _('You need to answer questions to complete this check-in.'),
-            'incomplete',
-            require_answers
-        )
-    else:
-        try:
-            ci, created = Checkin.objects.get_or_create(position=op, list=clist, defaults={
-                'datetime': dt,
-                'nonce': nonce,
-            })
-        except Checkin.MultipleObjectsReturned:
-            ci, created = Checkin.objects.filter(position=op, list=clist).last(), False
+    try:
+        ci, created = Checkin.objects.get_or_create(position=op, list=clist, defaults={
+            'datetime': dt,
+            'nonce': nonce,
+        })
+    except Checkin.MultipleObjectsReturned:
+        ci, created = Checkin.objects.filter(position=op, list=clist).last(), False
 
     if created or (nonce and nonce == ci.nonce):
         if created:
-            op.order.log_action('pretix.event.checkin', data={
-                'position': op.id,
-                'positionid': op.positionid,
-                'first': True,
-                'forced': op.order.status != Order.STATUS_PAID,
-                'datetime': dt,
-                'list': clist.pk
-            }, user=user, auth=auth)
+            _log_checkin(op, clist, dt, True, op.order.status != Order.STATUS_PAID, user, auth)
             checkin_created.send(op.order.event, checkin=ci)
     else:
         if not force:
@@ -150,14 +175,119 @@ def perform_checkin(op: OrderPosition, clist: CheckinList, given_answers: dict,
                 _('This ticket has already been redeemed.'),
                 'already_redeemed',
             )
-        op.order.log_action('pretix.event.checkin', data={
-            'position': op.id,
-            'positionid': op.positionid,
-            'first': False,
-            'forced': force,
-            'datetime': dt,
-            'list': clist.pk
-        }, user=user, auth=auth)
+        _log_checkin(op, clist, dt, False, force, user, auth)
+
+
+def perform_checkin_batch(clist: CheckinList, scans: list, user=None, auth=None) -> list:
+    """
+    Create check-ins for many order positions on the same check-in list at once, e.g. when a device uploads the scans
+    it recorded while it was offline. Related objects of all positions are fetched together and check-ins as well as
+    log entries are written in bulk.
+
+    :param clist: The check-in list
+    :param scans: A list of dictionaries with the key ``position`` containing the order position to check in and
+        the optional keys ``answers`` (a dictionary mapping question IDs to raw answers), ``force``,
+        ``ignore_unpaid``, ``nonce``, ``datetime``, ``questions_supported`` and ``canceled_supported`` with the same
+        meaning as for ``perform_checkin``.
+    :return: A list with one entry per scan, which is either ``None`` on success or the ``CheckInError`` or
+        ``RequiredQuestionsError`` that prevented the check-in
+    """
+    positions = [s['position'] for s in scans]
+    prefetch_related_objects(
+        positions,
+        'order__event',
+        Prefetch(
+            'item__questions',
+            queryset=Question.objects.filter(ask_during_checkin=True),
+            to_attr='checkin_questions'
+        ),
+        'answers',
+    )
+    try:
+        with transaction.atomic():
+            return _perform_checkin_batch(clist, scans, user, auth)
+    except IntegrityError:
+        # Another device checked in one of the positions at the same time, so we fall back to processing the scans
+        # one by one.
+        results = []
+        for scan in scans:
+            try:
+                perform_checkin(
+                    op=scan['position'],
+                    clist=clist,
+                    given_answers=_clean_answers(scan['position'], scan.get('answers') or {}),
+                    force=scan.get('force', False),
+                    ignore_unpaid=scan.get('ignore_unpaid', False),
+                    nonce=scan.get('nonce'),
+                    datetime=scan.get('datetime'),
+                    questions_supported=scan.get('questions_supported', True),
+                    canceled_supported=scan.get('canceled_supported', False),
+                    user=user,
+                    auth=auth,
+                )
+            except (CheckInError, RequiredQuestionsError) as e:
+                results.append(e)
+            else:
+                results.append(None)
+        return results
+
+
+def _perform_checkin_batch(clist, scans, user, auth):
+    product_ids = None if clist.all_products else {i.pk for i in clist.limit_products.all()}
+    checkins = {
+        ci.position_id: ci
+        for ci in Checkin.objects.filter(list=clist, position_id__in=[s['position'].pk for s in scans])
+    }
+    new_checkins = []
+    results = []
+
+    with LogEntry.bulk_log():
+        for scan in scans:
+            op = scan['position']
+            dt = scan.get('datetime') or now()
+            nonce = scan.get('nonce')
+            force = scan.get('force', False)
+            given_answers = _clean_answers(op, scan.get('answers') or {})
+            try:
+                answers = _validate_checkin(
+                    op, clist, product_ids, given_answers, force, scan.get('ignore_unpaid', False),
+                    scan.get('questions_supported', True), scan.get('canceled_supported', False)
+                )
+                ci = checkins.get(op.pk)
+                if not ci:
+                    ci = Checkin(position=op, list=clist, datetime=dt, nonce=nonce)
+                    checkins[op.pk] = ci
+                    new_checkins.append(ci)
+                    _log_checkin(op, clist, dt, True, op.order.status != Order.STATUS_PAID, user, auth)
+                elif not (nonce and nonce == ci.nonce):
+                    if not force:
+                        raise CheckInError(
+                            _('This ticket has already been redeemed.'),
+                            'already_redeemed',
+                        )
+                    _log_checkin(op, clist, dt, False, force, user, auth)
+            except (CheckInError, RequiredQuestionsError) as e:
+                results.append(e)
+            else:
+                _save_answers(op, answers, given_answers)
+                results.append(None)
+
+        if new_checkins:
+            # This replaces what Checkin.save() would do for every single check-in. The savepoint keeps the
+            # transaction usable if another device checked in one of the positions at the same time, so the
+            # IntegrityError reaches perform_checkin_batch() instead of breaking the log entry flush.
+            with transaction.atomic():
+                Checkin.objects.bulk_create(new_checkins)
+            Order.objects.filter(pk__in={ci.position.order_id for ci in new_checkins}).update(last_modified=now())
+            clist.event.cache.delete('checkin_count')
+            clist.touch()
+
+    if new_checkins:
+        for ci in Checkin.objects.filter(
+            list=clist, position_id__in=[ci.position_id for ci in new_checkins]
+        ).select_related('position__order'):
+            checkin_created.send(clist.event, checkin=ci)
+    return results
 
 
 @receiver(order_placed, dispatch_uid="autocheckin_order_placed")
@@ -1,41 +1,107 @@
+import logging
+import time
 from datetime import timedelta
 
-from django.dispatch import receiver
+from django.db import transaction
+from django.db.models import Q
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
+from pretix.base.metrics import (
+    pretix_cleanup_deleted_total, pretix_cleanup_runs_total,
+)
 from pretix.base.models import CachedCombinedTicket, CachedTicket
+from pretix.base.services.periodic import periodic_job
 
 from ..models import CachedFile, CartPosition, InvoiceAddress
-from ..signals import periodic_task
 
+logger = logging.getLogger(__name__)
 
-@receiver(signal=periodic_task)
+# Number of rows deleted with a single query
+CHUNK_SIZE = 1000
+# Maximum number of seconds a single cleanup job keeps deleting. Whatever is left over is deleted during the
+# next run of the periodic tasks, since every run starts again with the rows that are still there.
+TIME_BUDGET = 30
+
+
+def _delete_in_chunks(qs, deadline):
+    """
+    Deletes all objects matching ``qs`` in chunks of ``CHUNK_SIZE`` until either all of them are gone or the
+    deadline has passed. Deleting an object fires all the usual signals. Returns ``False`` if objects are left.
+    """
+    model = qs.model
+    while time.monotonic() < deadline:
+        pks = list(qs.order_by('pk').values_list('pk', flat=True)[:CHUNK_SIZE])
+        if not pks:
+            return True
+        with transaction.atomic():
+            model.objects.filter(pk__in=pks).delete()
+        pretix_cleanup_deleted_total.inc(len(pks), model=model.__name__)
+    return False
+
+
+def _delete_files_in_chunks(qs, deadline):
+    """
+    Like ``_delete_in_chunks``, but for models with a ``file`` field that do not need any other deletion logic.
+    The rows are deleted first and the files are removed from the storage afterwards, so a failing storage does
+    not keep us from cleaning up the database. As long as there are no signal receivers or cascades for the
+    model, Django deletes each chunk with a single query without fetching the rows.
+    """
+    model = qs.model
+    storage = model._meta.get_field('file').storage
+    while time.monotonic() < deadline:
+        chunk = list(qs.order_by('pk').values_list('pk', 'file')[:CHUNK_SIZE])
+        if not chunk:
+            return True
+        model.objects.filter(pk__in=[pk for pk, f in chunk]).delete()
+        for pk, f in chunk:
+            if f:
+                try:
+                    storage.delete(f)
+                except Exception:
+                    logger.exception('Could not delete file {}'.format(f))
+        pretix_cleanup_deleted_total.inc(len(chunk), model=model.__name__)
+    return False
+
+
+def _run_cleanup(name, querysets, delete=_delete_in_chunks):
+    deadline = time.monotonic() + TIME_BUDGET
+    for qs in querysets:
+        if not delete(qs, deadline):
+            logger.info('Cleanup job {} ran out of time, continuing in the next run.'.format(name))
+            pretix_cleanup_runs_total.inc(1, job=name, status='incomplete')
+            return
+    pretix_cleanup_runs_total.inc(1, job=name, status='complete')
+
+
+@periodic_job()
 @scopes_disabled()
 def clean_cart_positions(sender, **kwargs):
-    for cp in CartPosition.objects.filter(expires__lt=now() - timedelta(days=14), addon_to__isnull=False):
-        cp.delete()
-    for cp in CartPosition.objects.filter(expires__lt=now() - timedelta(days=14), addon_to__isnull=True):
-        cp.delete()
-    for ia in InvoiceAddress.objects.filter(order__isnull=True, last_modified__lt=now() - timedelta(days=14)):
-        ia.delete()
+    _run_cleanup('cart_positions', [
+        # Add-ons need to go first, they protect the positions they belong to
+        CartPosition.objects.filter(expires__lt=now() - timedelta(days=14), addon_to__isnull=False),
+        CartPosition.objects.filter(expires__lt=now() - timedelta(days=14), addon_to__isnull=True),
+        InvoiceAddress.objects.filter(order__isnull=True, last_modified__lt=now() - timedelta(days=14)),
+    ])
 
 
-@receiver(signal=periodic_task)
+@periodic_job()
 @scopes_disabled()
 def clean_cached_files(sender, **kwargs):
-    for cf in CachedFile.objects.filter(expires__isnull=False, expires__lt=now()):
-        cf.delete()
+    _run_cleanup('cached_files', [
+        CachedFile.objects.filter(expires__isnull=False, expires__lt=now()),
+    ], delete=_delete_files_in_chunks)
 
 
-@receiver(signal=periodic_task)
+@periodic_job()
 @scopes_disabled()
 def clean_cached_tickets(sender, **kwargs):
-    for cf in CachedTicket.objects.filter(created__lte=now() - timedelta(days=30)):
-        cf.delete()
-    for cf in CachedCombinedTicket.objects.filter(created__lte=now() - timedelta(days=30)):
-        cf.delete()
-    for cf in CachedTicket.objects.filter(created__lte=now() - timedelta(minutes=30), file__isnull=True):
-        cf.delete()
-    for cf in CachedCombinedTicket.objects.filter(created__lte=now() - timedelta(minutes=30), file__isnull=True):
-        cf.delete()
+    _run_cleanup('cached_tickets', [
+        CachedTicket.objects.filter(created__lte=now() - timedelta(days=30)),
+        CachedCombinedTicket.objects.filter(created__lte=now() - timedelta(days=30)),
+        # Files that were never generated, e.g. because the task crashed. An empty FileField is stored as ''
+        CachedTicket.objects.filter(Q(file__isnull=True) | Q(file=''), created__lte=now() - timedelta(minutes=30)),
+        CachedCombinedTicket.objects.filter(
+            Q(file__isnull=True) | Q(file=''), created__lte=now() - timedelta(minutes=30)
+        ),
+    ], delete=_delete_files_in_chunks)
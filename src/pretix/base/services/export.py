@@ -15,13 +15,18 @@ class ExportError(LazyLocaleException):
     pass
 
 
-@app.task(base=ProfiledEventTask, throws=(ExportError,))
-def export(event: Event, fileid: str, provider: str, form_data: Dict[str, Any]) -> None:
+@app.task(base=ProfiledEventTask, throws=(ExportError,), bind=True)
+def export(self, event: Event, fileid: str, provider: str, form_data: Dict[str, Any]) -> None:
+    def set_progress(val):
+        if not self.request.called_directly and not self.request.is_eager:
+            self.update_state(state='PROGRESS', meta={'value': val})
+
     file = CachedFile.objects.get(id=fileid)
     with language(event.settings.locale), override(event.settings.timezone):
         responses = register_data_exporters.send(event)
         for receiver, response in responses:
             ex = response(event)
+            ex.progress_callback = set_progress
             if ex.identifier == provider:
                 d = ex.render(form_data)
                 if d is None:
@@ -11,7 +11,6 @@ from django.core.files.base import ContentFile
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
 from django.db.models import Count
-from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.formats import date_format
 from django.utils.timezone import now
@@ -25,9 +24,10 @@ from pretix.base.models import (
     Invoice, InvoiceAddress, InvoiceLine, Order, OrderFee,
 )
 from pretix.base.models.tax import EU_CURRENCIES
+from pretix.base.services.periodic import periodic_job
 from pretix.base.services.tasks import TransactionAwareTask
 from pretix.base.settings import GlobalSettingsObject
-from pretix.base.signals import invoice_line_text, periodic_task
+from pretix.base.signals import invoice_line_text
 from pretix.celery_app import app
 from pretix.helpers.database import rolledback_transaction
 from pretix.helpers.models import modelcopy
@@ -367,7 +367,7 @@ def build_preview_invoice_pdf(event):
         return event.invoice_renderer.generate(invoice)
 
 
-@receiver(signal=periodic_task)
+@periodic_job()
 def fetch_ecb_rates(sender, **kwargs):
     if not settings.FETCH_ECB_RATES:
         return
@@ -1,12 +1,18 @@
 import logging
+import random
 import time
 import uuid
 from datetime import timedelta
 
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils.timezone import now
+from redis.lock import Lock
 
+from pretix.base.metrics import (
+    pretix_lock_contentions_total, pretix_lock_hold_seconds,
+    pretix_lock_wait_seconds,
+)
 from pretix.base.models import EventLock
 
 logger = logging.getLogger('pretix.base.locking')
@@ -39,6 +45,27 @@ class LockManager:
             return False
 
 
+class ObjectLockManager:
+    def __init__(self, event, quotas=(), vouchers=(), seats=()):
+        self.event = event
+        self.keys = sorted(
+            {('quota', q.pk) for q in quotas if q.size is not None}
+            | {('voucher', v.pk) for v in vouchers}
+            | {('seat', s.pk) for s in seats}
+        )
+        self.locks = None
+
+    def __enter__(self):
+        self.locks = lock_objects(self.event, self.keys)
+        return now()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        release_objects(self.event, self.locks)
+        self.locks = None
+        if exc_type is not None:
+            return False
+
+
 class LockTimeoutException(Exception):
     pass
 
@@ -50,18 +77,21 @@ class LockReleaseException(Exception):
 def lock_event(event):
     """
     Issue a lock on this event so nobody can book tickets for this event until
-    you release the lock. Will retry 5 times on failure.
+    you release the lock. If the event is already locked, we wait in line until
+    it is released or until ``PRETIX_LOCK_WAIT_TIMEOUT`` seconds have passed.
 
-    :raises LockTimeoutException: if the event is locked every time we try
-                                  to obtain the lock
+    :raises LockTimeoutException: if we could not obtain the lock in time
     """
     if hasattr(event, '_lock') and event._lock:
         return True
 
+    deadline = _get_deadline()
     if settings.HAS_REDIS:
-        return lock_event_redis(event)
+        lock_event_redis(event, deadline)
     else:
-        return lock_event_db(event)
+        lock_event_db(event, deadline)
+    event._lock_acquired = time.time()
+    return True
 
 
 def release_event(event):
@@ -74,30 +104,106 @@ def release_event(event):
     """
     if not hasattr(event, '_lock') or not event._lock:
         raise LockReleaseException('Lock is not owned by this thread')
+    if getattr(event, '_lock_acquired', None):
+        pretix_lock_hold_seconds.observe(max(time.time() - event._lock_acquired, 0), lock_type='event')
+        event._lock_acquired = None
     if settings.HAS_REDIS:
         return release_event_redis(event)
     else:
         return release_event_db(event)
 
 
-def lock_event_db(event):
-    retries = 5
-    for i in range(retries):
+def lock_objects(event, keys):
+    """
+    Issue locks on only the given quotas, vouchers and seats of this event, so that bookings
+    touching other objects of the same event can happen in parallel. ``keys`` is a sorted list of
+    ``(type, pk)`` tuples. The locks are always acquired in the same order, so two processes can
+    never wait for each other. A lock on the whole event obtained through :py:func:`lock_event`
+    still excludes all object locks. Waits for all locks at most ``PRETIX_LOCK_WAIT_TIMEOUT``
+    seconds in total.
+
+    Object locks require Redis. Without Redis, the whole event is locked instead.
+
+    :returns: An opaque value that needs to be passed to :py:func:`release_objects`
+    :raises LockTimeoutException: if we could not obtain all locks in time
+    """
+    if hasattr(event, '_lock') and event._lock:
+        return None
+
+    if settings.HAS_REDIS:
+        return lock_objects_redis(event, keys, _get_deadline())
+    else:
+        lock_event(event)
+        return event._lock
+
+
+def release_objects(event, locks):
+    """
+    Release locks placed by :py:meth:`lock_objects()`.
+
+    :raises LockReleaseException: if we do not own the lock
+    """
+    if locks is None:
+        return
+    if settings.HAS_REDIS:
+        return release_objects_redis(event, locks)
+    else:
+        return release_event(event)
+
+
+def _get_deadline():
+    return time.time() + settings.PRETIX_LOCK_WAIT_TIMEOUT
+
+
+def _wait_for(lock_type, acquire, deadline):
+    """
+    Calls ``acquire`` until it returns ``True`` or ``deadline`` has passed. In between, we back off
+    exponentially with some jitter, so waiting processes do not all hit the lock at the same moment.
+
+    :raises LockTimeoutException: if ``acquire`` did not succeed in time
+    """
+    start = time.time()
+    tries = 0
+    while True:
+        if acquire():
+            pretix_lock_wait_seconds.observe(time.time() - start, lock_type=lock_type, status='acquired')
+            if tries:
+                pretix_lock_contentions_total.inc(tries, lock_type=lock_type)
+            return
+        tries += 1
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            pretix_lock_wait_seconds.observe(time.time() - start, lock_type=lock_type, status='timeout')
+            pretix_lock_contentions_total.inc(tries, lock_type=lock_type)
+            raise LockTimeoutException()
+        time.sleep(min(0.005 * 2 ** min(tries, 5) * random.uniform(0.5, 1.5), remaining))
+
+
+def lock_event_db(event, deadline):
+    def acquire():
         with transaction.atomic():
             dt = now()
             l, created = EventLock.objects.get_or_create(event=event.id)
             if created:
                 event._lock = l
                 return True
-            elif l.date < now() - timedelta(seconds=LOCK_TIMEOUT):
-                newtoken = str(uuid.uuid4())
-                updated = EventLock.objects.filter(event=event.id, token=l.token).update(date=dt, token=newtoken)
-                if updated:
-                    l.token = newtoken
-                    event._lock = l
+            elif l.date < dt - timedelta(seconds=LOCK_TIMEOUT):
+                # The lock has expired. If multiple processes try to take it over at the same
+                # time, only one of them gets the row, the others skip it instead of queueing
+                # up behind each other.
+                qs = EventLock.objects.filter(event=event.id, token=l.token)
+                if connection.features.has_select_for_update_skip_locked:
+                    qs = qs.select_for_update(skip_locked=True)
+                stale = qs.first()
+                if stale:
+                    newtoken = str(uuid.uuid4())
+                    EventLock.objects.filter(event=event.id, token=stale.token).update(date=dt, token=newtoken)
+                    stale.token = newtoken
+                    event._lock = stale
                     return True
-        time.sleep(2 ** i / 100)
-    raise LockTimeoutException()
+        return False
+
+    _wait_for('event', acquire, deadline)
 
 
 @transaction.atomic
@@ -112,30 +218,155 @@ def release_event_db(event):
         raise LockReleaseException('Lock is no longer owned by this thread')
 
 
+# Takes a lock in the order of arrival. Every waiting process enters a queue sorted by the time
+# it stops waiting. Since all processes wait for the same time, this is the order in which they
+# arrived. Only the first process in the queue may take the lock, and only while nobody holds a
+# shared lock. Processes that gave up waiting are dropped from the queue once their deadline passed.
+# KEYS[1]: lock, KEYS[2]: queue of waiting processes, KEYS[3]: shared lock holders
+# ARGV[1]: token, ARGV[2]: lock timeout in ms, ARGV[3]: current time in ms, ARGV[4]: deadline in ms
+LUA_ACQUIRE_FAIR = """
+redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[3])
+if not redis.call('zscore', KEYS[2], ARGV[1]) then
+    redis.call('zadd', KEYS[2], ARGV[4], ARGV[1])
+end
+redis.call('pexpire', KEYS[2], ARGV[4] - ARGV[3] + 1000)
+if redis.call('zrange', KEYS[2], 0, 0)[1] ~= ARGV[1] then
+    return 0
+end
+redis.call('zremrangebyscore', KEYS[3], '-inf', ARGV[3])
+if redis.call('zcard', KEYS[3]) > 0 then
+    return 0
+end
+if redis.call('set', KEYS[1], ARGV[1], 'nx', 'px', ARGV[2]) then
+    redis.call('zrem', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Registers a shared lock holder with an expiry date, but only if nobody holds or waits for
+# the exclusive lock. Same KEYS and ARGV as above, without a deadline.
+LUA_ACQUIRE_SHARED = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[3])
+if redis.call('zcard', KEYS[2]) > 0 then
+    return 0
+end
+redis.call('zremrangebyscore', KEYS[3], '-inf', ARGV[3])
+redis.call('zadd', KEYS[3], ARGV[3] + ARGV[2], ARGV[1])
+redis.call('pexpire', KEYS[3], ARGV[2])
+return 1
+"""
+
+
+class RedisFairLock(Lock):
+    """
+    A Redis lock that is handed out in the order of arrival. It can only be acquired while
+    nobody holds a shared lock registered under ``<name>_shared``.
+    """
+
+    def __init__(self, redis, name, timeout):
+        super().__init__(redis=redis, name=name, timeout=timeout)
+        self.queue_name = name + '_queue'
+        self.shared_name = name + '_shared'
+        self.deadline = None
+        self.lua_acquire_fair = redis.register_script(LUA_ACQUIRE_FAIR)
+
+    def do_acquire(self, token):
+        return bool(self.lua_acquire_fair(
+            keys=[self.name, self.queue_name, self.shared_name],
+            args=[token, int(self.timeout * 1000), int(time.time() * 1000), int(self.deadline * 1000)],
+            client=self.redis
+        ))
+
+    def wait_and_acquire(self, lock_type, deadline):
+        token = uuid.uuid4().hex
+        self.deadline = deadline
+        try:
+            _wait_for(lock_type, lambda: self.acquire(False, token=token), deadline)
+        except LockTimeoutException:
+            self.redis.zrem(self.queue_name, token)
+            raise
+
+
+def _redis_event_key(event_id):
+    return 'pretix_event_%s' % event_id
+
+
 def redis_lock_from_event(event):
     from django_redis import get_redis_connection
-    from redis.lock import Lock
 
     if not hasattr(event, '_lock') or not event._lock:
         rc = get_redis_connection("redis")
-        event._lock = Lock(redis=rc, name='pretix_event_%s' % event.id, timeout=LOCK_TIMEOUT)
+        event._lock = RedisFairLock(rc, _redis_event_key(event.id), timeout=LOCK_TIMEOUT)
     return event._lock
 
 
-def lock_event_redis(event):
+def lock_event_redis(event, deadline):
     from redis.exceptions import RedisError
 
     lock = redis_lock_from_event(event)
-    retries = 5
-    for i in range(retries):
-        try:
-            if lock.acquire(False):
-                return True
-        except RedisError:
-            logger.exception('Error locking an event')
+    try:
+        lock.wait_and_acquire('event', deadline)
+    except RedisError:
+        logger.exception('Error locking an event')
+        event._lock = None
+        raise LockTimeoutException()
+    except LockTimeoutException:
+        # Otherwise, the next attempt would assume that we already hold the lock
+        event._lock = None
+        raise
+
+
+def lock_objects_redis(event, keys, deadline):
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
+
+    rc = get_redis_connection("redis")
+    token = uuid.uuid4().hex
+    acquire_shared = rc.register_script(LUA_ACQUIRE_SHARED)
+    locks = []
+    try:
+        # Announce that we are working on parts of the event, so nobody can lock the
+        # event as a whole in the meantime.
+        event_key = _redis_event_key(event.id)
+        _wait_for('event', lambda: acquire_shared(
+            keys=[event_key, event_key + '_queue', event_key + '_shared'],
+            args=[token, LOCK_TIMEOUT * 1000, int(time.time() * 1000)]
+        ), deadline)
+
+        for lock_type, pk in keys:
+            lock = RedisFairLock(rc, '%s_%s_%s' % (event_key, lock_type, pk), timeout=LOCK_TIMEOUT)
+            lock.wait_and_acquire(lock_type, deadline)
+            locks.append(lock)
+    except RedisError:
+        logger.exception('Error locking objects of an event')
+        release_objects_redis(event, (token, locks, None), quiet=True)
+        raise LockTimeoutException()
+    except LockTimeoutException:
+        release_objects_redis(event, (token, locks, None), quiet=True)
+        raise
+    return token, locks, time.time()
+
+
+def release_objects_redis(event, locks, quiet=False):
+    from django_redis import get_redis_connection
+    from redis import RedisError
+
+    token, locks, acquired = locks
+    if acquired:
+        pretix_lock_hold_seconds.observe(max(time.time() - acquired, 0), lock_type='objects')
+    try:
+        for lock in reversed(locks):
+            lock.release()
+        rc = get_redis_connection("redis")
+        rc.zrem(_redis_event_key(event.id) + '_shared', token)
+    except RedisError:
+        logger.exception('Error releasing an object lock')
+        if not quiet:
             raise LockTimeoutException()
-        time.sleep(2 ** i / 100)
-    raise LockTimeoutException()
 
 
 def release_event_redis(event):
@@ -16,7 +16,18 @@ from pretix.helpers.urls import build_absolute_uri
 @app.task(base=TransactionAwareTask)
 @scopes_disabled()
 def notify(logentry_id: int):
-    logentry = LogEntry.all.get(id=logentry_id)
+    _notify(LogEntry.all.get(id=logentry_id))
+
+
+@app.task(base=TransactionAwareTask)
+@scopes_disabled()
+def notify_bulk(logentry_ids: list):
+    for logentry in LogEntry.all.filter(id__in=logentry_ids).select_related('event__organizer', 'user').order_by('pk'):
+        _notify(logentry)
+
+
+def _notify(logentry: LogEntry):
+    logentry_id = logentry.pk
     if not logentry.event:
         return  # Ignore, we only have event-related notifications right now
     types = get_all_notification_types(logentry.event)
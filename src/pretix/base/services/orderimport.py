@@ -9,8 +9,8 @@ from django.utils.translation import gettext as _
 
 from pretix.base.i18n import LazyLocaleException, language
 from pretix.base.models import (
-    CachedFile, Event, InvoiceAddress, Order, OrderPayment, OrderPosition,
-    User,
+    CachedFile, Event, InvoiceAddress, LogEntry, Order, OrderPayment,
+    OrderPosition, Quota, User,
 )
 from pretix.base.orderimport import get_all_columns
 from pretix.base.services.invoices import generate_invoice, invoice_qualified
@@ -115,7 +115,7 @@ def import_orders(event: Event, fileid: str, settings: dict, locale: str, user)
 
         # quota check?
         with event.lock():
-            with transaction.atomic():
+            with transaction.atomic(), LogEntry.bulk_log():
                 for o in orders:
                     o.total = sum([c.price for c in o._positions])  # currently no support for fees
                     if o.total == Decimal('0.00'):
@@ -157,6 +157,10 @@ def import_orders(event: Event, fileid: str, settings: dict, locale: str, user)
                         user=user,
                         data={'source': 'import'}
                     )
+                for status, field in Order.QUOTA_COUNTER_FIELDS.items():
+                    Quota.objects.update_counters(
+                        [p for o in orders if o.status == status for p in o._positions], **{field: 1}
+                    )
 
             for o in orders:
                 with language(o.locale):
@@ -3,11 +3,11 @@ import logging
 from collections import Counter, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
 from django.conf import settings
-from django.core.cache import cache
 from django.db import transaction
 from django.db.models import Exists, F, Max, Min, OuterRef, Q, Sum
 from django.db.models.functions import Coalesce, Greatest
@@ -23,8 +23,8 @@ from pretix.base.channels import get_all_sales_channels
 from pretix.base.email import get_email_context
 from pretix.base.i18n import LazyLocaleException, language
 from pretix.base.models import (
-    CartPosition, Device, Event, GiftCard, Item, ItemVariation, Order,
-    OrderPayment, OrderPosition, Quota, Seat, SeatCategoryMapping, User,
+    CartPosition, Device, Event, GiftCard, Item, ItemVariation, LogEntry,
+    Order, OrderPayment, OrderPosition, Quota, Seat, SeatCategoryMapping, User,
     Voucher,
 )
 from pretix.base.models.event import SubEvent
@@ -43,16 +43,21 @@ from pretix.base.services.invoices import (
 )
 from pretix.base.services.locking import LockTimeoutException, NoLockManager
 from pretix.base.services.mail import SendMailException
+from pretix.base.services.periodic import filter_shard, periodic_job
 from pretix.base.services.pricing import get_price
 from pretix.base.services.tasks import ProfiledEventTask, ProfiledTask
+from pretix.base.settings import load_settings
 from pretix.base.signals import (
     allow_ticket_download, order_approved, order_canceled, order_changed,
     order_denied, order_expired, order_fee_calculation, order_paid,
-    order_placed, order_split, periodic_task, validate_order,
+    order_placed, order_split, validate_order,
 )
 from pretix.celery_app import app
 from pretix.helpers.models import modelcopy
 
+# Number of orders expired in one transaction, whose log entries are written with a single query
+EXPIRE_CHUNK_SIZE = 50
+
 error_messages = {
     'unavailable': _('Some of the products you selected were no longer available. '
                      'Please see below for details.'),
@@ -313,7 +318,8 @@ def _cancel_order(order, user=None, send_mail: bool=True, api_token=None, device
 
         if cancellation_fee:
             with order.event.lock():
-                for position in order.positions.all():
+                positions = list(order.positions.all())
+                for position in positions:
                     if position.voucher:
                         Voucher.objects.filter(pk=position.voucher.pk).update(redeemed=Greatest(0, F('redeemed') - 1))
                     position.canceled = True
@@ -321,6 +327,7 @@ def _cancel_order(order, user=None, send_mail: bool=True, api_token=None, device
                 for fee in order.fees.all():
                     fee.canceled = True
                     fee.save(update_fields=['canceled'])
+                order._update_quota_counters(positions, removed_status=order.status)
 
                 f = OrderFee(
                     fee_type=OrderFee.FEE_TYPE_CANCELLATION,
@@ -753,6 +760,7 @@ def _create_order(event: Event, email: str, positions: List[CartPosition], now_d
             )
 
         OrderPosition.transform_cart_positions(positions, order)
+        order._update_quota_counters(order.positions.all(), added_status=order.status)
         order.log_action('pretix.event.order.placed')
         if order.require_approval:
             order.log_action('pretix.event.order.placed.require_approval')
@@ -839,6 +847,14 @@ def _perform_order(event: Event, payment_provider: str, position_ids: List[str],
         # creating this order shouldn't be prone to any race conditions and we don't need to lock the event.
         locked = True
         lockfn = event.lock
+        if settings.PRETIX_OBJECT_LOCKING:
+            lock_positions = list(positions)
+            lockfn = partial(
+                event.lock,
+                quotas=Quota.objects.for_positions(lock_positions).filter(size__isnull=False),
+                vouchers=Voucher.objects.filter(pk__in={p.voucher_id for p in lock_positions if p.voucher_id}),
+                seats=Seat.objects.filter(pk__in={p.seat_id for p in lock_positions if p.seat_id}),
+            )
 
     with lockfn() as now_dt:
         positions = list(
@@ -898,39 +914,51 @@ def _perform_order(event: Event, payment_provider: str, position_ids: List[str],
     return order.id
 
 
-@receiver(signal=periodic_task)
+@periodic_job(sharded=True)
 @scopes_disabled()
 def expire_orders(sender, **kwargs):
     event_id = None
     expire = None
 
-    for o in Order.objects.filter(expires__lt=now(), status=Order.STATUS_PENDING,
-                                  require_approval=False).select_related('event').order_by('event_id'):
-        if o.event_id != event_id:
-            expire = o.event.settings.get('payment_term_expire_automatically', as_type=bool)
-            event_id = o.event_id
-        if expire:
+    qs = Order.objects.filter(expires__lt=now(), status=Order.STATUS_PENDING, require_approval=False)
+    with LogEntry.bulk_log():
+        chunk = []
+        for o in filter_shard(qs, 'event_id', **kwargs).select_related('event').order_by('event_id', 'pk'):
+            if o.event_id != event_id:
+                expire = o.event.settings.get('payment_term_expire_automatically', as_type=bool)
+                event_id = o.event_id
+            if expire:
+                chunk.append(o)
+            if len(chunk) >= EXPIRE_CHUNK_SIZE:
+                _expire_orders_chunk(chunk)
+                chunk = []
+        _expire_orders_chunk(chunk)
+
+
+def _expire_orders_chunk(orders):
+    with transaction.atomic():
+        for o in orders:
             mark_order_expired(o)
+        # Store the log entries of all orders at once, together with their status changes
+        LogEntry.flush_bulk_log()
 
 
-@receiver(signal=periodic_task)
+@periodic_job(sharded=True)
 @scopes_disabled()
 def send_expiry_warnings(sender, **kwargs):
     today = now().replace(hour=0, minute=0, second=0)
-    days = None
-    settings = None
-    event_id = None
 
-    for o in Order.objects.filter(
+    qs = Order.objects.filter(
         expires__gte=today, expiry_reminder_sent=False, status=Order.STATUS_PENDING,
         datetime__lte=now() - timedelta(hours=2), require_approval=False
-    ).only('pk', 'event_id', 'expires').order_by('event_id'):
-        if event_id != o.event_id:
-            settings = o.event.settings
-            days = cache.get_or_set('{}:{}:setting_mail_days_order_expire_warning'.format('event', o.event_id),
-                                    default=lambda: settings.get('mail_days_order_expire_warning', as_type=int),
-                                    timeout=3600)
-            event_id = o.event_id
+    )
+    orders = list(filter_shard(qs, 'event_id', **kwargs).only('pk', 'event_id', 'expires').order_by('event_id'))
+    event_settings = {
+        e.pk: s for e, s in load_settings(Event.objects.filter(pk__in={o.event_id for o in orders})).items()
+    }
+    for o in orders:
+        settings = event_settings[o.event_id]
+        days = settings.get('mail_days_order_expire_warning', as_type=int)
 
         if days and (o.expires - today).days <= days:
             with transaction.atomic():
@@ -958,7 +986,7 @@ def send_expiry_warnings(sender, **kwargs):
                         logger.exception('Reminder email could not be sent')
 
 
-@receiver(signal=periodic_task)
+@periodic_job(sharded=True)
 @scopes_disabled()
 def send_download_reminders(sender, **kwargs):
     today = now().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -973,6 +1001,7 @@ def send_download_reminders(sender, **kwargs):
         datetime__lte=now() - timedelta(hours=2),
         first_date__gte=today,
     ).only('pk', 'event_id').order_by('event_id')
+    qs = filter_shard(qs, 'event_id', **kwargs)
     event_id = None
     days = None
     event = None
@@ -1089,6 +1118,7 @@ class OrderChangeManager:
         self._totaldiff = 0
         self._quotadiff = Counter()
         self._seatdiff = Counter()
+        self._canceled = set()
         self._operations = []
         self.notify = notify
         self._invoice_dirty = False
@@ -1196,7 +1226,11 @@ class OrderChangeManager:
 
     def cancel(self, position: OrderPosition):
         self._totaldiff -= position.price
-        self._quotadiff.subtract(position.quotas)
+        # Add-ons are canceled together with their position, see _perform_operations
+        for p in [position] + list(position.addons.filter(canceled=False)):
+            if p.pk not in self._canceled:
+                self._canceled.add(p.pk)
+                self._quotadiff.subtract(p.quotas)
         self._operations.append(self.CancelOperation(position))
         if position.seat:
             self._seatdiff.subtract([position.seat])
@@ -1748,6 +1782,9 @@ class OrderChangeManager:
                 self._check_seats()
                 self._check_complete_cancel()
                 self._perform_operations()
+                Quota.objects.apply_counter_deltas({
+                    q: {Order.QUOTA_COUNTER_FIELDS[self.order.status]: d} for q, d in self._quotadiff.items()
+                })
             self._recalculate_total_and_payment_fee()
             self._reissue_invoice()
             self._clear_tickets_cache()
@@ -0,0 +1,143 @@
+import logging
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from pretix.base.metrics import (
+    pretix_periodic_job_duration_seconds, pretix_periodic_job_lag_seconds,
+    pretix_periodic_job_runs_total,
+)
+from pretix.base.services.tasks import ProfiledTask
+from pretix.base.signals import periodic_task
+from pretix.celery_app import app
+
+logger = logging.getLogger(__name__)
+
+# Number of seconds after which we assume that a job died without releasing its lock
+DEFAULT_TIMEOUT = 3600
+
+# Sender of the periodic_task signal when it is sent out by the scheduler
+SIGNAL_SENDER = object()
+
+_jobs = {}
+
+
+def periodic_job(interval: timedelta=None, sharded=False, timeout: int=DEFAULT_TIMEOUT):
+    """
+    Registers a function as a periodic job. Every job runs as its own background task and never twice at
+    the same time. It is called with ``sender=None``.
+
+    If the function is also connected to the ``periodic_task`` signal, it is ignored when the signal is
+    sent out, so it does not run twice.
+
+    :param interval: Minimum time between two runs of the job. By default, it runs every time the periodic
+                     tasks are triggered.
+    :param sharded: If set, the job is split into ``PRETIX_PERIODIC_SHARDS`` tasks that run in parallel. Each of
+                    them is called with the keyword arguments ``shard`` and ``shards`` and should only process
+                    its part of the events, e.g. using ``filter_shard``.
+    :param timeout: Number of seconds after which a run is assumed to have crashed and the next one may start.
+    """
+    def decorator(func):
+        @wraps(func)
+        def job(sender, **kwargs):
+            if sender is SIGNAL_SENDER:
+                return
+            return func(sender, **kwargs)
+
+        job.periodic_interval = interval
+        job.periodic_sharded = sharded
+        job.periodic_timeout = timeout
+        _jobs[get_job_name(job)] = job
+        return job
+    return decorator
+
+
+def filter_shard(qs, field, shard=0, shards=1, **kwargs):
+    """
+    Restricts a queryset to the objects belonging to a shard of a sharded job, based on an integer field like
+    ``event_id``.
+    """
+    if shards <= 1:
+        return qs
+    return qs.annotate(_shard=F(field) % shards).filter(_shard=shard)
+
+
+def get_job_name(func):
+    return '{}.{}'.format(func.__module__, func.__name__)
+
+
+def get_jobs():
+    return dict(_jobs)
+
+
+@periodic_job()
+def send_periodic_task(sender, **kwargs):
+    """
+    Runs all receivers of the ``periodic_task`` signal that are not registered as periodic jobs themselves,
+    one after another. Errors are logged and the first one is raised after all receivers ran.
+    """
+    errors = []
+    for recv, resp in periodic_task.send_robust(SIGNAL_SENDER):
+        if isinstance(resp, Exception):
+            logger.error('Receiver {} of periodic_task failed.'.format(recv), exc_info=resp)
+            errors.append(resp)
+    if errors:
+        raise errors[0]
+
+
+def schedule_jobs(names=None):
+    """
+    Sends out a task for every job that is due and returns the results of these tasks.
+    """
+    results = []
+    for name, func in get_jobs().items():
+        if names and name not in names:
+            continue
+        interval = func.periodic_interval
+        if interval and not cache.add('pretix_periodic_job_due_{}'.format(name), 'true',
+                                      timeout=interval.total_seconds()):
+            continue
+        shards = settings.PRETIX_PERIODIC_SHARDS if func.periodic_sharded else 1
+        for shard in range(shards):
+            results.append(run_periodic_job.apply_async(kwargs={
+                'name': name, 'shard': shard, 'shards': shards, 'scheduled': time.time()
+            }))
+    return results
+
+
+@app.task(base=ProfiledTask)
+def run_periodic_job(name: str, shard: int=0, shards: int=1, scheduled: float=None):
+    func = get_jobs().get(name)
+    if not func:
+        logger.warning('Periodic job {} does not exist (any more).'.format(name))
+        return
+    if scheduled:
+        pretix_periodic_job_lag_seconds.set(max(time.time() - scheduled, 0), job=name)
+
+    lock = 'pretix_periodic_job_running_{}_{}'.format(name, shard)
+    token = uuid.uuid4().hex
+    if not cache.add(lock, token, timeout=func.periodic_timeout):
+        logger.info('Skipping periodic job {} since it is still running.'.format(name))
+        pretix_periodic_job_runs_total.inc(1, job=name, status='skipped')
+        return
+
+    t0 = time.perf_counter()
+    try:
+        if shards > 1:
+            func(sender=None, shard=shard, shards=shards)
+        else:
+            func(sender=None)
+    except Exception:
+        pretix_periodic_job_runs_total.inc(1, job=name, status='error')
+        raise
+    finally:
+        # If this run took longer than the timeout, the lock might already belong to the next run
+        if cache.get(lock) == token:
+            cache.delete(lock)
+    pretix_periodic_job_runs_total.inc(1, job=name, status='success')
+    pretix_periodic_job_duration_seconds.observe(time.perf_counter() - t0, job=name)
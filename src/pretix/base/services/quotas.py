@@ -1,18 +1,19 @@
 from datetime import timedelta
 
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Max, Q
-from django.dispatch import receiver
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
-from pretix.base.models import Event, LogEntry
+from pretix.base.metrics import pretix_quota_counter_drift_total
+from pretix.base.models import Event, LogEntry, Quota
+from pretix.base.models.items import QuotaCounter
+from pretix.base.services.periodic import periodic_job
 from pretix.celery_app import app
 
-from ..signals import periodic_task
 
-
-@receiver(signal=periodic_task)
+@periodic_job()
 def build_all_quota_caches(sender, **kwargs):
     refresh_quota_caches.apply_async()
 
@@ -40,5 +41,37 @@ def refresh_quota_caches():
             Q(subevent__date_to__isnull=False, subevent__date_to__gte=now() - timedelta(days=14)) |
             Q(subevent__date_from__gte=now() - timedelta(days=14))
         )
+        if settings.PRETIX_QUOTA_COUNTERS:
+            reconcile_quota_counters(e)
         for q in quotas:
             q.availability()
+
+
+def reconcile_quota_counters(event):
+    """
+    Compares the stored counters of all quotas of an event with freshly computed numbers and
+    repairs the counters that got out of sync. Every quota is locked and counted on its own, so
+    orders of the event are only blocked for the duration of a single count.
+    """
+    quota_ids = QuotaCounter.objects.filter(quota__event_id=event.pk).order_by('quota_id').values_list(
+        'quota_id', flat=True
+    )
+    for quota_id in list(quota_ids):
+        with transaction.atomic():
+            try:
+                counter = QuotaCounter.objects.select_for_update().select_related('quota', 'quota__event').get(
+                    quota_id=quota_id
+                )
+            except QuotaCounter.DoesNotExist:
+                # Reset in the meantime, it will be created from a fresh count on next use
+                continue
+            counts = Quota.objects._compute_counts([counter.quota], now(), True, fields=QuotaCounter.FIELDS)
+            counts = counts[counter.quota]
+            drifted = [k for k in QuotaCounter.FIELDS if getattr(counter, k) != counts[k]]
+            if not drifted:
+                continue
+            for k in drifted:
+                pretix_quota_counter_drift_total.inc(counter=k)
+            for k, v in counts.items():
+                setattr(counter, k, v)
+            counter.save()
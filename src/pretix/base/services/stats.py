@@ -1,16 +1,23 @@
+from collections import defaultdict
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from typing import Any, Dict, Iterable, List, Tuple
 
-from django.db.models import (
-    Case, Count, DateTimeField, F, Max, OuterRef, Subquery, Sum, Value, When,
-)
+import pytz
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Q, Sum
 from django.utils.timezone import make_aware
 from django.utils.translation import ugettext_lazy as _
+from django_scopes import scopes_disabled
 
-from pretix.base.models import Event, Item, ItemCategory, Order, OrderPosition
+from pretix.base.models import (
+    Event, Item, ItemCategory, Order, OrderPosition, OrderRollup, SalesRollup,
+    SalesRollupInvalidation,
+)
 from pretix.base.models.event import SubEvent
 from pretix.base.models.orders import OrderFee, OrderPayment
+from pretix.base.services.periodic import filter_shard, periodic_job
 from pretix.base.signals import order_fee_type_name
 
 
@@ -75,6 +82,136 @@ def dictsum(*dicts) -> dict:
     return res
 
 
+def _add_to(d: dict, key, value: Tuple):
+    d[key] = tuplesum([d[key], value]) if key in d else value
+
+
+def _rebuild_sales_rollups(event: Event, tz, day: date=None):
+    """
+    Rebuilds the rollup rows of all orders of the event placed on the given day or of all orders, if no day is given.
+    """
+    orders = Order.objects.filter(event=event)
+    if day:
+        orders = orders.filter(
+            datetime__gte=make_aware(datetime.combine(day, time(0, 0)), tz),
+            datetime__lt=make_aware(datetime.combine(day + timedelta(days=1), time(0, 0)), tz),
+        )
+
+    order_info = {
+        pk: (dt.astimezone(tz).date(), status, total)
+        for pk, dt, status, total in orders.values_list('pk', 'datetime', 'status', 'total').iterator()
+    }
+    payment_dates = {
+        o: m.astimezone(tz).date()
+        for o, m in OrderPayment.objects.filter(
+            order__in=orders,
+            state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
+            payment_date__isnull=False
+        ).values('order').annotate(m=Max('payment_date')).order_by().values_list('order', 'm')
+    }
+
+    sales = {}
+    subevents = defaultdict(set)
+    positions = OrderPosition.all.filter(order__in=orders).values_list(
+        'order_id', 'canceled', 'subevent_id', 'item_id', 'variation_id', 'price', 'tax_value'
+    )
+    for order_id, canceled, subevent_id, item_id, variation_id, price, tax_value in positions.iterator():
+        if order_id not in order_info:
+            # Order has been created in the meantime, it will be part of the next refresh
+            continue
+        order_date, status, total = order_info[order_id]
+        key = (order_date, payment_dates.get(order_id), subevent_id, item_id, variation_id, None, None, status,
+               canceled)
+        _add_to(sales, key, (1, price, price - tax_value))
+        if subevent_id and not canceled:
+            subevents[order_id].add(subevent_id)
+
+    fees = OrderFee.all.filter(order__in=orders).values_list(
+        'order_id', 'canceled', 'fee_type', 'internal_type', 'value', 'tax_value'
+    )
+    for order_id, canceled, fee_type, internal_type, value, tax_value in fees.iterator():
+        if order_id not in order_info:
+            continue
+        order_date, status, total = order_info[order_id]
+        key = (order_date, payment_dates.get(order_id), None, None, None, fee_type, internal_type, status, canceled)
+        _add_to(sales, key, (1, value, value - tax_value))
+
+    orders_by_date = {}
+    for order_id, (order_date, status, total) in order_info.items():
+        for subevent_id in [None] + sorted(subevents[order_id]):
+            _add_to(orders_by_date, (order_date, payment_dates.get(order_id), subevent_id, status), (1, total))
+
+    with transaction.atomic():
+        sqs = SalesRollup.objects.filter(event=event)
+        oqs = OrderRollup.objects.filter(event=event)
+        if day:
+            sqs = sqs.filter(order_date=day)
+            oqs = oqs.filter(order_date=day)
+        sqs.delete()
+        oqs.delete()
+        SalesRollup.objects.bulk_create([
+            SalesRollup(
+                event=event, order_date=k[0], payment_date=k[1], subevent_id=k[2], item_id=k[3], variation_id=k[4],
+                fee_type=k[5], fee_internal_type=k[6], status=k[7], canceled=k[8], count=v[0], gross=v[1], net=v[2]
+            ) for k, v in sales.items()
+        ], batch_size=1000)
+        OrderRollup.objects.bulk_create([
+            OrderRollup(
+                event=event, order_date=k[0], payment_date=k[1], subevent_id=k[2], status=k[3], count=v[0],
+                total=v[1]
+            ) for k, v in orders_by_date.items()
+        ], batch_size=1000)
+
+
+@scopes_disabled()
+def refresh_sales_rollups(event: Event):
+    """
+    Brings the ``SalesRollup`` and ``OrderRollup`` rows of an event up to date by rebuilding every day on which an
+    order has been changed since the last refresh. This is called before the rollups are read, the periodic job
+    keeps the amount of work left for that small.
+    """
+    markers = list(SalesRollupInvalidation.objects.filter(event=event).values_list('pk', 'order_datetime', 'marked'))
+    tzname = event.settings.timezone
+    # The rollups need to be rebuilt completely if they have never been built or the days are no longer correct
+    full = event.settings.get('sales_rollup_timezone') != tzname or any(dt is None for pk, dt, m in markers)
+    if not markers and not full:
+        return
+
+    lock = 'pretix_sales_rollup_refresh_{}'.format(event.pk)
+    if not cache.add(lock, 'true', timeout=600):
+        # Somebody else is already refreshing the rollups, we rather show slightly outdated numbers than wait
+        return
+    try:
+        tz = pytz.timezone(tzname)
+        if full:
+            _rebuild_sales_rollups(event, tz)
+            event.settings.set('sales_rollup_timezone', tzname)
+        else:
+            for day in sorted({dt.astimezone(tz).date() for pk, dt, m in markers}):
+                _rebuild_sales_rollups(event, tz, day)
+
+        # If an order has been changed again in the meantime, its marker has a new time and needs to stay
+        for i in range(0, len(markers), 500):
+            q = Q()
+            for pk, dt, marked in markers[i:i + 500]:
+                q |= Q(pk=pk, marked=marked)
+            SalesRollupInvalidation.objects.filter(q).delete()
+    finally:
+        cache.delete(lock)
+
+
+@periodic_job(sharded=True)
+@scopes_disabled()
+def refresh_all_sales_rollups(sender, **kwargs):
+    # Events with rollups are included even without markers, since a changed timezone of the event or its
+    # organizer does not touch any order but still moves orders to different days.
+    events = Event.objects.filter(
+        Q(pk__in=SalesRollupInvalidation.objects.values('event_id')) | Q(pk__in=OrderRollup.objects.values('event_id'))
+    ).select_related('organizer')
+    for event in filter_shard(events, 'pk', **kwargs).iterator():
+        refresh_sales_rollups(event)
+
+
 def order_overview(
         event: Event, subevent: SubEvent=None, date_filter='', date_from=None, date_until=None, fees=False,
         admission_only=False
@@ -85,54 +222,35 @@ def order_overview(
         'variations'
     ).order_by('category__position', 'category_id', 'position', 'name')
 
-    qs = OrderPosition.all
-    if subevent:
-        qs = qs.filter(subevent=subevent)
-    if admission_only:
-        qs = qs.filter(item__admission=True)
-        items = items.filter(admission=True)
+    refresh_sales_rollups(event)
+    rollups = SalesRollup.objects.filter(event=event)
 
-    if date_from and isinstance(date_from, date):
-        date_from = make_aware(datetime.combine(
-            date_from,
-            time(hour=0, minute=0, second=0, microsecond=0)
-        ), event.timezone)
-
-    if date_until and isinstance(date_until, date):
-        date_until = make_aware(datetime.combine(
-            date_until + timedelta(days=1),
-            time(hour=0, minute=0, second=0, microsecond=0)
-        ), event.timezone)
+    if isinstance(date_from, datetime):
+        date_from = date_from.date()
+    if isinstance(date_until, datetime):
+        date_until = date_until.date()
 
     if date_filter == 'order_date':
         if date_from:
-            qs = qs.filter(order__datetime__gte=date_from)
+            rollups = rollups.filter(order_date__gte=date_from)
         if date_until:
-            qs = qs.filter(order__datetime__lt=date_until)
+            rollups = rollups.filter(order_date__lte=date_until)
     elif date_filter == 'last_payment_date':
-        p_date = OrderPayment.objects.filter(
-            order=OuterRef('order'),
-            state__in=[OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED],
-            payment_date__isnull=False
-        ).values('order').annotate(
-            m=Max('payment_date')
-        ).values('m').order_by()
-        qs = qs.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
         if date_from:
-            qs = qs.filter(payment_date__gte=date_from)
+            rollups = rollups.filter(payment_date__gte=date_from)
         if date_until:
-            qs = qs.filter(payment_date__lt=date_until)
-
-    counters = qs.filter(
-        order__event=event
-    ).annotate(
-        status=Case(
-            When(canceled=True, then=Value('c')),
-            default=F('order__status')
-        )
-    ).values(
-        'item', 'variation', 'status'
-    ).annotate(cnt=Count('id'), price=Sum('price'), tax_value=Sum('tax_value')).order_by()
+            rollups = rollups.filter(payment_date__lte=date_until)
+
+    qs = rollups.filter(item__isnull=False)
+    if subevent:
+        qs = qs.filter(subevent=subevent)
+    if admission_only:
+        qs = qs.filter(item__admission=True)
+        items = items.filter(admission=True)
+
+    counters = qs.values(
+        'item', 'variation', 'status', 'canceled'
+    ).annotate(cnt=Sum('count'), price=Sum('gross'), net=Sum('net')).order_by()
 
     states = {
         'canceled': Order.STATUS_CANCELED,
@@ -140,12 +258,11 @@ def order_overview(
         'pending': Order.STATUS_PENDING,
         'expired': Order.STATUS_EXPIRED,
     }
-    num = {}
+    num = {l: {} for l in states}
     for l, s in states.items():
-        num[l] = {
-            (p['item'], p['variation']): (p['cnt'], p['price'], p['price'] - p['tax_value'])
-            for p in counters if p['status'] == s
-        }
+        for p in counters:
+            if (Order.STATUS_CANCELED if p['canceled'] else p['status']) == s:
+                _add_to(num[l], (p['item'], p['variation']), (p['cnt'], p['price'], p['net']))
 
     num['total'] = dictsum(num['pending'], num['paid'])
 
@@ -194,34 +311,15 @@ def order_overview(
     payment_items = []
 
     if not subevent and fees:
-        qs = OrderFee.all.filter(
-            order__event=event
-        ).annotate(
-            status=Case(
-                When(canceled=True, then=Value('c')),
-                default=F('order__status')
-            )
-        )
-        if date_filter == 'order_date':
-            if date_from:
-                qs = qs.filter(order__datetime__gte=date_from)
-            if date_until:
-                qs = qs.filter(order__datetime__lt=date_until)
-        elif date_filter == 'last_payment_date':
-            qs = qs.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
-            if date_from:
-                qs = qs.filter(payment_date__gte=date_from)
-            if date_until:
-                qs = qs.filter(payment_date__lt=date_until)
-        counters = qs.values(
-            'fee_type', 'internal_type', 'status'
-        ).annotate(cnt=Count('id'), value=Sum('value'), tax_value=Sum('tax_value')).order_by()
+        counters = rollups.filter(item__isnull=True).values(
+            'fee_type', 'fee_internal_type', 'status', 'canceled'
+        ).annotate(cnt=Sum('count'), value=Sum('gross'), net=Sum('net')).order_by()
 
+        num = {l: {} for l in states}
         for l, s in states.items():
-            num[l] = {
-                (o['fee_type'], o['internal_type']): (o['cnt'], o['value'], o['value'] - o['tax_value'])
-                for o in counters if o['status'] == s
-            }
+            for o in counters:
+                if (Order.STATUS_CANCELED if o['canceled'] else o['status']) == s:
+                    _add_to(num[l], (o['fee_type'], o['fee_internal_type']), (o['cnt'], o['value'], o['net']))
         num['total'] = dictsum(num['pending'], num['paid'])
 
         provider_names = {
@@ -12,10 +12,12 @@ import os
 import random
 import time
 
+from celery.signals import task_postrun, worker_process_shutdown
 from django.conf import settings
 from django.db import transaction
 from django_scopes import scope, scopes_disabled
 
+from pretix.base import metrics
 from pretix.base.metrics import (
     pretix_task_duration_seconds, pretix_task_runs_total,
 )
@@ -118,3 +120,14 @@ class TransactionAwareProfiledEventTask(ProfiledEventTask):
         transaction.on_commit(
             lambda: super(TransactionAwareProfiledEventTask, self).apply_async(*args, **kwargs)
         )
+
+
+@worker_process_shutdown.connect
+def flush_metrics(**kwargs):
+    # Pool processes are not always shut down in a way that runs atexit handlers
+    metrics.buffer.flush()
+
+
+@task_postrun.connect
+def flush_metrics_after_task(**kwargs):
+    metrics.buffer.flush_if_due()
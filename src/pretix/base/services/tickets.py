@@ -1,24 +1,34 @@
 import logging
 import os
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils.timezone import now
 from django.utils.translation import ugettext as _
 from django_scopes import scopes_disabled
 
 from pretix.base.i18n import language
+from pretix.base.metrics import pretix_ticket_cache_requests_total
 from pretix.base.models import (
     CachedCombinedTicket, CachedTicket, Event, InvoiceAddress, Order,
     OrderPosition,
 )
-from pretix.base.services.tasks import EventTask, ProfiledTask
+from pretix.base.services.tasks import (
+    EventTask, ProfiledTask, TransactionAwareProfiledEventTask,
+)
 from pretix.base.settings import PERSON_NAME_SCHEMES
-from pretix.base.signals import allow_ticket_download, register_ticket_outputs
+from pretix.base.signals import (
+    allow_ticket_download, order_paid, register_ticket_outputs,
+)
 from pretix.celery_app import app
 from pretix.helpers.database import rolledback_transaction
 
 logger = logging.getLogger(__name__)
 
+# Pre-generation of ticket files is never urgent, so we don't want it to keep a worker busy for too long
+PREGENERATION_RATE_LIMIT = '10/s'
+PREGENERATION_CHUNK_SIZE = 50
+
 
 def generate_orderposition(order_position: int, provider: str):
     order_position = OrderPosition.objects.select_related('order', 'order__event').get(id=order_position)
@@ -102,7 +112,17 @@ def preview(event: int, provider: str):
                 return prov.generate(p)
 
 
-def get_tickets_for_order(order, base_position=None):
+def count_ticket_cache_access(provider: str, hit: bool):
+    if settings.METRICS_ENABLED:
+        pretix_ticket_cache_requests_total.inc(1, provider=provider, status='hit' if hit else 'miss')
+
+
+def get_tickets_for_order(order, base_position=None, pregenerate=False):
+    """
+    Returns a list of tuples of file names and ``CachedTicket`` or ``CachedCombinedTicket`` objects for all tickets
+    of the given order, generating all files that are not yet cached. Set ``pregenerate`` if you only call this to
+    fill the cache, so the call is not recorded in the cache hit rate metrics.
+    """
     can_download = all([r for rr, r in allow_ticket_download.send(order.event, order=order)])
     if not can_download:
         return []
@@ -135,6 +155,8 @@ def get_tickets_for_order(order, base_position=None):
                 ct = CachedCombinedTicket.objects.filter(
                     order=order, provider=p.identifier, file__isnull=False
                 ).last()
+                if not pregenerate:
+                    count_ticket_cache_access(p.identifier, ct and ct.file)
                 if not ct or not ct.file:
                     retval = generate_order(order.pk, p.identifier)
                     if not retval:
@@ -154,6 +176,8 @@ def get_tickets_for_order(order, base_position=None):
                     ct = CachedTicket.objects.filter(
                         order_position=pos, provider=p.identifier, file__isnull=False
                     ).last()
+                    if not pregenerate:
+                        count_ticket_cache_access(p.identifier, ct and ct.file)
                     if not ct or not ct.file:
                         retval = generate_orderposition(pos.pk, p.identifier)
                         if not retval:
@@ -191,7 +215,66 @@ def invalidate_cache(event: Event, item: int=None, provider: str=None, order: in
         qs = qs.filter(order_position__order_id=order)
         qsc = qsc.filter(order_id=order)
 
+    orders = set(qs.values_list('order_position__order_id', flat=True))
+    orders |= set(qsc.values_list('order_id', flat=True))
+
     for ct in qs:
         ct.delete()
     for ct in qsc:
         ct.delete()
+
+    if settings.HAS_CELERY and orders:
+        # Re-generate the files we just deleted in the background, so nobody needs to wait for them later
+        pregenerate_invalidated_tickets.apply_async(kwargs={'event': event.pk, 'item': item, 'order': order,
+                                                            'after': min(orders) - 1, 'until': max(orders)})
+
+
+@app.task(base=EventTask)
+def pregenerate_invalidated_tickets(event: Event, item: int=None, order: int=None, after: int=0, until: int=None):
+    """
+    Schedules the pre-generation of the ticket files of the paid orders with a primary key in the range
+    (``after``, ``until``] that are matched by the same filters as in ``invalidate_cache``. Every run only handles
+    one chunk of orders and schedules itself again for the next one, so even the invalidation of all files of a
+    large event never needs to load all orders at once.
+    """
+    qs = event.orders.filter(status=Order.STATUS_PAID, pk__gt=after)
+    if until:
+        qs = qs.filter(pk__lte=until)
+    if item:
+        qs = qs.filter(all_positions__item_id=item)
+    if order:
+        qs = qs.filter(pk=order)
+    chunk = list(qs.order_by('pk').values_list('pk', flat=True).distinct()[:PREGENERATION_CHUNK_SIZE])
+    if not chunk:
+        return
+
+    pregenerate_tickets.apply_async(kwargs={'event': event.pk, 'orders': chunk})
+    if len(chunk) == PREGENERATION_CHUNK_SIZE:
+        pregenerate_invalidated_tickets.apply_async(kwargs={'event': event.pk, 'item': item, 'order': order,
+                                                            'after': chunk[-1], 'until': until})
+
+
+@app.task(base=TransactionAwareProfiledEventTask, rate_limit=PREGENERATION_RATE_LIMIT)
+def pregenerate_tickets(event: Event, order: int=None, orders: list=None):
+    """
+    Generates all ticket files of the given paid orders that are not yet cached.
+    """
+    order_ids = list(orders or [])
+    if order:
+        order_ids.append(order)
+    for order in event.orders.filter(pk__in=order_ids, status=Order.STATUS_PAID):
+        # Warm up the files used for emails to the order contact and the combined download …
+        get_tickets_for_order(order, pregenerate=True)
+        # … as well as the files of the individual positions
+        for p in order.positions_with_tickets:
+            if not p.addon_to_id:
+                get_tickets_for_order(order, base_position=p, pregenerate=True)
+
+
+def signal_listener_pregenerate_tickets(sender: Event, order: Order, **kwargs):
+    # Without a task worker, this would just delay the payment confirmation
+    if settings.HAS_CELERY:
+        pregenerate_tickets.apply_async(kwargs={'event': sender.pk, 'order': order.pk})
+
+
+order_paid.connect(signal_listener_pregenerate_tickets, dispatch_uid="pretixbase_order_paid_pregenerate_tickets")
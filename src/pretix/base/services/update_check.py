@@ -3,7 +3,6 @@ import uuid
 from datetime import timedelta
 
 import requests
-from django.dispatch import receiver
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _, ugettext_noop
 from django_scopes import scopes_disabled
@@ -13,13 +12,13 @@ from pretix import __version__
 from pretix.base.models import Event
 from pretix.base.plugins import get_all_plugins
 from pretix.base.services.mail import mail
+from pretix.base.services.periodic import periodic_job
 from pretix.base.settings import GlobalSettingsObject
-from pretix.base.signals import periodic_task
 from pretix.celery_app import app
 from pretix.helpers.urls import build_absolute_uri
 
 
-@receiver(signal=periodic_task)
+@periodic_job()
 def run_update_check(sender, **kwargs):
     gs = GlobalSettingsObject()
     if not gs.settings.update_check_perform:
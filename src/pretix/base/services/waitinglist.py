@@ -1,12 +1,12 @@
 import sys
 
-from django.dispatch import receiver
 from django_scopes import scopes_disabled
 
 from pretix.base.models import Event, User, WaitingListEntry
 from pretix.base.models.waitinglist import WaitingListException
+from pretix.base.services.periodic import filter_shard, periodic_job
 from pretix.base.services.tasks import EventTask
-from pretix.base.signals import periodic_task
+from pretix.base.settings import load_settings
 from pretix.celery_app import app
 
 
@@ -70,12 +70,11 @@ def assign_automatically(event: Event, user_id: int=None, subevent_id: int=None)
     return sent
 
 
-@receiver(signal=periodic_task)
+@periodic_job(sharded=True)
 @scopes_disabled()
 def process_waitinglist(sender, **kwargs):
-    qs = Event.objects.filter(
-        live=True
-    ).prefetch_related('_settings_objects', 'organizer___settings_objects').select_related('organizer')
-    for e in qs:
-        if e.settings.waiting_list_auto and (e.presale_is_running or e.has_subevents):
+    events = list(filter_shard(Event.objects.filter(live=True), 'pk', **kwargs))
+    event_settings = load_settings(events)
+    for e in events:
+        if event_settings[e].waiting_list_auto and (e.presale_is_running or e.has_subevents):
             assign_automatically.apply_async(args=(e.pk,))
@@ -1,15 +1,16 @@
 import json
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from datetime import datetime
 from decimal import Decimal
-from typing import Any
+from typing import Any, Dict
 
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files import File
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db.models import Model
+from django.db.models import Model, prefetch_related_objects
 from django.utils.translation import (
     pgettext, pgettext_lazy, ugettext_lazy as _, ugettext_noop,
 )
@@ -1751,6 +1752,100 @@ class SettingsSandbox:
         self._event.settings.set(self._convert_key(key), value)
 
 
+# Cache key format and timeout used by HierarkeyProxy._cache in django-hierarkey 1.0
+HIERARKEY_CACHE_KEY = 'hierarkey_{}_{}'
+HIERARKEY_CACHE_TIMEOUT = 1800
+# Private attributes of HierarkeyProxy that load_settings relies on
+HIERARKEY_PROXY_ATTRIBUTES = ('_cached_obj', '_cache_namespace', '_obj', '_parent', '_type')
+
+
+class SettingsView:
+    """
+    Read-only access to the settings of an event or organizer as returned by :py:func:`load_settings`.
+    Every value is parsed at most once and then kept for the lifetime of this object, so it should only
+    be kept around for the duration of a request or task.
+    """
+    __slots__ = ('_proxy', '_values')
+
+    def __init__(self, proxy):
+        object.__setattr__(self, '_proxy', proxy)
+        object.__setattr__(self, '_values', {})
+
+    def get(self, key: str, default=None, as_type: type=None, binary_file=False) -> Any:
+        if default is not None:
+            return self._proxy.get(key, default=default, as_type=as_type, binary_file=binary_file)
+        try:
+            return self._values[key, as_type, binary_file]
+        except KeyError:
+            value = self._values[key, as_type, binary_file] = self._proxy.get(
+                key, as_type=as_type, binary_file=binary_file
+            )
+            return value
+
+    def __getattr__(self, key: str) -> Any:
+        if key.startswith('_'):
+            raise AttributeError(key)
+        return self.get(key)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.get(key)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        raise AttributeError('Settings views are read-only, use obj.settings to change a setting.')
+
+    __setitem__ = __setattr__
+
+
+def load_settings(objects) -> Dict[Model, SettingsView]:
+    """
+    Loads the settings of a number of events or organizers, including the settings of their organizers
+    and the global settings, with a single cache request and one database query per storage level
+    for everything that is not cached yet.
+
+    Afterwards, ``obj.settings`` can be used on all given objects and their parents without any further
+    queries. The return value maps every object to a :py:class:`SettingsView` on its settings.
+
+    This fills the same cache entries as ``HierarkeyProxy`` would and therefore relies on its internals
+    as of django-hierarkey 1.0. If a later version no longer has them, the settings are loaded through
+    the public ``obj.settings`` interface one object at a time instead.
+    """
+    objects = list(objects)
+    prefetch_related_objects([o for o in objects if hasattr(o, 'organizer_id')], 'organizer')
+
+    if not all(hasattr(o.settings, a) for o in objects[:1] for a in HIERARKEY_PROXY_ATTRIBUTES):
+        return {o: SettingsView(o.settings) for o in objects}
+
+    by_key = defaultdict(list)
+    level = [o.settings for o in objects]
+    while level:
+        for proxy in level:
+            if proxy._cached_obj is None:
+                by_key[HIERARKEY_CACHE_KEY.format(proxy._cache_namespace, proxy._obj.pk)].append(proxy)
+        level = [proxy._parent.settings for proxy in level if proxy._parent is not None]
+
+    values = cache.get_many(list(by_key.keys())) if by_key else {}
+    missing = defaultdict(dict)
+    for key, proxies in by_key.items():
+        if key not in values:
+            missing[proxies[0]._type][proxies[0]._obj.pk] = key
+
+    for kv_model, keys in missing.items():
+        if GlobalSettingsObject.pk in keys:
+            loaded = {keys[GlobalSettingsObject.pk]: {s.key: s.value for s in kv_model.objects.all()}}
+        else:
+            loaded = {k: {} for k in keys.values()}
+            for s in kv_model.objects.filter(object_id__in=keys.keys()):
+                loaded[keys[s.object_id]][s.key] = s.value
+        cache.set_many(loaded, timeout=HIERARKEY_CACHE_TIMEOUT)
+        values.update(loaded)
+
+    for key, proxies in by_key.items():
+        for proxy in proxies:
+            proxy._cached_obj = values[key]
+
+    return {o: SettingsView(o.settings) for o in objects}
+
+
 def validate_settings(event, settings_dict):
     from pretix.base.signals import validate_event_settings
 
@@ -16,7 +16,7 @@ from pretix.api.serializers.waitinglist import WaitingListSerializer
 from pretix.base.i18n import LazyLocaleException
 from pretix.base.models import (
     CachedCombinedTicket, CachedTicket, Event, InvoiceAddress, OrderPayment,
-    OrderPosition, OrderRefund, QuestionAnswer,
+    OrderPosition, OrderPositionSearchToken, OrderRefund, QuestionAnswer,
 )
 from pretix.base.services.invoices import invoice_pdf_task
 from pretix.base.signals import register_data_shredders
@@ -148,6 +148,7 @@ class EmailAddressShredder(BaseDataShredder):
                     del d['contact_form_data']['email']
                 o.meta_info = json.dumps(d)
             o.save(update_fields=['meta_info', 'email'])
+        OrderPositionSearchToken.index(OrderPosition.all.filter(order__event=self.event).values_list('pk', flat=True))
 
         for le in self.event.logentry_set.filter(action_type__contains="order.email"):
             shred_log_fields(le, banlist=['recipient', 'message', 'subject'])
@@ -216,6 +217,7 @@ class AttendeeNameShredder(BaseDataShredder):
         ).filter(
             Q(Q(attendee_name_cached__isnull=False) | Q(attendee_name_parts__isnull=False))
         ).update(attendee_name_cached=None, attendee_name_parts={'_shredded': True})
+        OrderPositionSearchToken.index(OrderPosition.all.filter(order__event=self.event).values_list('pk', flat=True))
 
         for le in self.event.logentry_set.filter(action_type="pretix.event.order.modified").exclude(data=""):
             d = le.parsed_data
@@ -247,6 +249,7 @@ class InvoiceAddressShredder(BaseDataShredder):
     @transaction.atomic
     def shred_data(self):
         InvoiceAddress.objects.filter(order__event=self.event).delete()
+        OrderPositionSearchToken.index(OrderPosition.all.filter(order__event=self.event).values_list('pk', flat=True))
 
         for le in self.event.logentry_set.filter(action_type="pretix.event.order.modified").exclude(data=""):
             d = le.parsed_data
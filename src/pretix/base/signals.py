@@ -508,6 +508,12 @@ time the periodic task cronjob runs. This interval is not sharply defined, it ca
 be everything between a minute and a day. The actions you perform should be
 idempotent, i.e. it should not make a difference if this is sent out more often
 than expected.
+
+All receivers of this signal are executed one after another in a common background task.
+Instead of connecting to this signal, you can register your function with the
+``pretix.base.services.periodic.periodic_job`` decorator. It is then run as a separate
+background task that never runs twice at the same time, and you can configure a minimum
+interval between two runs or split its work into multiple tasks by event.
 """
 
 register_global_settings = django.dispatch.Signal()
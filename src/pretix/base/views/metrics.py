@@ -1,8 +1,9 @@
 import base64
 import hmac
+import time
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django_scopes import scopes_disabled
 
 from .. import metrics
@@ -37,13 +38,11 @@ def serve_metrics(request):
         return unauthed_response()
 
     # ok, the request passed the authentication-barrier, let's hand out the metrics:
-    m = metrics.metric_values()
+    return StreamingHttpResponse(_render_metrics())
 
-    output = []
-    for metric, sub in m.items():
-        for label, value in sub.items():
-            output.append("{}{} {}".format(metric, label, str(value)))
 
-    content = "\n".join(output) + "\n"
-
-    return HttpResponse(content)
+def _render_metrics():
+    t0 = time.perf_counter()
+    for metric, labels, value in metrics.metric_values():
+        yield "{}{} {}\n".format(metric, labels, str(value))
+    yield "pretix_metrics_scrape_duration_seconds {}\n".format(str(time.perf_counter() - t0))
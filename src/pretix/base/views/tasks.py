@@ -79,6 +79,8 @@ class AsyncAction:
             'async_id': res.id,
             'ready': ready
         })
+        if res.state == 'PROGRESS' and isinstance(res.info, dict) and 'value' in res.info:
+            data['percentage'] = res.info['value']
         if ready:
             if res.successful() and not isinstance(res.info, Exception):
                 smes = self.get_success_message(res.info)
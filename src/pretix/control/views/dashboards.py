@@ -20,9 +20,11 @@ from django.utils.translation import pgettext, ugettext_lazy as _, ungettext
 
 from pretix.base.decimal import round_decimal
 from pretix.base.models import (
-    Item, Order, OrderPosition, OrderRefund, RequiredAction, SubEvent, Voucher,
-    WaitingListEntry,
+    Item, Order, OrderRefund, OrderRollup, RequiredAction, SalesRollup,
+    SubEvent, Voucher, WaitingListEntry,
 )
+from pretix.base.services.stats import refresh_sales_rollups
+from pretix.base.settings import load_settings
 from pretix.base.timeline import timeline_for_event
 from pretix.control.forms.event import CommentForm
 from pretix.control.signals import (
@@ -45,31 +47,28 @@ def base_widgets(sender, subevent=None, lazy=False, **kwargs):
             (Q(available_from__isnull=True) | Q(available_from__lte=now()))
         ).count()
 
+        refresh_sales_rollups(sender)
+        srqs = SalesRollup.objects.filter(event=sender, item__isnull=False, canceled=False)
         if subevent:
-            opqs = OrderPosition.objects.filter(subevent=subevent)
-        else:
-            opqs = OrderPosition.objects
+            srqs = srqs.filter(subevent=subevent)
 
-        tickc = opqs.filter(
-            order__event=sender, item__admission=True,
-            order__status__in=(Order.STATUS_PAID, Order.STATUS_PENDING),
-        ).count()
+        tickc = srqs.filter(
+            item__admission=True, status__in=(Order.STATUS_PAID, Order.STATUS_PENDING),
+        ).aggregate(sum=Sum('count'))['sum'] or 0
 
-        paidc = opqs.filter(
-            order__event=sender, item__admission=True,
-            order__status=Order.STATUS_PAID,
-        ).count()
+        paidc = srqs.filter(
+            item__admission=True, status=Order.STATUS_PAID,
+        ).aggregate(sum=Sum('count'))['sum'] or 0
 
         if subevent:
-            rev = opqs.filter(
-                order__event=sender, order__status=Order.STATUS_PAID
+            rev = srqs.filter(
+                status=Order.STATUS_PAID
             ).aggregate(
-                sum=Sum('price')
+                sum=Sum('gross')
             )['sum'] or Decimal('0.00')
         else:
-            rev = Order.objects.filter(
-                event=sender,
-                status=Order.STATUS_PAID
+            rev = OrderRollup.objects.filter(
+                event=sender, subevent__isnull=True, status=Order.STATUS_PAID
             ).aggregate(sum=Sum('total'))['sum'] or Decimal('0.00')
 
     return [
@@ -410,12 +409,11 @@ def widgets_for_event_qs(request, qs, user, nmax, lazy=False):
     if lazy:
         events = qs[:nmax]
     else:
-        events = qs.prefetch_related(
-            '_settings_objects', 'organizer___settings_objects'
-        ).select_related('organizer')[:nmax]
+        events = list(qs.select_related('organizer')[:nmax])
+        event_settings = load_settings(events)
     for event in events:
         if not lazy:
-            tzname = event.cache.get_or_set('timezone', lambda: event.settings.timezone)
+            tzname = event_settings[event].timezone
             tz = pytz.timezone(tzname)
             if event.has_subevents:
                 if event.min_from is None:
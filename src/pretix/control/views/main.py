@@ -18,6 +18,7 @@ from i18nfield.strings import LazyI18nString
 from pretix.base.forms import SafeSessionWizardView
 from pretix.base.i18n import language
 from pretix.base.models import Event, EventMetaValue, Organizer, Quota, Team
+from pretix.base.settings import load_settings
 from pretix.control.forms.event import (
     EventWizardBasicsForm, EventWizardCopyForm, EventWizardFoundationForm,
 )
@@ -33,7 +34,7 @@ class EventList(PaginationMixin, ListView):
 
     def get_queryset(self):
         qs = self.request.user.get_events_with_any_permission(self.request).prefetch_related(
-            'organizer', '_settings_objects', 'organizer___settings_objects', 'organizer__meta_properties',
+            'organizer', 'organizer__meta_properties',
             Prefetch(
                 'meta_values',
                 EventMetaValue.objects.select_related('property'),
@@ -82,6 +83,7 @@ class EventList(PaginationMixin, ListView):
             self.filter_form[k] for k in self.filter_form.fields if k.startswith('meta_')
         ]
 
+        load_settings(ctx['events'])
         for s in ctx['events']:
             s.first_quotas = s.first_quotas[:4]
             for q in s.first_quotas:
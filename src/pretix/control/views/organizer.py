@@ -31,6 +31,7 @@ from pretix.base.models.event import Event, EventMetaProperty, EventMetaValue
 from pretix.base.models.giftcards import gen_giftcard_secret
 from pretix.base.models.organizer import TeamAPIToken
 from pretix.base.services.mail import SendMailException, mail
+from pretix.base.settings import load_settings
 from pretix.control.forms.filter import (
     EventFilterForm, GiftCardFilterForm, OrganizerFilterForm,
 )
@@ -110,8 +111,7 @@ class OrganizerDetail(OrganizerDetailViewMixin, OrganizerPermissionRequiredMixin
 
     def get_queryset(self):
         qs = self.request.user.get_events_with_any_permission(self.request).select_related('organizer').prefetch_related(
-            'organizer', '_settings_objects', 'organizer___settings_objects',
-            'organizer__meta_properties',
+            'organizer', 'organizer__meta_properties',
             Prefetch(
                 'meta_values',
                 EventMetaValue.objects.select_related('property'),
@@ -141,6 +141,7 @@ class OrganizerDetail(OrganizerDetailViewMixin, OrganizerPermissionRequiredMixin
         ctx['meta_fields'] = [
             self.filter_form['meta_{}'.format(p.name)] for p in self.organizer.meta_properties.all()
         ]
+        load_settings(ctx['events'])
         return ctx
 
 
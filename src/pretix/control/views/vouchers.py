@@ -319,15 +319,12 @@ class VoucherBulkCreate(EventPermissionRequiredMixin, CreateView):
 
     @transaction.atomic
     def form_valid(self, form):
-        log_entries = []
         objs = form.save(self.request.event)
         voucherids = []
-        for v in objs:
-            log_entries.append(
-                v.log_action('pretix.voucher.added', data=form.cleaned_data, user=self.request.user, save=False)
-            )
-            voucherids.append(v.pk)
-        LogEntry.objects.bulk_create(log_entries)
+        with LogEntry.bulk_log():
+            for v in objs:
+                v.log_action('pretix.voucher.added', data=form.cleaned_data, user=self.request.user)
+                voucherids.append(v.pk)
 
         if form.cleaned_data['send']:
             vouchers_send.apply_async(kwargs={
@@ -1,6 +1,6 @@
-import copy
 import json
 from collections import OrderedDict
+from functools import partial
 from io import BytesIO
 from typing import Tuple
 
@@ -20,7 +20,9 @@ from reportlab.pdfgen import canvas
 from pretix.base.exporter import BaseExporter
 from pretix.base.i18n import language
 from pretix.base.models import Order, OrderPosition
-from pretix.base.pdf import Renderer
+from pretix.base.pdf import (
+    BackgroundOverlay, Renderer, get_background_box, render_chunks,
+)
 from pretix.base.services.orders import OrderError
 from pretix.base.settings import PERSON_NAME_SCHEMES
 from pretix.plugins.badges.models import BadgeItem, BadgeLayout
@@ -36,6 +38,8 @@ def _renderer(event, layout):
     return Renderer(event, json.loads(layout.layout), bgf)
 
 
+PAGES_PER_CHUNK = 50
+
 OPTIONS = OrderedDict([
     ('one', {
         'name': ugettext_lazy('One badge per page'),
@@ -112,76 +116,78 @@ OPTIONS = OrderedDict([
 ])
 
 
-def render_pdf(event, positions, opt):
+def _render_badges(renderermap, opt, pages):
     from PyPDF2 import PdfFileWriter, PdfFileReader
-    Renderer._register_fonts()
 
-    renderermap = {
-        bi.item_id: _renderer(event, bi.layout)
-        for bi in BadgeItem.objects.select_related('layout').filter(item__event=event)
-    }
-    try:
-        default_renderer = _renderer(event, event.badge_layouts.get(default=True))
-    except BadgeLayout.DoesNotExist:
-        default_renderer = None
     output_pdf_writer = PdfFileWriter()
+    overlay = BackgroundOverlay(output_pdf_writer)
 
-    any = False
-    npp = opt['cols'] * opt['rows']
-
-    def render_page(positions):
+    for page in pages:
         buffer = BytesIO()
         p = canvas.Canvas(buffer, pagesize=pagesizes.A4)
-        for i, (op, r) in enumerate(positions):
+        backgrounds = []
+        for i, (rkey, content) in enumerate(page):
             offsetx = opt['margins'][3] + (i % opt['cols']) * opt['offsets'][0]
             offsety = opt['margins'][2] + (opt['rows'] - 1 - i // opt['cols']) * opt['offsets'][1]
             p.translate(offsetx, offsety)
-            with language(op.order.locale):
-                r.draw_page(p, op.order, op, show_page=False)
+            renderermap[rkey].draw_page(p, None, None, show_page=False, content=content)
             p.translate(-offsetx, -offsety)
+            backgrounds.append((renderermap[rkey].bg_pdf, offsetx, offsety))
 
-        if opt['pagesize']:
-            p.setPageSize(opt['pagesize'])
+        first_bg = get_background_box(backgrounds[0][0])
+        p.setPageSize(opt['pagesize'] or (first_bg[2], first_bg[3]))
         p.showPage()
         p.save()
         buffer.seek(0)
-        canvas_pdf_reader = PdfFileReader(buffer)
-        empty_pdf_page = output_pdf_writer.addBlankPage(
-            width=opt['pagesize'][0] if opt['pagesize'] else positions[0][1].bg_pdf.getPage(0).mediaBox[2],
-            height=opt['pagesize'][1] if opt['pagesize'] else positions[0][1].bg_pdf.getPage(0).mediaBox[3],
-        )
-        for i, (op, r) in enumerate(positions):
-            bg_page = copy.copy(r.bg_pdf.getPage(0))
-            offsetx = opt['margins'][3] + (i % opt['cols']) * opt['offsets'][0]
-            offsety = opt['margins'][2] + (opt['rows'] - 1 - i // opt['cols']) * opt['offsets'][1]
-            empty_pdf_page.mergeTranslatedPage(
-                bg_page,
-                tx=offsetx,
-                ty=offsety
-            )
-        empty_pdf_page.mergePage(canvas_pdf_reader.getPage(0))
+        overlay.add_page(PdfFileReader(buffer).getPage(0), backgrounds)
 
-    pagebuffer = []
     outbuffer = BytesIO()
+    output_pdf_writer.write(outbuffer)
+    return outbuffer.getvalue()
+
+
+def render_pdf(event, positions, opt, progress_callback=None):
+    Renderer._register_fonts()
+
+    renderermap = {
+        bi.item_id: _renderer(event, bi.layout)
+        for bi in BadgeItem.objects.select_related('layout').filter(item__event=event)
+    }
+    try:
+        renderermap[None] = _renderer(event, event.badge_layouts.get(default=True))
+    except BadgeLayout.DoesNotExist:
+        renderermap[None] = None
+
+    npp = opt['cols'] * opt['rows']
+
+    # All content is evaluated here, so the pages can be drawn in parallel without any database access.
+    pages = []
+    pagebuffer = []
     for op in positions:
-        r = renderermap.get(op.item_id, default_renderer)
+        rkey = op.item_id if op.item_id in renderermap else None
+        r = renderermap[rkey]
         if not r:
             continue
-        any = True
-        pagebuffer.append((op, r))
+        with language(op.order.locale):
+            pagebuffer.append((rkey, r.get_content(op.order, op)))
         if len(pagebuffer) == npp:
-            render_page(pagebuffer)
-            pagebuffer.clear()
+            pages.append(pagebuffer)
+            pagebuffer = []
+    if pagebuffer:
+        pages.append(pagebuffer)
 
-    output_pdf_writer.addMetadata({
-        '/Title': 'Badges',
-        '/Creator': 'pretix',
-    })
-    output_pdf_writer.write(outbuffer)
-    outbuffer.seek(0)
-    if not any:
+    if not pages:
         raise OrderError(_("None of the selected products is configured to print badges."))
-    return outbuffer
+
+    return render_chunks(
+        partial(_render_badges, renderermap, opt),
+        [pages[i:i + PAGES_PER_CHUNK] for i in range(0, len(pages), PAGES_PER_CHUNK)],
+        progress_callback=progress_callback,
+        metadata={
+            '/Title': 'Badges',
+            '/Creator': 'pretix',
+        }
+    )
 
 
 class BadgeExporter(BaseExporter):
@@ -270,5 +276,6 @@ class BadgeExporter(BaseExporter):
                 'resolved_name_part'
             )
 
-        outbuffer = render_pdf(self.event, qs, OPTIONS[form_data.get('rendering', 'one')])
+        outbuffer = render_pdf(self.event, qs, OPTIONS[form_data.get('rendering', 'one')],
+                               progress_callback=self.progress_callback)
         return 'badges.pdf', 'application/pdf', outbuffer.read()
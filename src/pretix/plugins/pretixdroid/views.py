@@ -1,11 +1,12 @@
 import json
 import logging
 import urllib.parse
+from collections import defaultdict
 
 import dateutil.parser
 from django.contrib import messages
 from django.core.exceptions import ValidationError
-from django.db.models import Count, Max, OuterRef, Q, Subquery
+from django.db.models import Max, OuterRef, Q, Subquery
 from django.http import (
     HttpResponseForbidden, HttpResponseNotFound, JsonResponse,
 )
@@ -19,7 +20,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView, View
 from django_scopes import scope, scopes_disabled
 
-from pretix.base.models import Checkin, Event, Order, OrderPosition
+from pretix.base.models import (
+    Checkin, Event, Order, OrderPosition, OrderPositionSearchToken,
+)
 from pretix.base.models.event import SubEvent
 from pretix.base.services.checkin import (
     CheckInError, RequiredQuestionsError, perform_checkin,
@@ -302,13 +305,7 @@ class ApiSearchView(ApiView):
                     Q(secret__istartswith=query)
                 )[:25]
             else:
-                ops = qs.filter(
-                    Q(secret__istartswith=query)
-                    | Q(attendee_name_cached__icontains=query)
-                    | Q(addon_to__attendee_name_cached__icontains=query)
-                    | Q(order__code__istartswith=query)
-                    | Q(order__invoice_address__name_cached__icontains=query)
-                )[:25]
+                ops = OrderPositionSearchToken.search(qs, self.event, query)[:25]
 
             response['results'] = [serialize_op(op, bool(op.last_checked_in), self.config.list) for op in ops]
         else:
@@ -357,21 +354,15 @@ class ApiDownloadView(ApiView):
 
 class ApiStatusView(ApiView):
     def get(self, request, **kwargs):
-
-        cqs = Checkin.objects.filter(
-            position__order__event=self.event, position__subevent=self.subevent,
-            position__order__status__in=[Order.STATUS_PAID] + ([Order.STATUS_PENDING] if
-                                                               self.config.list.include_pending else []),
-            list=self.config.list
-        )
-        pqs = OrderPosition.objects.filter(
-            order__event=self.event,
-            order__status__in=[Order.STATUS_PAID] + ([Order.STATUS_PENDING] if self.config.list.include_pending else
-                                                     []),
-            subevent=self.subevent,
-        )
-        if not self.config.list.all_products:
-            pqs = pqs.filter(item__in=self.config.list.limit_products.values_list('id', flat=True))
+        op_by_item = defaultdict(int)
+        op_by_variation = defaultdict(int)
+        c_by_item = defaultdict(int)
+        c_by_variation = defaultdict(int)
+        for (item, variation), (positions, checkins) in self.config.list.checkin_status(self.subevent).items():
+            op_by_item[item] += positions
+            op_by_variation[variation] += positions
+            c_by_item[item] += checkins
+            c_by_variation[variation] += checkins
 
         ev = self.subevent or self.event
         response = {
@@ -390,25 +381,8 @@ class ApiStatusView(ApiView):
                 'timezone': self.event.settings.timezone,
                 'url': event_absolute_uri(self.event, 'presale:event.index')
             },
-            'checkins': cqs.count(),
-            'total': pqs.count()
-        }
-
-        op_by_item = {
-            p['item']: p['cnt']
-            for p in pqs.order_by().values('item').annotate(cnt=Count('id'))
-        }
-        op_by_variation = {
-            p['variation']: p['cnt']
-            for p in pqs.order_by().values('variation').annotate(cnt=Count('id'))
-        }
-        c_by_item = {
-            p['position__item']: p['cnt']
-            for p in cqs.order_by().values('position__item').annotate(cnt=Count('id'))
-        }
-        c_by_variation = {
-            p['position__variation']: p['cnt']
-            for p in cqs.order_by().values('position__variation').annotate(cnt=Count('id'))
+            'checkins': sum(c_by_item.values()),
+            'total': sum(op_by_item.values()),
         }
 
         response['items'] = []
@@ -3,13 +3,11 @@ import json
 
 import dateutil.parser
 import dateutil.rrule
-from django.db.models import Count, DateTimeField, Max, OuterRef, Subquery
-from django.utils import timezone
+from django.db.models import Sum
 from django.views.generic import TemplateView
 
-from pretix.base.models import (
-    Item, Order, OrderPayment, OrderPosition, SubEvent,
-)
+from pretix.base.models import Item, Order, OrderRollup, SalesRollup, SubEvent
+from pretix.base.services.stats import refresh_sales_rollups
 from pretix.control.permissions import EventPermissionRequiredMixin
 from pretix.control.views import ChartContainingView
 from pretix.plugins.statistics.signals import clear_cache
@@ -21,7 +19,6 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        tz = timezone.get_current_timezone()
 
         if 'latest' in self.request.GET:
             clear_cache(self.request.event)
@@ -37,40 +34,25 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
         cache = self.request.event.cache
         ckey = str(subevent.pk) if subevent else 'all'
 
-        p_date = OrderPayment.objects.filter(
-            order=OuterRef('pk'),
-            state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
-            payment_date__isnull=False
-        ).values('order').annotate(
-            m=Max('payment_date')
-        ).values(
-            'm'
-        ).order_by()
-        op_date = OrderPayment.objects.filter(
-            order=OuterRef('order'),
-            state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
-            payment_date__isnull=False
-        ).values('order').annotate(
-            m=Max('payment_date')
-        ).values(
-            'm'
-        ).order_by()
+        refresh_sales_rollups(self.request.event)
+        orqs = OrderRollup.objects.filter(event=self.request.event, subevent=subevent)
+        srqs = SalesRollup.objects.filter(event=self.request.event, item__isnull=False, canceled=False)
+        if subevent:
+            srqs = srqs.filter(subevent=subevent)
 
         # Orders by day
         ctx['obd_data'] = cache.get('statistics_obd_data' + ckey)
         if not ctx['obd_data']:
-            oqs = Order.objects.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
-            if subevent:
-                oqs = oqs.filter(all_positions__subevent_id=subevent, all_positions__canceled=False).distinct()
-
-            ordered_by_day = {}
-            for o in oqs.filter(event=self.request.event).values('datetime'):
-                day = o['datetime'].astimezone(tz).date()
-                ordered_by_day[day] = ordered_by_day.get(day, 0) + 1
-            paid_by_day = {}
-            for o in oqs.filter(event=self.request.event, payment_date__isnull=False).values('payment_date'):
-                day = o['payment_date'].astimezone(tz).date()
-                paid_by_day[day] = paid_by_day.get(day, 0) + 1
+            ordered_by_day = {
+                o['order_date']: o['cnt']
+                for o in orqs.values('order_date').annotate(cnt=Sum('count')).order_by()
+            }
+            paid_by_day = {
+                o['payment_date']: o['cnt']
+                for o in orqs.filter(payment_date__isnull=False).values('payment_date').annotate(
+                    cnt=Sum('count')
+                ).order_by()
+            }
 
             data = []
             for d in dateutil.rrule.rrule(
@@ -93,22 +75,13 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
         # Orders by product
         ctx['obp_data'] = cache.get('statistics_obp_data' + ckey)
         if not ctx['obp_data']:
-            opqs = OrderPosition.objects
-            if subevent:
-                opqs = opqs.filter(subevent=subevent)
             num_ordered = {
                 p['item']: p['cnt']
-                for p in (opqs
-                          .filter(order__event=self.request.event)
-                          .values('item')
-                          .annotate(cnt=Count('id')).order_by())
+                for p in srqs.values('item').annotate(cnt=Sum('count')).order_by()
             }
             num_paid = {
                 p['item']: p['cnt']
-                for p in (opqs
-                          .filter(order__event=self.request.event, order__status=Order.STATUS_PAID)
-                          .values('item')
-                          .annotate(cnt=Count('id')).order_by())
+                for p in srqs.filter(status=Order.STATUS_PAID).values('item').annotate(cnt=Sum('count')).order_by()
             }
             item_names = {
                 i.id: str(i)
@@ -126,24 +99,20 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
 
         ctx['rev_data'] = cache.get('statistics_rev_data' + ckey)
         if not ctx['rev_data']:
-            rev_by_day = {}
             if subevent:
-                for o in OrderPosition.objects.annotate(
-                        payment_date=Subquery(op_date, output_field=DateTimeField())
-                ).filter(order__event=self.request.event,
-                         subevent=subevent,
-                         order__status=Order.STATUS_PAID,
-                         payment_date__isnull=False).values('payment_date', 'price'):
-                    day = o['payment_date'].astimezone(tz).date()
-                    rev_by_day[day] = rev_by_day.get(day, 0) + o['price']
+                rev_by_day = {
+                    o['payment_date']: o['sum']
+                    for o in srqs.filter(
+                        status=Order.STATUS_PAID, payment_date__isnull=False
+                    ).values('payment_date').annotate(sum=Sum('gross')).order_by()
+                }
             else:
-                for o in Order.objects.annotate(
-                        payment_date=Subquery(p_date, output_field=DateTimeField())
-                ).filter(event=self.request.event,
-                         status=Order.STATUS_PAID,
-                         payment_date__isnull=False).values('payment_date', 'total'):
-                    day = o['payment_date'].astimezone(tz).date()
-                    rev_by_day[day] = rev_by_day.get(day, 0) + o['total']
+                rev_by_day = {
+                    o['payment_date']: o['sum']
+                    for o in orqs.filter(
+                        status=Order.STATUS_PAID, payment_date__isnull=False
+                    ).values('payment_date').annotate(sum=Sum('total')).order_by()
+                }
 
             data = []
             total = 0
@@ -1,21 +1,21 @@
 from collections import OrderedDict
-from io import BytesIO
 
 from django import forms
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.db.models.functions import Coalesce
 from django.utils.translation import ugettext as _, ugettext_lazy
 from jsonfallback.functions import JSONExtract
-from PyPDF2.merger import PdfFileMerger
 
 from pretix.base.exporter import BaseExporter
 from pretix.base.i18n import language
 from pretix.base.models import Order, OrderPosition
+from pretix.base.pdf import render_chunks
 from pretix.base.settings import PERSON_NAME_SCHEMES
 
 from .ticketoutput import PdfTicketOutput
 
+PAGES_PER_CHUNK = 50
+
 
 class AllTicketsPDF(BaseExporter):
     name = "alltickets"
@@ -48,8 +48,6 @@ class AllTicketsPDF(BaseExporter):
         return d
 
     def render(self, form_data):
-        merger = PdfFileMerger()
-
         o = PdfTicketOutput(self.event)
         qs = OrderPosition.objects.filter(
             order__event=self.event
@@ -76,6 +74,9 @@ class AllTicketsPDF(BaseExporter):
                 'resolved_name_part'
             )
 
+        # All content is evaluated here, so the pages can be drawn in parallel without any database access.
+        o._register_fonts()
+        pages = []
         for op in qs:
             if not op.generate_ticket:
                 continue
@@ -88,11 +89,12 @@ class AllTicketsPDF(BaseExporter):
                         o.default_layout
                     )
                 )
-                outbuffer = o._draw_page(layout, op, op.order)
-                merger.append(ContentFile(outbuffer.read()))
+                key, renderer = o._get_renderer(layout)
+                pages.append((key, renderer.get_content(op.order, op)))
 
-        outbuffer = BytesIO()
-        merger.write(outbuffer)
-        merger.close()
-        outbuffer.seek(0)
+        outbuffer = render_chunks(
+            o._render_pages,
+            [pages[i:i + PAGES_PER_CHUNK] for i in range(0, len(pages), PAGES_PER_CHUNK)],
+            progress_callback=self.progress_callback,
+        )
         return '{}_tickets.pdf'.format(self.event.slug), 'application/pdf', outbuffer.read()
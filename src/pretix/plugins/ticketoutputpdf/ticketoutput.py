@@ -1,10 +1,10 @@
+import itertools
 import json
 import logging
 from io import BytesIO
 
 from django.contrib.staticfiles import finders
 from django.core.files import File
-from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.http import HttpRequest
 from django.template.loader import get_template
@@ -32,6 +32,7 @@ class PdfTicketOutput(BaseTicketOutput):
     def __init__(self, event, override_layout=None, override_background=None):
         self.override_layout = override_layout
         self.override_background = override_background
+        self._renderers = {}
         super().__init__(event)
 
     @cached_property
@@ -57,26 +58,55 @@ class PdfTicketOutput(BaseTicketOutput):
     def _register_fonts(self):
         Renderer._register_fonts()
 
-    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
-        buffer = BytesIO()
-        objs = self.override_layout or json.loads(layout.layout) or self._legacy_layout()
-        bg_file = layout.background
+    def _get_renderer(self, layout: TicketLayout):
+        # Layouts returned by the override_layout signal might not be saved, so we can't just use the ID as a key
+        key = (layout.pk, layout.layout, layout.background.name if layout.background else None)
+        if key not in self._renderers:
+            objs = self.override_layout or json.loads(layout.layout) or self._legacy_layout()
+            bg_file = layout.background
 
-        if self.override_background:
-            bgf = default_storage.open(self.override_background.name, "rb")
-        elif isinstance(bg_file, File) and bg_file.name:
-            bgf = default_storage.open(bg_file.name, "rb")
-        else:
-            bgf = self._get_default_background()
+            if self.override_background:
+                bgf = default_storage.open(self.override_background.name, "rb")
+            elif isinstance(bg_file, File) and bg_file.name:
+                bgf = default_storage.open(bg_file.name, "rb")
+            else:
+                bgf = self._get_default_background()
+
+            self._renderers[key] = Renderer(self.event, objs, bgf)
+        return key, self._renderers[key]
+
+    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
+        key, renderer = self._get_renderer(layout)
+        return self._draw_content(renderer, renderer.get_content(order, op))
 
+    def _draw_content(self, renderer: Renderer, content: list):
+        buffer = BytesIO()
         p = self._create_canvas(buffer)
-        renderer = Renderer(self.event, objs, bgf)
-        renderer.draw_page(p, order, op)
+        renderer.draw_page(p, None, None, content=content)
         p.save()
         return renderer.render_background(buffer, _('Ticket'))
 
-    def generate_order(self, order: Order):
+    def _render_pages(self, pages: list) -> bytes:
+        """
+        Renders a list of ``(renderer key, content)`` tuples into one PDF file. Does not access the database.
+        """
         merger = PdfFileMerger()
+        # Consecutive pages with the same layout share one canvas, so their background is only applied once
+        for key, group in itertools.groupby(pages, key=lambda page: page[0]):
+            renderer = self._renderers[key]
+            buffer = BytesIO()
+            p = self._create_canvas(buffer)
+            for _key, content in group:
+                renderer.draw_page(p, None, None, content=content)
+            p.save()
+            merger.append(renderer.render_background(buffer, _('Ticket')))
+        outbuffer = BytesIO()
+        merger.write(outbuffer)
+        merger.close()
+        return outbuffer.getvalue()
+
+    def generate_order(self, order: Order):
+        pages = []
         with language(order.locale):
             for op in order.positions_with_tickets:
                 layout = override_layout.send_chained(
@@ -88,14 +118,10 @@ class PdfTicketOutput(BaseTicketOutput):
                         )
                     )
                 )
-                outbuffer = self._draw_page(layout, op, order)
-                merger.append(ContentFile(outbuffer.read()))
+                key, renderer = self._get_renderer(layout)
+                pages.append((key, renderer.get_content(order, op)))
 
-        outbuffer = BytesIO()
-        merger.write(outbuffer)
-        merger.close()
-        outbuffer.seek(0)
-        return 'order%s%s.pdf' % (self.event.slug, order.code), 'application/pdf', outbuffer.read()
+        return 'order%s%s.pdf' % (self.event.slug, order.code), 'application/pdf', self._render_pages(pages)
 
     def generate(self, op):
         order = op.order
@@ -1,12 +1,12 @@
 import calendar
 import sys
-from collections import defaultdict
 from datetime import date, datetime, timedelta
 from importlib import import_module
 
 import pytz
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
 from django.db.models import Count, Exists, OuterRef, Prefetch
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
@@ -19,14 +19,13 @@ from django.views.generic import TemplateView
 
 from pretix.base.channels import get_all_sales_channels
 from pretix.base.models import ItemVariation, Quota, SeatCategoryMapping
-from pretix.base.models.event import SubEvent
+from pretix.base.models.event import EventMixin, SubEvent
 from pretix.base.models.items import ItemBundle
 from pretix.multidomain.urlreverse import eventreverse
 from pretix.presale.ical import get_ical
 from pretix.presale.signals import item_description
 from pretix.presale.views.organizer import (
-    EventListMixin, add_subevents_for_days, filter_qs_by_attr,
-    weeks_for_template,
+    EventListMixin, filter_qs_by_attr, get_events_by_day, weeks_for_template,
 )
 
 from . import (
@@ -51,8 +50,66 @@ def item_group_by_category(items):
     )
 
 
-def get_grouped_items(event, subevent=None, voucher=None, channel='web', require_seat=0):
-    items = event.items.using(settings.DATABASE_REPLICA).filter_available(channel=channel, voucher=voucher).select_related(
+def get_catalog_items(event, subevent=None, voucher=None, channel='web', require_seat=0):
+    """
+    Returns all products that can currently be bought in the given context, together with their
+    categories, variations, bundles and the quotas of the given subevent. No availability
+    information is included.
+
+    Building this is expensive, so we keep a snapshot in the event's cache. The snapshot is
+    replaced whenever ``event.cache.clear()`` is called, which happens every time a product,
+    quota, category or another related object is changed. Sale periods of products are checked
+    against the current time on every call. Quotas are fetched again on every call, since their
+    cached availability changes without the snapshot being replaced. Every call returns new
+    objects, so callers are free to modify them.
+    """
+    cache_key = 'catalog:{}:{}:{}:{}'.format(
+        subevent.pk if subevent else 0,
+        channel,
+        1 if require_seat else 0,
+        '{}-{}-{}'.format(voucher.item_id, voucher.quota_id, voucher.show_hidden_items) if voucher else ''
+    )
+    items = event.cache.get(cache_key)
+    cached = items is not None
+    if not cached:
+        items = list(_build_catalog_items(event, subevent, voucher, channel, require_seat))
+        event.cache.set(cache_key, items, 300)
+
+    now_dt = now()
+    items = [
+        item for item in items
+        if (item.available_from is None or item.available_from <= now_dt)
+        and (item.available_until is None or item.available_until >= now_dt)
+    ]
+    if cached:
+        _refresh_catalog_quotas(event, items)
+    return items
+
+
+def _catalog_quota_holders(items):
+    for item in items:
+        yield item
+        yield from item.available_variations
+        for b in item.bundles.all():
+            yield b.bundled_variation or b.bundled_item
+
+
+def _refresh_catalog_quotas(event, items):
+    quota_ids = {i.hidden_if_available_id for i in items if i.hidden_if_available_id}
+    for holder in _catalog_quota_holders(items):
+        quota_ids.update(q.pk for q in holder._subevent_quotas)
+    quotas = event.quotas.using(settings.DATABASE_REPLICA).in_bulk(quota_ids)
+    for item in items:
+        if item.hidden_if_available_id:
+            item.hidden_if_available = quotas.get(item.hidden_if_available_id)
+    for holder in _catalog_quota_holders(items):
+        holder._subevent_quotas = [quotas[q.pk] for q in holder._subevent_quotas if q.pk in quotas]
+
+
+def _build_catalog_items(event, subevent, voucher, channel, require_seat):
+    items = event.items.using(settings.DATABASE_REPLICA).filter_available(
+        channel=channel, voucher=voucher, ignore_dates=True
+    ).select_related(
         'category', 'tax_rule',  # for re-grouping
         'hidden_if_available',
     ).prefetch_related(
@@ -98,10 +155,28 @@ def get_grouped_items(event, subevent=None, voucher=None, channel='web', require
         items = items.filter(requires_seat__gt=0)
     else:
         items = items.filter(requires_seat=0)
+    return items
+
+
+def get_grouped_items(event, subevent=None, voucher=None, channel='web', require_seat=0):
+    items = get_catalog_items(event, subevent, voucher, channel, require_seat)
     display_add_to_cart = False
     external_quota_cache = event.cache.get('item_quota_cache')
     quota_cache = external_quota_cache or {}
 
+    if not external_quota_cache:
+        # Compute the availability of all quotas involved at once instead of quota by quota
+        quotas_to_compute = set()
+        for item in items:
+            if item.hidden_if_available:
+                quotas_to_compute.add(item.hidden_if_available)
+            quotas_to_compute.update(item._subevent_quotas)
+            for var in item.available_variations:
+                quotas_to_compute.update(var._subevent_quotas)
+            for b in item.bundles.all():
+                quotas_to_compute.update((b.bundled_variation or b.bundled_item)._subevent_quotas)
+        Quota.objects.compute_availability(quotas_to_compute, _cache=quota_cache)
+
     if subevent:
         item_price_override = subevent.item_price_overrides
         var_price_override = subevent.var_price_overrides
@@ -259,6 +334,7 @@ def get_grouped_items(event, subevent=None, voucher=None, channel='web', require
 @method_decorator(iframe_entry_view_wrapper, 'dispatch')
 class EventIndex(EventViewMixin, EventListMixin, CartMixin, TemplateView):
     template_name = "pretixpresale/event/index.html"
+    subevent_list_paginate_by = 50
 
     def get(self, request, *args, **kwargs):
         from pretix.presale.views.cart import get_or_create_cart_id
@@ -352,20 +428,20 @@ class EventIndex(EventViewMixin, EventListMixin, CartMixin, TemplateView):
             context['before'] = before
             context['after'] = after
 
-            ebd = defaultdict(list)
-            add_subevents_for_days(
-                filter_qs_by_attr(self.request.event.subevents_annotated(self.request.sales_channel.identifier).using(settings.DATABASE_REPLICA), self.request),
-                before, after, ebd, set(), self.request.event,
-                kwargs.get('cart_namespace')
-            )
+            ebd, _ = get_events_by_day(self.request, before, after, self.request.event,
+                                       self.request.sales_channel.identifier, kwargs.get('cart_namespace'))
 
             context['weeks'] = weeks_for_template(ebd, self.year, self.month)
             context['months'] = [date(self.year, i + 1, 1) for i in range(12)]
             context['years'] = range(now().year - 2, now().year + 3)
         elif self.request.event.has_subevents:
-            context['subevent_list'] = self.request.event.subevents_sorted(
+            paginator = Paginator(self.request.event.subevents_sorted(
                 filter_qs_by_attr(self.request.event.subevents_annotated(self.request.sales_channel.identifier).using(settings.DATABASE_REPLICA), self.request)
-            )
+            ), self.subevent_list_paginate_by)
+            context['page_obj'] = paginator.get_page(self.request.GET.get('page'))
+            context['is_paginated'] = context['page_obj'].has_other_pages()
+            context['subevent_list'] = list(context['page_obj'].object_list)
+            EventMixin.fill_best_availability_states(context['subevent_list'])
 
         context['show_cart'] = (
             context['cart']['positions'] and (
@@ -34,7 +34,9 @@ from pretix.base.services.mail import SendMailException
 from pretix.base.services.orders import (
     OrderError, cancel_order, change_payment_provider,
 )
-from pretix.base.services.tickets import generate, invalidate_cache
+from pretix.base.services.tickets import (
+    count_ticket_cache_access, generate, invalidate_cache,
+)
 from pretix.base.signals import (
     allow_ticket_download, order_modified, register_ticket_outputs,
 )
@@ -815,6 +817,7 @@ class OrderDownloadMixin:
             return self.error(OrderError(_('Ticket download is not enabled for this product.')))
 
         ct = self.get_last_ct()
+        count_ticket_cache_access(self.output.identifier, bool(ct))
         if ct:
             return self.success(ct)
         return self.do('orderposition' if 'position' in kwargs else 'order',
@@ -1,6 +1,9 @@
 import calendar
+import hashlib
+import json
 from collections import defaultdict
 from datetime import date, datetime, timedelta
+from types import SimpleNamespace
 
 import pytz
 from django.conf import settings
@@ -9,6 +12,7 @@ from django.db.models.functions import Coalesce, Greatest
 from django.http import Http404, HttpResponse
 from django.utils.decorators import method_decorator
 from django.utils.timezone import now
+from django.utils.translation import get_language
 from django.views import View
 from django.views.decorators.cache import cache_page
 from django.views.generic import ListView, TemplateView
@@ -18,17 +22,19 @@ from pretix.base.i18n import language
 from pretix.base.models import (
     Event, EventMetaValue, SubEvent, SubEventMetaValue,
 )
+from pretix.base.models.event import EventMixin
+from pretix.base.settings import load_settings
 from pretix.helpers.daterange import daterange
-from pretix.multidomain.urlreverse import eventreverse
+from pretix.multidomain.urlreverse import build_absolute_uri, eventreverse
 from pretix.presale.ical import get_ical
 from pretix.presale.views import OrganizerViewMixin
 
+# Number of seconds calendar entries are cached. Availabilities and sale periods change without any changes to the
+# events, so this should stay short.
+CALENDAR_CACHE_TIMEOUT = 60
 
-def filter_qs_by_attr(qs, request):
-    """
-    We'll allow to filter the event list using attributes defined in the event meta data
-    models in the format ?attr[meta_name]=meta_value
-    """
+
+def _get_filter_attrs(request):
     attrs = {}
     for i, item in enumerate(request.GET.items()):
         k, v = item
@@ -40,6 +46,15 @@ def filter_qs_by_attr(qs, request):
         request.session[skey] = attrs
     elif skey in request.session:
         attrs = request.session[skey]
+    return attrs
+
+
+def filter_qs_by_attr(qs, request):
+    """
+    We'll allow to filter the event list using attributes defined in the event meta data
+    models in the format ?attr[meta_name]=meta_value
+    """
+    attrs = _get_filter_attrs(request)
 
     props = {
         p.name: p for p in request.organizer.meta_properties.filter(
@@ -213,8 +228,10 @@ class OrganizerIndex(OrganizerViewMixin, EventListMixin, ListView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
+        EventMixin.fill_best_availability_states([e for e in ctx['events'] if not e.has_subevents])
+        event_settings = load_settings(ctx['events'])
         for event in ctx['events']:
-            event.tzname = pytz.timezone(event.cache.get_or_set('timezone', lambda: event.settings.timezone))
+            event.tzname = pytz.timezone(event_settings[event].timezone)
             if event.has_subevents:
                 event.daterange = daterange(
                     event.min_from.astimezone(event.tzname),
@@ -223,6 +240,69 @@ class OrganizerIndex(OrganizerViewMixin, EventListMixin, ListView):
         return ctx
 
 
+def _get_calendar_settings(events):
+    return {
+        event: SimpleNamespace(
+            timezone=s.timezone,
+            show_times=s.show_times,
+            show_date_to=s.show_date_to,
+            waiting_list_enabled=s.waiting_list_enabled,
+            presale_start_show_date=s.presale_start_show_date,
+            event_list_availability=s.event_list_availability,
+        )
+        for event, s in load_settings(events).items()
+    }
+
+
+def _get_calendar_data(ev, event, evsettings):
+    """
+    Returns everything the calendar templates and the widget need to know about an event or subevent as a plain
+    object that can be cached.
+    """
+    return SimpleNamespace(
+        name=str(ev.name),
+        location=str(ev.location),
+        date_from=ev.date_from,
+        date_range=ev.get_date_range_display(),
+        presale_is_running=ev.presale_is_running,
+        presale_has_ended=ev.presale_has_ended,
+        presale_start=ev.presale_start,
+        best_availability_state=ev.best_availability_state if hasattr(ev, 'active_quotas') else None,
+        settings=evsettings,
+        subevent=ev.pk if isinstance(ev, SubEvent) else None,
+        event_url=build_absolute_uri(event, 'presale:event.index'),
+    )
+
+
+def _add_to_days(ebd, ev, event, evsettings, before, after, url):
+    tz = pytz.timezone(evsettings.timezone)
+    data = _get_calendar_data(ev, event, evsettings)
+    datetime_from = ev.date_from.astimezone(tz)
+    date_from = datetime_from.date()
+    if evsettings.show_date_to and ev.date_to:
+        date_to = ev.date_to.astimezone(tz).date()
+        d = max(date_from, before.date())
+        while d <= date_to and d <= after.date():
+            first = d == date_from
+            ebd[d].append({
+                'event': data,
+                'continued': not first,
+                'time': datetime_from.time().replace(tzinfo=None) if first and evsettings.show_times else None,
+                'url': url,
+                'timezone': evsettings.timezone,
+            })
+            d += timedelta(days=1)
+
+    else:
+        ebd[date_from].append({
+            'event': data,
+            'continued': False,
+            'time': datetime_from.time().replace(tzinfo=None) if evsettings.show_times else None,
+            'url': url,
+            'timezone': evsettings.timezone,
+        })
+
+
 def add_events_for_days(request, baseqs, before, after, ebd, timezones):
     qs = baseqs.filter(is_public=True, live=True, has_subevents=False).filter(
         Q(Q(date_to__gte=before) & Q(date_from__lte=after)) |
@@ -230,38 +310,17 @@ def add_events_for_days(request, baseqs, before, after, ebd, timezones):
         Q(Q(date_to__isnull=True) & Q(date_from__gte=before) & Q(date_from__lte=after))
     ).order_by(
         'date_from'
-    ).prefetch_related(
-        '_settings_objects', 'organizer___settings_objects'
     )
     if hasattr(request, 'organizer'):
         qs = filter_qs_by_attr(qs, request)
-    for event in qs:
-        timezones.add(event.settings.timezones)
-        tz = pytz.timezone(event.settings.timezone)
-        datetime_from = event.date_from.astimezone(tz)
-        date_from = datetime_from.date()
-        if event.settings.show_date_to and event.date_to:
-            date_to = event.date_to.astimezone(tz).date()
-            d = max(date_from, before.date())
-            while d <= date_to and d <= after.date():
-                first = d == date_from
-                ebd[d].append({
-                    'event': event,
-                    'continued': not first,
-                    'time': datetime_from.time().replace(tzinfo=None) if first and event.settings.show_times else None,
-                    'url': eventreverse(event, 'presale:event.index'),
-                    'timezone': event.settings.timezone,
-                })
-                d += timedelta(days=1)
+    events = list(qs)
+    EventMixin.fill_best_availability_states([e for e in events if hasattr(e, 'active_quotas')])
 
-        else:
-            ebd[date_from].append({
-                'event': event,
-                'continued': False,
-                'time': datetime_from.time().replace(tzinfo=None) if event.settings.show_times else None,
-                'url': eventreverse(event, 'presale:event.index'),
-                'timezone': event.settings.timezone,
-            })
+    event_settings = _get_calendar_settings(events)
+    for event in events:
+        evsettings = event_settings[event]
+        timezones.add(evsettings.timezone)
+        _add_to_days(ebd, event, event, evsettings, before, after, eventreverse(event, 'presale:event.index'))
 
 
 def add_subevents_for_days(qs, before, after, ebd, timezones, event=None, cart_namespace=None):
@@ -272,38 +331,58 @@ def add_subevents_for_days(qs, before, after, ebd, timezones, event=None, cart_n
     ).order_by(
         'date_from'
     )
-    for se in qs:
+    subevents = list(qs)
+    EventMixin.fill_best_availability_states([se for se in subevents if hasattr(se, 'active_quotas')])
+
+    event_settings = _get_calendar_settings([event] if event else {se.event for se in subevents})
+    for se in subevents:
         kwargs = {'subevent': se.pk}
         if cart_namespace:
             kwargs['cart_namespace'] = cart_namespace
 
-        settings = event.settings if event else se.event.settings
-        timezones.add(settings.timezones)
-        tz = pytz.timezone(settings.timezone)
-        datetime_from = se.date_from.astimezone(tz)
-        date_from = datetime_from.date()
-        if se.event.settings.show_date_to and se.date_to:
-            date_to = se.date_to.astimezone(tz).date()
-            d = max(date_from, before.date())
-            while d <= date_to and d <= after.date():
-                first = d == date_from
-                ebd[d].append({
-                    'continued': not first,
-                    'timezone': settings.timezone,
-                    'time': datetime_from.time().replace(tzinfo=None) if first and settings.show_times else None,
-                    'event': se,
-                    'url': eventreverse(se.event, 'presale:event.index', kwargs=kwargs)
-                })
-                d += timedelta(days=1)
+        evsettings = event_settings[event or se.event]
+        timezones.add(evsettings.timezone)
+        _add_to_days(ebd, se, se.event, evsettings, before, after,
+                     eventreverse(se.event, 'presale:event.index', kwargs=kwargs))
 
-        else:
-            ebd[date_from].append({
-                'event': se,
-                'continued': False,
-                'time': datetime_from.time().replace(tzinfo=None) if se.event.settings.show_times else None,
-                'url': eventreverse(se.event, 'presale:event.index', kwargs=kwargs),
-                'timezone': se.event.settings.timezone,
-            })
+
+def get_events_by_day(request, before, after, event=None, channel='web', cart_namespace=None):
+    """
+    Returns a dictionary mapping every day between ``before`` and ``after`` to a list of calendar entries for the
+    public events and subevents of ``event`` or, if no event is given, the whole organizer of the request, together
+    with the set of all timezones involved.
+
+    Settings and quota availabilities for all events are loaded at once, and the result only consists of plain
+    Python objects that are cached for a short time. The cache is dropped whenever an event or subevent changes.
+    """
+    key = 'calendar:{}:{}:{}:{}:{}:{}'.format(
+        before.isoformat(), after.isoformat(), channel, cart_namespace or '-', get_language(),
+        hashlib.md5(json.dumps(sorted(_get_filter_attrs(request).items())).encode()).hexdigest()
+    )
+    objcache = event.cache if event else request.organizer.cache
+    data = objcache.get(key)
+    if data is not None:
+        return data
+
+    ebd = defaultdict(list)
+    timezones = set()
+    if event:
+        add_subevents_for_days(
+            filter_qs_by_attr(event.subevents_annotated(channel).using(settings.DATABASE_REPLICA), request),
+            before, after, ebd, timezones, event, cart_namespace
+        )
+    else:
+        add_events_for_days(request, Event.annotated(request.organizer.events, channel).using(settings.DATABASE_REPLICA),
+                            before, after, ebd, timezones)
+        add_subevents_for_days(filter_qs_by_attr(SubEvent.annotated(SubEvent.objects.filter(
+            event__organizer=request.organizer,
+            event__is_public=True,
+            event__live=True,
+        ).prefetch_related('event'), channel), request).using(settings.DATABASE_REPLICA), before, after, ebd, timezones)
+
+    data = dict(ebd), timezones
+    objcache.set(key, data, CALENDAR_CACHE_TIMEOUT)
+    return data
 
 
 def weeks_for_template(ebd, year, month):
@@ -353,16 +432,7 @@ class CalendarView(OrganizerViewMixin, EventListMixin, TemplateView):
         return ctx
 
     def _events_by_day(self, before, after):
-        ebd = defaultdict(list)
-        timezones = set()
-        add_events_for_days(self.request, Event.annotated(self.request.organizer.events, 'web').using(settings.DATABASE_REPLICA), before, after, ebd, timezones)
-        add_subevents_for_days(filter_qs_by_attr(SubEvent.annotated(SubEvent.objects.filter(
-            event__organizer=self.request.organizer,
-            event__is_public=True,
-            event__live=True,
-        ).prefetch_related(
-            'event___settings_objects', 'event__organizer___settings_objects'
-        )), self.request).using(settings.DATABASE_REPLICA), before, after, ebd, timezones)
+        ebd, timezones = get_events_by_day(self.request, before, after)
         self._multiple_timezones = len(timezones) > 1
         return ebd
 
@@ -376,11 +446,9 @@ class OrganizerIcalDownload(OrganizerViewMixin, View):
                 request
             ).order_by(
                 'date_from'
-            ).prefetch_related(
-                '_settings_objects', 'organizer___settings_objects'
             )
         )
-        events += list(
+        subevents = list(
             filter_qs_by_attr(
                 SubEvent.objects.filter(
                     event__organizer=self.request.organizer,
@@ -391,11 +459,13 @@ class OrganizerIcalDownload(OrganizerViewMixin, View):
                 ),
                 request
             ).prefetch_related(
-                'event___settings_objects', 'event__organizer___settings_objects'
+                'event'
             ).order_by(
                 'date_from'
             )
         )
+        load_settings(events + list({se.event for se in subevents}))
+        events += subevents
 
         if 'locale' in request.GET and request.GET.get('locale') in dict(settings.LANGUAGES):
             with language(request.GET.get('locale')):
@@ -2,7 +2,6 @@ import calendar
 import hashlib
 import json
 import logging
-from collections import defaultdict
 from datetime import date, datetime, timedelta
 from urllib.parse import urljoin
 
@@ -29,9 +28,10 @@ from django.views.i18n import (
 from lxml import etree
 
 from pretix.base.i18n import language
-from pretix.base.models import CartPosition, Event, Quota, SubEvent, Voucher
+from pretix.base.models import CartPosition, Quota, Voucher
+from pretix.base.models.event import EventMixin
 from pretix.base.services.cart import error_messages
-from pretix.base.settings import GlobalSettingsObject
+from pretix.base.settings import GlobalSettingsObject, load_settings
 from pretix.base.templatetags.rich_text import rich_text
 from pretix.helpers.daterange import daterange
 from pretix.helpers.thumb import get_thumbnail
@@ -41,8 +41,7 @@ from pretix.presale.views.event import (
     get_grouped_items, item_group_by_category,
 )
 from pretix.presale.views.organizer import (
-    EventListMixin, add_events_for_days, add_subevents_for_days,
-    filter_qs_by_attr, weeks_for_template,
+    EventListMixin, filter_qs_by_attr, get_events_by_day, weeks_for_template,
 )
 
 logger = logging.getLogger(__name__)
@@ -173,6 +172,7 @@ def get_picture(event, picture):
 
 
 class WidgetAPIProductList(EventListMixin, View):
+    subevent_list_paginate_by = 50
 
     def _get_items(self):
         items, display_add_to_cart = get_grouped_items(
@@ -317,23 +317,19 @@ class WidgetAPIProductList(EventListMixin, View):
         events = []
         for e in ebd:
             ev = e['event']
-            if isinstance(ev, SubEvent):
-                event = ev.event
-            else:
-                event = ev
             tz = pytz.timezone(e['timezone'])
             events.append({
-                'name': str(ev.name),
-                'time': date_format(ev.date_from.astimezone(tz), 'TIME_FORMAT') if e.get('time') and event.settings.show_times else
+                'name': ev.name,
+                'time': date_format(ev.date_from.astimezone(tz), 'TIME_FORMAT') if e.get('time') and ev.settings.show_times else
                 None,
                 'continued': e['continued'],
-                'location': str(ev.location),
-                'date_range': ev.get_date_range_display() + (
-                    " " + date_format(ev.date_from.astimezone(tz), "TIME_FORMAT") if event.settings.show_times else ""
+                'location': ev.location,
+                'date_range': ev.date_range + (
+                    " " + date_format(ev.date_from.astimezone(tz), "TIME_FORMAT") if ev.settings.show_times else ""
                 ),
-                'availability': self._get_availability(ev, event),
-                'event_url': build_absolute_uri(event, 'presale:event.index'),
-                'subevent': ev.pk if isinstance(ev, SubEvent) else None,
+                'availability': self._get_availability(ev, ev),
+                'event_url': ev.event_url,
+                'subevent': ev.subevent,
             })
         return events
 
@@ -352,6 +348,7 @@ class WidgetAPIProductList(EventListMixin, View):
             request.GET.get("year") or "-",
             request.GET.get("month") or "-",
             request.GET.get("old") or "-",
+            request.GET.get("offset") or "-",
             get_language(),
         ])
         cached_data = cache.get(cache_key)
@@ -370,28 +367,8 @@ class WidgetAPIProductList(EventListMixin, View):
             before = datetime(self.year, self.month, 1, 0, 0, 0, tzinfo=tz) - timedelta(days=1)
             after = datetime(self.year, self.month, ndays, 0, 0, 0, tzinfo=tz) + timedelta(days=1)
 
-            ebd = defaultdict(list)
-
-            if hasattr(self.request, 'event'):
-                add_subevents_for_days(
-                    filter_qs_by_attr(self.request.event.subevents_annotated('web'), self.request),
-                    before, after, ebd, set(), self.request.event,
-                    kwargs.get('cart_namespace')
-                )
-            else:
-                timezones = set()
-                add_events_for_days(
-                    self.request,
-                    filter_qs_by_attr(Event.annotated(self.request.organizer.events, 'web'), self.request),
-                    before, after, ebd, timezones
-                )
-                add_subevents_for_days(filter_qs_by_attr(SubEvent.annotated(SubEvent.objects.filter(
-                    event__organizer=self.request.organizer,
-                    event__is_public=True,
-                    event__live=True,
-                ).prefetch_related(
-                    'event___settings_objects', 'event__organizer___settings_objects'
-                )), self.request), before, after, ebd, timezones)
+            ebd, _ = get_events_by_day(self.request, before, after, getattr(self.request, 'event', None),
+                                       cart_namespace=kwargs.get('cart_namespace'))
 
             data['weeks'] = weeks_for_template(ebd, self.year, self.month)
             for w in data['weeks']:
@@ -401,9 +378,16 @@ class WidgetAPIProductList(EventListMixin, View):
                     d['events'] = self._serialize_events(d['events'] or [])
         else:
             if hasattr(self.request, 'event'):
-                evs = self.request.event.subevents_sorted(
+                try:
+                    offset = max(int(request.GET.get("offset", 0)), 0)
+                except ValueError:
+                    offset = 0
+                evs = list(self.request.event.subevents_sorted(
                     filter_qs_by_attr(self.request.event.subevents_annotated(self.request.sales_channel.identifier), self.request)
-                )
+                )[offset:offset + self.subevent_list_paginate_by + 1])
+                data['has_more_events'] = len(evs) > self.subevent_list_paginate_by
+                evs = evs[:self.subevent_list_paginate_by]
+                EventMixin.fill_best_availability_states(evs)
                 tz = pytz.timezone(request.event.settings.timezone)
                 data['events'] = [
                     {
@@ -419,9 +403,11 @@ class WidgetAPIProductList(EventListMixin, View):
                 ]
             else:
                 data['events'] = []
-                qs = self._get_event_queryset()
+                qs = list(self._get_event_queryset())
+                EventMixin.fill_best_availability_states([e for e in qs if not e.has_subevents])
+                event_settings = load_settings(qs)
                 for event in qs:
-                    tz = pytz.timezone(event.cache.get_or_set('timezone', lambda: event.settings.timezone))
+                    tz = pytz.timezone(event_settings[event].timezone)
                     if event.has_subevents:
                         dr = daterange(
                             event.min_from.astimezone(tz),
@@ -430,7 +416,7 @@ class WidgetAPIProductList(EventListMixin, View):
                         avail = {'color': 'none', 'text': ugettext('Event series')}
                     else:
                         dr = event.get_date_range_display(tz) + (
-                            " " + event.get_time_from_display(tz) if event.settings.show_times else ""
+                            " " + event.get_time_from_display(tz) if event_settings[event].show_times else ""
                         )
                         avail = self._get_availability(event, event)
                     data['events'].append({
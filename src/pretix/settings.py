@@ -60,6 +60,7 @@ debug_fallback = "runserver" in sys.argv
 DEBUG = config.getboolean('django', 'debug', fallback=debug_fallback)
 
 PDFTK = config.get('tools', 'pdftk', fallback=None)
+PDF_RENDER_PROCESSES = config.getint('pdf', 'render_processes', fallback=1)
 
 PRETIX_AUTH_BACKENDS = config.get('pretix', 'auth_backends', fallback='pretix.base.auth.NativeAuthBackend').split(',')
 
@@ -123,6 +124,9 @@ PRETIX_PASSWORD_RESET = config.getboolean('pretix', 'password_reset', fallback=T
 PRETIX_LONG_SESSIONS = config.getboolean('pretix', 'long_sessions', fallback=True)
 PRETIX_ADMIN_AUDIT_COMMENTS = config.getboolean('pretix', 'audit_comments', fallback=False)
 PRETIX_OBLIGATORY_2FA = config.getboolean('pretix', 'obligatory_2fa', fallback=False)
+PRETIX_QUOTA_COUNTERS = config.getboolean('pretix', 'quota_counters', fallback=False)
+PRETIX_OBJECT_LOCKING = config.getboolean('pretix', 'object_locking', fallback=False)
+PRETIX_LOCK_WAIT_TIMEOUT = config.getfloat('pretix', 'lock_wait_timeout', fallback=5)
 PRETIX_SESSION_TIMEOUT_RELATIVE = 3600 * 3
 PRETIX_SESSION_TIMEOUT_ABSOLUTE = 3600 * 12
 
@@ -184,6 +188,7 @@ ADMINS = [('Admin', n) for n in config.get('mail', 'admins', fallback='').split(
 METRICS_ENABLED = config.getboolean('metrics', 'enabled', fallback=False)
 METRICS_USER = config.get('metrics', 'user', fallback="metrics")
 METRICS_PASSPHRASE = config.get('metrics', 'passphrase', fallback="")
+METRICS_FLUSH_INTERVAL = config.getfloat('metrics', 'flush_interval', fallback=10)
 
 CACHES = {
     'default': {
@@ -237,6 +242,7 @@ if HAS_CELERY:
     CELERY_RESULT_BACKEND = config.get('celery', 'backend')
 else:
     CELERY_TASK_ALWAYS_EAGER = True
+PRETIX_PERIODIC_SHARDS = config.getint('celery', 'periodic_shards', fallback=1)
 
 SESSION_COOKIE_DOMAIN = config.get('pretix', 'cookie_domain', fallback=None)
 
@@ -671,6 +677,9 @@ CELERY_TASK_ROUTES = ([
     ('pretix.base.services.update_check.*', {'queue': 'background'}),
     ('pretix.base.services.quotas.*', {'queue': 'background'}),
     ('pretix.base.services.waitinglist.*', {'queue': 'background'}),
+    ('pretix.base.services.tickets.pregenerate_tickets', {'queue': 'background'}),
+    ('pretix.base.services.tickets.pregenerate_invalidated_tickets', {'queue': 'background'}),
+    ('pretix.base.services.periodic.*', {'queue': 'background'}),
     ('pretix.base.services.notifications.*', {'queue': 'notifications'}),
     ('pretix.api.webhooks.*', {'queue': 'notifications'}),
     ('pretix.presale.style.*', {'queue': 'background'}),
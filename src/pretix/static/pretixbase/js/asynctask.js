@@ -34,6 +34,11 @@ function async_task_check_callback(data, jqXHR, status) {
     }
     async_task_timeout = window.setTimeout(async_task_check, 250);
 
+    if (typeof data.percentage === "number") {
+        $("#loadingmodal .progress").show();
+        $("#loadingmodal .progress .progress-bar").css("width", data.percentage + "%");
+    }
+
     if (async_task_is_long) {
         $("#loadingmodal p.status").text(gettext(
             'Your request has been queued on the server and will now be ' +
@@ -43,6 +43,7 @@ var strings = {
     'back_to_list': django.pgettext('widget', 'Choose a different event'),
     'back_to_dates': django.pgettext('widget', 'Choose a different date'),
     'back': django.pgettext('widget', 'Back'),
+    'load_more': django.pgettext('widget', 'Load more'),
     'next_month': django.pgettext('widget', 'Next month'),
     'previous_month': django.pgettext('widget', 'Previous month'),
     'show_seating': django.pgettext('widget', 'Open seat selection'),
@@ -818,8 +819,16 @@ Vue.component('pretix-widget-event-list', {
         + '</a>'
         + '</div>'
         + '<pretix-widget-event-list-entry v-for="event in $root.events" :event="event" :key="event.url"></pretix-widget-event-list-entry>'
+        + '<p class="pretix-widget-event-list-load-more" v-if="$root.has_more_events">'
+        + '<button @click.prevent="load_more" type="button">' + strings['load_more'] + '</button>'
+        + '</p>'
         + '</div>'),
     methods: {
+        load_more: function () {
+            this.$root.offset = this.$root.events.length;
+            this.$root.loading++;
+            this.$root.reload();
+        },
         back_to_calendar: function () {
             if (this.$root.weeks) {
                 this.$root.events = undefined;
@@ -1107,6 +1116,9 @@ var shared_root_methods = {
         if (this.$root.style !== null) {
             url = url + '&style=' + this.$root.style;
         }
+        if (this.$root.offset) {
+            url += '&offset=' + this.$root.offset;
+        }
         var root = this.$root;
         api._getJSON(url, function (data, xhr) {
             if (typeof xhr.responseURL !== "undefined" && xhr.responseURL !== url) {
@@ -1124,7 +1136,8 @@ var shared_root_methods = {
                 root.events = undefined;
                 root.view = "weeks";
             } else if (data.events !== undefined) {
-                root.events = data.events;
+                root.events = root.offset ? root.events.concat(data.events) : data.events;
+                root.has_more_events = data.has_more_events;
                 root.weeks = undefined;
                 root.view = "events";
             } else {
@@ -1144,6 +1157,7 @@ var shared_root_methods = {
                 root.has_seating_plan = data.has_seating_plan;
                 root.itemnum = data.itemnum;
             }
+            root.offset = 0;
             root.poweredby = data.poweredby;
             if (root.loading > 0) {
                 root.loading--;
@@ -1155,6 +1169,7 @@ var shared_root_methods = {
                 root.startseating()
             }
         }, function (error) {
+            root.offset = 0;
             root.categories = [];
             root.currency = '';
             root.error = strings['loading_error'];
@@ -1342,6 +1357,8 @@ var create_widget = function (element) {
                 date: null,
                 frame_dismissed: false,
                 events: null,
+                has_more_events: false,
+                offset: 0,
                 view: null,
                 display_add_to_cart: false,
                 widget_data: widget_data,
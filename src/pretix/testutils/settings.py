@@ -38,6 +38,12 @@ PRETIX_AUTH_BACKENDS = [
 
 PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
 
+# Don't wait for locks longer than necessary
+PRETIX_LOCK_WAIT_TIMEOUT = 0.3
+
+# Write metrics right away
+METRICS_FLUSH_INTERVAL = 0
+
 # Disable celery
 CELERY_ALWAYS_EAGER = True
 HAS_CELERY = False
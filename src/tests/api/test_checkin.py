@@ -4,6 +4,8 @@ from decimal import Decimal
 from unittest import mock
 
 import pytest
+from django.core.cache import cache
+from django.test import override_settings
 from django.utils.timezone import now
 from django_countries.fields import Country
 from django_scopes import scopes_disabled
@@ -480,6 +482,62 @@ def test_list_limited_items_position_detail(token_client, organizer, event, clis
     assert p1 == resp.data
 
 
+@pytest.mark.django_db
+def test_changes_feed(token_client, organizer, event, clist_all, item, other_item, order):
+    url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/changes/'.format(
+        organizer.slug, event.slug, clist_all.pk
+    )
+    with scopes_disabled():
+        p1, p2 = order.positions.order_by('positionid')
+
+    resp = token_client.get(url)
+    assert resp.status_code == 200
+    assert not resp.data['has_more']
+    assert sorted(p['id'] for p in resp.data['results']) == [p1.pk, p2.pk]
+    assert resp.data['removed'] == []
+    cursor = resp.data['cursor']
+
+    resp = token_client.get(url + '?cursor=' + cursor)
+    assert resp.data['results'] == []
+    assert resp.data['cursor'] == cursor
+
+    with scopes_disabled():
+        p2.canceled = True
+        p2.save()
+    resp = token_client.get(url + '?cursor=' + cursor)
+    assert [p['id'] for p in resp.data['results']] == [p1.pk]
+    assert resp.data['removed'] == [p2.pk]
+    assert resp.data['cursor'] > cursor
+
+    # Recent changes are repeated until they are old enough to be settled
+    resp = token_client.get(url + '?cursor=' + resp.data['cursor'])
+    assert resp.data['removed'] == [p2.pk]
+
+
+@pytest.mark.django_db
+def test_changes_feed_pagination(token_client, organizer, event, clist_all, item, other_item, order):
+    url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/changes/'.format(
+        organizer.slug, event.slug, clist_all.pk
+    )
+    with scopes_disabled():
+        order2 = Order.objects.create(
+            code='BAR', event=event, email='dummy@dummy.test', status=Order.STATUS_PAID,
+            datetime=now(), expires=now(), total=23, locale='en'
+        )
+        p3 = order2.positions.create(positionid=1, item=item, price=Decimal("23"))
+
+    with mock.patch('pretix.api.views.checkin.CheckinListPositionViewSet.changes_page_size', 1):
+        resp = token_client.get(url)
+        assert resp.data['has_more']
+        assert len(resp.data['results']) == 2
+        resp = token_client.get(url + '?cursor=' + resp.data['cursor'])
+        assert not resp.data['has_more']
+        assert [p['id'] for p in resp.data['results']] == [p3.pk]
+
+    resp = token_client.get(url + '?cursor=foo')
+    assert resp.status_code == 400
+
+
 @pytest.mark.django_db
 def test_status(token_client, organizer, event, clist_all, item, other_item, order):
     with scopes_disabled():
@@ -528,6 +586,30 @@ def test_status(token_client, organizer, event, clist_all, item, other_item, ord
     ]
 
 
+@pytest.fixture
+def locmem_cache():
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+        cache.clear()
+        yield
+
+
+@pytest.mark.django_db
+def test_status_cached(locmem_cache, token_client, organizer, event, clist, clist_all, item, other_item, order):
+    url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/status/'.format(organizer.slug, event.slug, clist_all.pk)
+    with scopes_disabled():
+        op = order.positions.first()
+        Checkin.objects.create(position=op, list=clist)
+    resp = token_client.get(url)
+    assert resp.data['checkin_count'] == 0
+    assert resp.data['position_count'] == 2
+
+    with scopes_disabled():
+        Checkin.objects.create(position=op, list=clist_all)
+    resp = token_client.get(url)
+    assert resp.data['checkin_count'] == 1
+    assert resp.data['items'][0]['checkin_count'] == 1
+
+
 @pytest.mark.django_db
 def test_custom_datetime(token_client, organizer, clist, event, order):
     dt = now() - datetime.timedelta(days=1)
@@ -831,3 +913,112 @@ def test_question_multiple_choice(token_client, organizer, clist, event, order,
     with scopes_disabled():
         assert order.positions.first().answers.get(question=question[0]).answer == 'M, L'
         assert set(order.positions.first().answers.get(question=question[0]).options.all()) == {question[1], question[2]}
+
+
+@pytest.mark.django_db
+def test_batch_redeem(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p1, p2 = order.positions.order_by('positionid')
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/batch_redeem/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), [
+        {'secret': p1.secret, 'nonce': 'a', 'datetime': '2020-01-01T10:00:00Z'},
+        {'secret': p1.secret, 'nonce': 'a'},
+        {'secret': p1.secret, 'nonce': 'b'},
+        {'secret': p2.secret},
+        {'secret': 'unknown'},
+    ], format='json')
+    assert resp.status_code == 200
+    assert [(r['secret'], r['status'], r.get('reason')) for r in resp.data] == [
+        (p1.secret, 'ok', None),
+        (p1.secret, 'ok', None),
+        (p1.secret, 'error', 'already_redeemed'),
+        (p2.secret, 'error', 'not_found'),
+        ('unknown', 'error', 'not_found'),
+    ]
+    assert resp.data[0]['position']['id'] == p1.pk
+    assert len(resp.data[0]['position']['checkins']) == 1
+    with scopes_disabled():
+        ci = p1.checkins.get()
+        assert ci.datetime == datetime.datetime(2020, 1, 1, 10, 0, 0, tzinfo=UTC)
+        assert ci.nonce == 'a'
+        assert order.all_logentries().filter(action_type='pretix.event.checkin').count() == 1
+
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/batch_redeem/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), [
+        {'secret': p1.secret, 'force': True},
+    ], format='json')
+    assert resp.data[0]['status'] == 'ok'
+    with scopes_disabled():
+        assert p1.checkins.count() == 1
+        assert order.all_logentries().filter(action_type='pretix.event.checkin').count() == 2
+
+
+@pytest.mark.django_db
+def test_batch_redeem_concurrent_duplicate(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p1 = order.positions.order_by('positionid').first()
+        p3 = OrderPosition.objects.create(
+            order=order, positionid=3, item=p1.item, variation=None, price=Decimal("23"),
+            attendee_name_parts={'full_name': "Paul"}, secret="hnb8f3y5qxmp7tqv6zkcw2d4r9s3ea4u",
+            pseudonymization_id="CABDEFGHKL",
+        )
+        # Another device checks in the same position and commits before our insert, but after we looked
+        # for existing check-ins
+        competing = Checkin.objects.create(position=p1, list=clist, nonce='other-device')
+    checkin_filter = Checkin.objects.filter
+    lookups = []
+
+    def stale_filter(*args, **kwargs):
+        if 'position_id__in' in kwargs and not lookups:
+            lookups.append(kwargs)
+            return checkin_filter(*args, **kwargs).exclude(pk=competing.pk)
+        return checkin_filter(*args, **kwargs)
+
+    with mock.patch.object(Checkin.objects, 'filter', side_effect=stale_filter):
+        resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/batch_redeem/'.format(
+            organizer.slug, event.slug, clist.pk
+        ), [
+            {'secret': p1.secret, 'nonce': 'a'},
+            {'secret': p3.secret, 'nonce': 'b'},
+        ], format='json')
+    assert lookups
+    assert resp.status_code == 200
+    assert [(r['secret'], r['status'], r.get('reason')) for r in resp.data] == [
+        (p1.secret, 'error', 'already_redeemed'),
+        (p3.secret, 'ok', None),
+    ]
+    with scopes_disabled():
+        assert p1.checkins.get().nonce == 'other-device'
+        assert p3.checkins.get().nonce == 'b'
+        assert order.all_logentries().filter(action_type='pretix.event.checkin').count() == 1
+
+
+@pytest.mark.django_db
+def test_batch_redeem_questions(token_client, organizer, clist, event, order, question):
+    with scopes_disabled():
+        p = order.positions.first()
+    url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/batch_redeem/'.format(
+        organizer.slug, event.slug, clist.pk
+    )
+    resp = token_client.post(url, [{'secret': p.secret}], format='json')
+    assert resp.data[0]['status'] == 'incomplete'
+    with scopes_disabled():
+        assert resp.data[0]['questions'] == [QuestionSerializer(question[0]).data]
+
+    resp = token_client.post(url, [
+        {'secret': p.secret, 'answers': {question[0].pk: str(question[1].pk)}}
+    ], format='json')
+    assert resp.data[0]['status'] == 'ok'
+    with scopes_disabled():
+        assert p.answers.get(question=question[0]).answer == 'M'
+        assert p.checkins.count() == 1
+
+
+@pytest.mark.django_db
+def test_batch_redeem_invalid(token_client, organizer, clist, event, order):
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/batch_redeem/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'secret': 'foo'}, format='json')
+    assert resp.status_code == 400
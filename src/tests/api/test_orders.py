@@ -823,6 +823,29 @@ def test_orderposition_list(token_client, organizer, event, order, item, subeven
     assert len(resp.data['results']) == 2
 
 
+@pytest.mark.django_db
+def test_orderposition_search_tokens(token_client, organizer, event, order):
+    url = '/api/v1/organizers/{}/events/{}/orderpositions/?search={{}}'.format(organizer.slug, event.slug)
+    with scopes_disabled():
+        op = order.positions.first()
+    op.attendee_name_parts = {"full_name": "Maria Miller", "_scheme": "full"}
+    op.save()
+    assert not token_client.get(url.format('Peter')).data['results']
+    assert [op.pk] == [r['id'] for r in token_client.get(url.format('mill mar')).data['results']]
+    assert not token_client.get(url.format('mill john')).data['results']
+
+    with scopes_disabled():
+        ia = order.invoice_address
+    ia.name_parts = {"full_name": "John Doe", "_scheme": "full"}
+    ia.save()
+    assert [op.pk] == [r['id'] for r in token_client.get(url.format('john')).data['results']]
+
+    order.email = 'foo@example.net'
+    order.save()
+    assert [op.pk] == [r['id'] for r in token_client.get(url.format('example.net')).data['results']]
+    assert not token_client.get(url.format('dummy@dummy.dummy')).data['results']
+
+
 @pytest.mark.django_db
 def test_orderposition_detail(token_client, organizer, event, order, item, question):
     res = dict(TEST_ORDERPOSITION_RES)
@@ -0,0 +1,94 @@
+import os
+from datetime import timedelta
+
+import pytest
+from django.core.files.base import ContentFile
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import (
+    CachedFile, CachedTicket, CartPosition, Event, Order, OrderPosition,
+    Organizer,
+)
+from pretix.base.services import cleanup
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now(), plugins='pretix.plugins.banktransfer'
+    )
+    with scope(organizer=o):
+        yield event
+
+
+@pytest.fixture
+def item(event):
+    return event.items.create(name='Early-bird ticket', default_price=23, admission=True)
+
+
+@pytest.mark.django_db
+def test_clean_cart_positions_in_chunks(event, item, monkeypatch):
+    monkeypatch.setattr(cleanup, 'CHUNK_SIZE', 2)
+    old = now() - timedelta(days=15)
+    for i in range(3):
+        cp = CartPosition.objects.create(event=event, item=item, price=23, expires=old, cart_id='old')
+        CartPosition.objects.create(event=event, item=item, price=0, expires=old, cart_id='old', addon_to=cp)
+    current = CartPosition.objects.create(event=event, item=item, price=23, expires=now(), cart_id='new')
+
+    cleanup.clean_cart_positions(None)
+    assert list(CartPosition.objects.all()) == [current]
+
+
+@pytest.mark.django_db
+def test_clean_cart_positions_resumes(event, item, monkeypatch):
+    old = now() - timedelta(days=15)
+    for i in range(3):
+        CartPosition.objects.create(event=event, item=item, price=23, expires=old, cart_id='old')
+
+    monkeypatch.setattr(cleanup, 'TIME_BUDGET', 0)
+    cleanup.clean_cart_positions(None)
+    assert CartPosition.objects.count() == 3
+
+    monkeypatch.setattr(cleanup, 'TIME_BUDGET', 30)
+    cleanup.clean_cart_positions(None)
+    assert CartPosition.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_clean_cached_files(monkeypatch):
+    monkeypatch.setattr(cleanup, 'CHUNK_SIZE', 2)
+    files = []
+    for i in range(3):
+        cf = CachedFile.objects.create(expires=now() - timedelta(minutes=1), filename='foo.txt', type='text/plain')
+        cf.file.save('foo.txt', ContentFile(b'foo'))
+        files.append(cf.file.path)
+    CachedFile.objects.create(expires=now() - timedelta(minutes=1), filename='empty.txt', type='text/plain')
+    keep = CachedFile.objects.create(expires=now() + timedelta(minutes=1), filename='bar.txt', type='text/plain')
+
+    cleanup.clean_cached_files(None)
+    assert list(CachedFile.objects.all()) == [keep]
+    assert not any(os.path.exists(f) for f in files)
+
+
+@pytest.mark.django_db
+def test_clean_cached_tickets(event, item):
+    o = Order.objects.create(
+        code='FOO', event=event, email='dummy@dummy.test', status=Order.STATUS_PAID,
+        datetime=now(), expires=now() + timedelta(days=10), total=23, locale='en'
+    )
+    op = OrderPosition.objects.create(order=o, item=item, price=23)
+    ct = CachedTicket.objects.create(order_position=op, provider='pdf', type='application/pdf', extension='pdf')
+    ct.file.save('ticket.pdf', ContentFile(b'foo'))
+    fname = ct.file.path
+    CachedTicket.objects.filter(pk=ct.pk).update(created=now() - timedelta(days=31))
+    CachedTicket.objects.create(order_position=op, provider='pdf', type='application/pdf', extension='pdf',
+                                file=None)
+    CachedTicket.objects.exclude(pk=ct.pk).update(created=now() - timedelta(minutes=31))
+    new = CachedTicket.objects.create(order_position=op, provider='pdf', type='application/pdf', extension='pdf')
+
+    cleanup.clean_cached_tickets(None)
+    assert list(CachedTicket.objects.all()) == [new]
+    assert not os.path.exists(fname)
@@ -10,8 +10,8 @@ from django_countries.fields import Country
 from django_scopes import scope, scopes_disabled
 
 from pretix.base.models import (
-    Event, Invoice, InvoiceAddress, Item, ItemVariation, Order, OrderPosition,
-    Organizer,
+    Event, Invoice, InvoiceAddress, InvoiceNumberCounter, Item, ItemVariation,
+    Order, OrderPosition, Organizer,
 )
 from pretix.base.models.orders import OrderFee
 from pretix.base.services.invoices import (
@@ -436,6 +436,32 @@ def test_invoice_number_prefixes(env):
             )
 
 
+@pytest.mark.django_db
+def test_invoice_number_counter(env):
+    event, order = env
+    event.settings.set('invoice_numbers_consecutive', True)
+    assert generate_invoice(order).invoice_no == '00001'
+    assert generate_invoice(order).invoice_no == '00002'
+    counter = InvoiceNumberCounter.objects.get(organizer=event.organizer, prefix='DUMMY-')
+    assert counter.last_number == 2
+
+    # Counters are created from the existing invoices if they are missing
+    counter.delete()
+    assert generate_invoice(order).invoice_no == '00003'
+
+    # Numbers that are already taken are skipped
+    InvoiceNumberCounter.objects.filter(organizer=event.organizer, prefix='DUMMY-').update(last_number=1)
+    assert generate_invoice(order).invoice_no == '00004'
+    assert InvoiceNumberCounter.objects.get(organizer=event.organizer, prefix='DUMMY-').last_number == 4
+
+    # Failed transactions do not leave a gap
+    with pytest.raises(ValueError):
+        with transaction.atomic():
+            generate_invoice(order)
+            raise ValueError()
+    assert generate_invoice(order).invoice_no == '00005'
+
+
 @pytest.mark.django_db
 def test_sales_channels_qualify(env):
     event, order = env
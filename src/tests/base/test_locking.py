@@ -1,10 +1,14 @@
+import os
 import time
 
 import pytest
+from django.test import override_settings
 from django.utils.timezone import now
+from django_redis import get_redis_connection
 from django_scopes import scope, scopes_disabled
 
-from pretix.base.models import Event, Organizer
+from pretix.base import metrics
+from pretix.base.models import Event, Organizer, Quota, Voucher
 from pretix.base.services import locking
 from pretix.base.services.locking import (
     LockReleaseException, LockTimeoutException,
@@ -54,3 +58,158 @@ def test_lock_timeout_steal(event):
     locking.lock_event(ev)
     with pytest.raises(LockReleaseException):
         locking.release_event(event)
+
+
+@pytest.mark.django_db
+def test_object_lock_keys(event):
+    q1 = Quota.objects.create(event=event, name='Limited', size=10)
+    q2 = Quota.objects.create(event=event, name='Unlimited', size=None)
+    v = Voucher.objects.create(event=event)
+    with override_settings(PRETIX_OBJECT_LOCKING=True):
+        lm = event.lock(quotas=[q2, q1], vouchers=[v])
+    assert isinstance(lm, locking.ObjectLockManager)
+    assert lm.keys == [('quota', q1.pk), ('voucher', v.pk)]
+    assert isinstance(event.lock(quotas=[q1]), locking.LockManager)
+    assert isinstance(event.lock(), locking.LockManager)
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_OBJECT_LOCKING=True)
+def test_object_lock_without_redis_locks_event(event):
+    q = Quota.objects.create(event=event, name='Limited', size=10)
+    with event.lock(quotas=[q]):
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+                with ev.lock(quotas=[]):
+                    pass
+    with event.lock():
+        pass
+
+
+@pytest.mark.django_db
+def test_lock_waits_for_release(event, monkeypatch):
+    monkeypatch.setattr(locking, 'LOCK_TIMEOUT', 0.5)
+    locking.lock_event(event)
+    ev = Event.objects.get(id=event.id)
+    with override_settings(PRETIX_LOCK_WAIT_TIMEOUT=0.1):
+        t = time.time()
+        with pytest.raises(LockTimeoutException):
+            locking.lock_event(ev)
+        assert 0.1 <= time.time() - t < 0.5
+    with override_settings(PRETIX_LOCK_WAIT_TIMEOUT=2):
+        locking.lock_event(ev)
+    with pytest.raises(LockReleaseException):
+        locking.release_event(event)
+    locking.release_event(ev)
+
+
+@pytest.fixture
+def redis_locking(settings, monkeypatch):
+    # The Lua scripts used for locking cannot be emulated reliably, so these tests need a real Redis server.
+    # The database given here is flushed before and after every test.
+    url = os.environ.get('PRETIX_TEST_REDIS')
+    if not url:
+        pytest.skip('PRETIX_TEST_REDIS is not set')
+    settings.HAS_REDIS = True
+    settings.CACHES = dict(settings.CACHES, redis={
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': url,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    })
+    rc = get_redis_connection('redis')
+    monkeypatch.setattr(metrics, 'redis', rc, raising=False)
+    rc.flushdb()
+    yield rc
+    rc.flushdb()
+
+
+@pytest.mark.django_db
+def test_redis_object_locks_exclude_same_object(event, redis_locking):
+    locks = locking.lock_objects(event, [('quota', 1), ('voucher', 2)])
+    ev = Event.objects.get(id=event.id)
+    with pytest.raises(LockTimeoutException):
+        locking.lock_objects(ev, [('voucher', 2)])
+    locking.release_objects(event, locks)
+    locking.release_objects(ev, locking.lock_objects(ev, [('voucher', 2)]))
+
+
+@pytest.mark.django_db
+def test_redis_object_locks_allow_other_objects(event, redis_locking):
+    locks = locking.lock_objects(event, [('quota', 1)])
+    ev = Event.objects.get(id=event.id)
+    other_locks = locking.lock_objects(ev, [('quota', 2), ('seat', 1)])
+    locking.release_objects(ev, other_locks)
+    locking.release_objects(event, locks)
+
+
+@pytest.mark.django_db
+def test_redis_shared_hold_excludes_event_lock(event, redis_locking):
+    locks = locking.lock_objects(event, [('quota', 1)])
+    ev = Event.objects.get(id=event.id)
+    with pytest.raises(LockTimeoutException):
+        locking.lock_event(ev)
+    assert redis_locking.zcard('pretix_event_%d_queue' % event.id) == 0
+
+    locking.release_objects(event, locks)
+    assert redis_locking.zcard('pretix_event_%d_shared' % event.id) == 0
+    locking.lock_event(ev)
+    locking.release_event(ev)
+
+
+@pytest.mark.django_db
+def test_redis_event_lock_excludes_object_locks(event, redis_locking):
+    locking.lock_event(event)
+    ev = Event.objects.get(id=event.id)
+    with pytest.raises(LockTimeoutException):
+        locking.lock_objects(ev, [('quota', 1)])
+    assert redis_locking.zcard('pretix_event_%d_shared' % event.id) == 0
+
+    locking.release_event(event)
+    locking.release_objects(ev, locking.lock_objects(ev, [('quota', 1)]))
+
+
+@pytest.mark.django_db
+def test_redis_object_lock_timeout_releases_everything(event, redis_locking):
+    locks = locking.lock_objects(event, [('voucher', 2)])
+    ev = Event.objects.get(id=event.id)
+    with pytest.raises(LockTimeoutException):
+        locking.lock_objects(ev, [('quota', 1), ('voucher', 2)])
+    locking.release_objects(event, locks)
+
+    # Neither the lock on the quota nor the shared hold of the failed attempt are left behind
+    assert not redis_locking.exists('pretix_event_%d_quota_1' % event.id)
+    assert redis_locking.zcard('pretix_event_%d_shared' % event.id) == 0
+    locking.lock_event(event)
+    locking.release_event(event)
+
+
+@pytest.mark.django_db
+def test_redis_shared_hold_expires(event, redis_locking, monkeypatch):
+    monkeypatch.setattr(locking, 'LOCK_TIMEOUT', 1)
+    locking.lock_objects(event, [('quota', 1)])
+    ev = Event.objects.get(id=event.id)
+    with pytest.raises(LockTimeoutException):
+        locking.lock_event(ev)
+    time.sleep(1.5)
+    locking.lock_event(ev)
+    locking.release_event(ev)
+
+
+@pytest.mark.django_db
+def test_redis_object_lock_manager(event, redis_locking):
+    q = Quota.objects.create(event=event, name='Limited', size=10)
+    with override_settings(PRETIX_OBJECT_LOCKING=True):
+        with event.lock(quotas=[q]):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+            with pytest.raises(LockTimeoutException):
+                with ev.lock():
+                    pass
+            with pytest.raises(LockTimeoutException):
+                with ev.lock(quotas=[q]):
+                    pass
+        with ev.lock():
+            pass
@@ -1,6 +1,7 @@
 # pytest
 
 import base64
+import time
 
 import pytest
 from django.test import override_settings
@@ -27,6 +28,10 @@ class FakeRedis(object):
         # bytes-conversion here for emulating redis behavior without making incr too hard
         return bytes(self.storage[rkey], encoding='utf-8')
 
+    def hscan_iter(self, k, count=None):
+        for rkey, value in self.storage.items():
+            yield bytes(rkey, encoding='utf-8'), bytes(str(value), encoding='utf-8')
+
     def pipeline(self):
         return self
 
@@ -166,6 +171,65 @@ def test_histogram(monkeypatch):
     assert fake_redis.storage['my_histogram_bucket{dimension="two",le="1.0"}'] == 1
 
 
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=60)
+def test_buffered(monkeypatch):
+
+    fake_redis = FakeRedis()
+
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+    monkeypatch.setattr(metrics, "buffer", metrics.MetricsBuffer())
+
+    test_counter = metrics.Counter("my_counter", "this is a helpstring", ["dimension"])
+    test_gauge = metrics.Gauge("my_gauge", "this is a helpstring", ["dimension"])
+    test_hist = metrics.Histogram("my_histogram", "this is a helpstring", ["dimension"])
+
+    test_counter.inc(dimension="one")
+    test_counter.inc(2, dimension="one")
+    test_gauge.inc(5, dimension="one")
+    test_gauge.set(3, dimension="two")
+    test_gauge.dec(1, dimension="two")
+    test_hist.observe(3.0, dimension="one")
+    test_hist.observe(0.9, dimension="one")
+    assert fake_redis.storage == {}
+
+    metrics.buffer.flush()
+    assert fake_redis.storage['my_counter{dimension="one"}'] == 3
+    assert fake_redis.storage['my_gauge{dimension="one"}'] == 5
+    assert fake_redis.storage['my_gauge{dimension="two"}'] == 2
+    assert fake_redis.storage['my_histogram_count{dimension="one"}'] == 2
+    assert fake_redis.storage['my_histogram_sum{dimension="one"}'] == 3.9
+    assert fake_redis.storage['my_histogram_bucket{dimension="one",le="1.0"}'] == 1
+    assert fake_redis.storage['my_histogram_bucket{dimension="one",le="5.0"}'] == 2
+
+    test_counter.inc(dimension="one")
+    assert fake_redis.storage['my_counter{dimension="one"}'] == 3
+    metrics.buffer.max_keys = 2
+    test_counter.inc(dimension="two")
+    assert fake_redis.storage['my_counter{dimension="one"}'] == 4
+    assert fake_redis.storage['my_counter{dimension="two"}'] == 1
+
+    metrics.buffer.max_keys = 1000
+    with override_settings(METRICS_FLUSH_INTERVAL=0.01):
+        test_counter.inc(dimension="one")
+        time.sleep(0.02)
+        test_counter.inc(dimension="one")
+    assert fake_redis.storage['my_counter{dimension="one"}'] == 6
+
+
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=0.05)
+def test_buffered_flushed_when_idle(monkeypatch):
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+    monkeypatch.setattr(metrics, "buffer", metrics.MetricsBuffer())
+
+    test_counter = metrics.Counter("my_counter", "this is a helpstring", ["dimension"])
+    test_counter.inc(dimension="one")
+    assert fake_redis.storage == {}
+    # No further update or request comes in, the timer still writes the update
+    time.sleep(0.3)
+    assert fake_redis.storage['my_counter{dimension="one"}'] == 1
+
+
 @pytest.mark.django_db
 @override_settings(HAS_REDIS=True, METRICS_USER="foo", METRICS_PASSPHRASE="bar")
 def test_metrics_view(monkeypatch, client):
@@ -191,6 +255,25 @@ def test_metrics_view(monkeypatch, client):
     assert "{} {}".format(fullname, counter_value) not in client.get("/metrics", headers=basic_auth)
 
 
+@pytest.mark.django_db
+@override_settings(HAS_REDIS=True, METRICS_ENABLED=True, METRICS_USER="foo", METRICS_PASSPHRASE="bar")
+def test_metrics_view_output(monkeypatch, client):
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+
+    metrics.pretix_view_duration_seconds.observe(0.3, status_code="200", method="GET", url_name="foo")
+
+    basic_auth = "Basic " + base64.b64encode(b"foo:bar").decode()
+    r = client.get("/metrics", HTTP_AUTHORIZATION=basic_auth)
+    assert r.status_code == 200
+    lines = b"".join(r.streaming_content).decode().splitlines()
+    assert 'pretix_view_duration_seconds_count{status_code="200",method="GET",url_name="foo"} 1.0' in lines
+    assert 'pretix_view_requests_total{status_code="200",method="GET",url_name="foo"} 1.0' in lines
+    assert 'pretix_model_instances{model="pretixbase.event"} 0' in lines
+    assert lines[-1].startswith('pretix_metrics_scrape_duration_seconds ')
+
+
 @pytest.mark.django_db
 @override_settings(HAS_REDIS=True, METRICS_USER="foo", METRICS_PASSPHRASE="bar")
 def test_do_not_break_append_slash(monkeypatch, client):
@@ -2,6 +2,7 @@ import datetime
 import sys
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest import mock
 
 import pytest
 import pytz
@@ -10,22 +11,24 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
 from django_scopes import scope
 
 from pretix.base.i18n import language
 from pretix.base.models import (
-    CachedFile, CartPosition, Checkin, CheckinList, Event, Item, ItemCategory,
-    ItemVariation, Order, OrderFee, OrderPayment, OrderPosition, OrderRefund,
-    Organizer, Question, Quota, SeatingPlan, User, Voucher, WaitingListEntry,
+    CachedFile, CartPosition, Checkin, CheckinList, Event, InvoiceAddress,
+    Item, ItemCategory, ItemVariation, Order, OrderFee, OrderPayment,
+    OrderPosition, OrderPositionSearchToken, OrderRefund, Organizer, Question,
+    Quota, SeatingPlan, User, Voucher, WaitingListEntry,
 )
 from pretix.base.models.event import SubEvent
 from pretix.base.models.items import (
-    ItemBundle, SubEventItem, SubEventItemVariation,
+    ItemBundle, QuotaCounter, SubEventItem, SubEventItemVariation,
 )
 from pretix.base.reldate import RelativeDate, RelativeDateWrapper
 from pretix.base.services.orders import OrderError, cancel_order, perform_order
+from pretix.base.services.quotas import reconcile_quota_counters
 from pretix.testutils.scope import classscope
 
 
@@ -480,9 +483,80 @@ class QuotaTestCase(BaseQuotaTestCase):
         self.assertEqual(self.item1.check_quotas(subevent=se2), (Quota.AVAILABILITY_OK, 50 - 2 - 4 - 5 - 13))
         self.assertEqual(q1.availability(), (Quota.AVAILABILITY_OK, 50 - 5 - 6 - 8 - 16))
         self.assertEqual(q2.availability(), (Quota.AVAILABILITY_OK, 50 - 2 - 4 - 5 - 13))
+        self.assertEqual(Quota.objects.compute_availability([q1, q2]), {
+            q1: (Quota.AVAILABILITY_OK, 50 - 5 - 6 - 8 - 16),
+            q2: (Quota.AVAILABILITY_OK, 50 - 2 - 4 - 5 - 13),
+        })
         self.event.has_subevents = False
         self.event.save()
 
+    @classscope(attr='o')
+    def test_compute_availability_matches_single(self):
+        self.quota.items.add(self.item1)
+        self.quota.items.add(self.item2)
+        self.quota.variations.add(self.var1)
+        self.quota.size = 20
+        self.quota.save()
+        q2 = Quota.objects.create(event=self.event, name="Test 2", size=5)
+        q2.items.add(self.item2)
+        q2.variations.add(self.var1)
+        q2.variations.add(self.var2)
+        q3 = Quota.objects.create(event=self.event, name="Test 3", size=None)
+        q3.items.add(self.item1)
+        q4 = Quota.objects.create(event=self.event, name="Test 4", size=50, closed=True)
+        q4.items.add(self.item1)
+
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3), total=6)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        OrderPosition.objects.create(order=order, item=self.item2, variation=self.var1, price=2)
+        OrderPosition.objects.create(order=order, item=self.item2, variation=self.var2, price=2)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3), total=2)
+        OrderPosition.objects.create(order=order, item=self.item2, variation=self.var2, price=2)
+        Voucher.objects.create(quota=q2, event=self.event, block_quota=True, max_usages=2)
+        Voucher.objects.create(item=self.item1, event=self.event, block_quota=True, max_usages=3)
+        Voucher.objects.create(item=self.item2, variation=self.var1, event=self.event, block_quota=True,
+                               max_usages=1, valid_until=now() - timedelta(days=1))
+        WaitingListEntry.objects.create(event=self.event, item=self.item2, variation=self.var1, email='foo@bar.com')
+        CartPosition.objects.create(event=self.event, item=self.item1, price=2, expires=now() + timedelta(days=3))
+        CartPosition.objects.create(event=self.event, item=self.item2, variation=self.var2, price=2,
+                                    expires=now() + timedelta(days=3))
+
+        expected_by_mode = {}
+        for count_waitinglist in (True, False):
+            expected = expected_by_mode[count_waitinglist] = {
+                q: q.availability(count_waitinglist=count_waitinglist) for q in (self.quota, q2, q3, q4)
+            }
+            assert expected[self.quota] == (Quota.AVAILABILITY_OK, 20 - 2 - 3 - (1 if count_waitinglist else 0) - 1)
+            assert expected[q2] == (Quota.AVAILABILITY_ORDERED, 0)
+            assert expected[q3] == (Quota.AVAILABILITY_OK, None)
+            assert expected[q4] == (Quota.AVAILABILITY_ORDERED, 0)
+            with self.assertNumQueries(6 if count_waitinglist else 5):
+                assert Quota.objects.compute_availability(
+                    [self.quota, q2, q3, q4], count_waitinglist=count_waitinglist
+                ) == expected
+
+        # On a cold cache, the results are written back with one query for all quotas
+        Quota.objects.update(cached_availability_time=None)
+        quotas = list(Quota.objects.filter(pk__in=[self.quota.pk, q2.pk, q3.pk, q4.pk]))
+        with self.assertNumQueries(8):
+            assert Quota.objects.compute_availability(quotas) == expected_by_mode[True]
+        assert not Quota.objects.filter(cached_availability_time__isnull=True).exists()
+
+    @classscope(attr='o')
+    def test_compute_availability_cache(self):
+        self.quota.items.add(self.item1)
+        cache = {}
+        assert Quota.objects.compute_availability([self.quota], _cache=cache) == {
+            self.quota: (Quota.AVAILABILITY_OK, 2)
+        }
+        assert cache[self.quota.pk] == (Quota.AVAILABILITY_OK, 2)
+        with self.assertNumQueries(0):
+            assert Quota.objects.compute_availability([self.quota], _cache=cache) == {
+                self.quota: (Quota.AVAILABILITY_OK, 2)
+            }
+
     @classscope(attr='o')
     def test_close_when_full_on_calculation(self):
         self.quota.close_when_sold_out = True
@@ -502,6 +576,151 @@ class QuotaTestCase(BaseQuotaTestCase):
         assert self.quota.availability() == (Quota.AVAILABILITY_ORDERED, 0)
 
 
+@override_settings(PRETIX_QUOTA_COUNTERS=True)
+class QuotaCounterTestCase(BaseQuotaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quota.size = 5
+        self.quota.save()
+        self.quota.items.add(self.item1)
+
+    @classscope(attr='o')
+    def test_seeded_on_read(self):
+        assert not QuotaCounter.objects.filter(quota=self.quota).exists()
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+        assert QuotaCounter.objects.get(quota=self.quota).counts == {
+            'paid_orders': 0, 'pending_orders': 0, 'waiting_list': 0
+        }
+        with self.assertNumQueries(5):
+            assert Quota.objects.compute_availability([self.quota]) == {self.quota: (Quota.AVAILABILITY_OK, 5)}
+
+    @classscope(attr='o')
+    def test_updated_on_changes(self):
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3), total=2)
+        op = OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        order._update_quota_counters([op], added_status=order.status)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 4)
+
+        order.status = Order.STATUS_PAID
+        order.save()
+        counter = QuotaCounter.objects.get(quota=self.quota)
+        assert counter.paid_orders == 1
+        assert counter.pending_orders == 0
+
+        order = Order.objects.get(pk=order.pk)
+        order.status = Order.STATUS_CANCELED
+        order.save()
+        assert QuotaCounter.objects.get(quota=self.quota).paid_orders == 0
+
+        v = Voucher.objects.create(item=self.item1, event=self.event, block_quota=True, max_usages=2)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 3)
+        v.delete()
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+        wle = WaitingListEntry.objects.create(event=self.event, item=self.item1, email='foo@bar.com')
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 4)
+        assert self.quota.availability(count_waitinglist=False) == (Quota.AVAILABILITY_OK, 5)
+        wle = WaitingListEntry.objects.get(pk=wle.pk)
+        wle.delete()
+        assert QuotaCounter.objects.get(quota=self.quota).waiting_list == 0
+
+    @classscope(attr='o')
+    def test_refresh_from_db_status(self):
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3), total=2)
+        op = OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        order._update_quota_counters([op], added_status=order.status)
+
+        other = Order.objects.get(pk=order.pk)
+        other.status = Order.STATUS_PAID
+        other.save()
+
+        # Saving the refreshed instance must not count the status change a second time
+        order.refresh_from_db()
+        order.save()
+        counter = QuotaCounter.objects.get(quota=self.quota)
+        assert counter.paid_orders == 1
+        assert counter.pending_orders == 0
+
+        order.refresh_from_db(fields=['status'])
+        order.status = Order.STATUS_CANCELED
+        order.save()
+        assert QuotaCounter.objects.get(quota=self.quota).paid_orders == 0
+
+    @classscope(attr='o')
+    def test_deltas_applied_without_recount(self):
+        self.quota.availability()
+        QuotaCounter.objects.filter(quota=self.quota).update(pending_orders=2)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3), total=2)
+        op = OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        with self.assertNumQueries(7):
+            Quota.objects.update_counters([op], pending_orders=1)
+        assert QuotaCounter.objects.get(quota=self.quota).pending_orders == 3
+
+    @classscope(attr='o')
+    def test_expiring_cart_position(self):
+        self.quota.availability()
+        cp = CartPosition.objects.create(event=self.event, item=self.item1, price=2,
+                                         expires=now() + timedelta(minutes=10))
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 4)
+        assert self.quota.availability(now_dt=now() + timedelta(minutes=15)) == (Quota.AVAILABILITY_OK, 5)
+        cp.delete()
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+    @classscope(attr='o')
+    def test_reset_on_product_changes(self):
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3), total=4)
+        OrderPosition.objects.create(order=order, item=self.item2, variation=self.var1, price=2)
+        OrderPosition.objects.create(order=order, item=self.item2, variation=self.var1, price=2)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+        self.quota.variations.add(self.var1)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 3)
+        assert QuotaCounter.objects.get(quota=self.quota).paid_orders == 2
+
+        self.var1.quotas.remove(self.quota)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+        self.var1.quotas.add(self.quota)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 3)
+        self.quota.variations.clear()
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+    @classscope(attr='o')
+    def test_reset_on_subevent_change(self):
+        self.event.has_subevents = True
+        self.event.save()
+        se1 = self.event.subevents.create(name="Foo", date_from=now())
+        se2 = self.event.subevents.create(name="Bar", date_from=now())
+        self.quota.subevent = se1
+        self.quota.save()
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3), total=2)
+        OrderPosition.objects.create(order=order, item=self.item1, subevent=se2, price=2)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+        quota = Quota.objects.get(pk=self.quota.pk)
+        quota.subevent = se2
+        quota.save()
+        assert quota.availability() == (Quota.AVAILABILITY_OK, 4)
+        self.event.has_subevents = False
+        self.event.save()
+
+    @classscope(attr='o')
+    def test_reconcile(self):
+        self.quota.availability()
+        QuotaCounter.objects.filter(quota=self.quota).update(paid_orders=3, waiting_list=1)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 1)
+        reconcile_quota_counters(self.event)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 5)
+
+
 class BundleQuotaTestCase(BaseQuotaTestCase):
     def setUp(self):
         super().setUp()
@@ -1515,6 +1734,29 @@ class OrderTestCase(BaseQuotaTestCase):
             p2: Decimal('10.00'),
         }
 
+    @classscope(attr='o')
+    def test_search_tokens_rebuilt_on_change_only(self):
+        op = OrderPosition.objects.get(pk=self.op1.pk)
+        order = Order.objects.get(pk=self.order.pk)
+        with mock.patch.object(OrderPositionSearchToken, 'index') as index:
+            op.price = Decimal('13.00')
+            op.save()
+            order.email = 'foo@example.org'
+            order.save(update_fields=['last_modified'])
+            InvoiceAddress.objects.create(order=order, company='Foo')
+            assert not index.called
+
+            op.attendee_email = 'foo@example.org'
+            op.save()
+            index.assert_called_once_with([op.pk])
+            index.reset_mock()
+
+            order.save()
+            assert index.called
+            index.reset_mock()
+            order.save()
+            assert not index.called
+
 
 class ItemCategoryTest(TestCase):
     """
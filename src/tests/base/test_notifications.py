@@ -8,7 +8,7 @@ from django.utils.timezone import now
 from django_scopes import scope
 
 from pretix.base.models import (
-    Event, Item, Order, OrderPosition, Organizer, User,
+    Event, Item, LogEntry, Order, OrderPosition, Organizer, User,
 )
 
 
@@ -130,3 +130,20 @@ def test_notification_ignore_insufficient_permissions(event, order, user, team,
     assert len(djmail.outbox) == 0
 
 # TODO: Test email content
+
+
+@pytest.mark.django_db
+def test_notification_trigger_bulk_log(event, order, user, monkeypatch_on_commit):
+    djmail.outbox = []
+    user.notification_settings.create(
+        method='mail', event=event, action_type='pretix.event.order.paid', enabled=True
+    )
+    with transaction.atomic():
+        with LogEntry.bulk_log():
+            order.log_action('pretix.event.order.paid', {})
+            order.log_action('pretix.event.order.comment', {})
+            order.log_action('pretix.event.order.paid', {})
+            assert not LogEntry.objects.filter(object_id=order.pk).exists()
+            assert len(djmail.outbox) == 0
+        assert LogEntry.objects.filter(object_id=order.pk).count() == 3
+    assert len(djmail.outbox) == 2
@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
+from unittest import mock
 
 import pytest
 import pytz
 from django.core import mail as djmail
 from django.dispatch import receiver
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils.timezone import make_aware, now
 from django_countries.fields import Country
 from django_scopes import scope
@@ -13,18 +14,20 @@ from django_scopes import scope
 from pretix.base.channels import SalesChannel
 from pretix.base.decimal import round_decimal
 from pretix.base.models import (
-    CartPosition, Event, InvoiceAddress, Item, Order, OrderPosition, Organizer,
-    SeatingPlan,
+    CachedCombinedTicket, CachedTicket, CartPosition, Event, InvoiceAddress,
+    Item, LogEntry, Order, OrderPosition, Organizer, Quota, SeatingPlan,
 )
-from pretix.base.models.items import SubEventItem
+from pretix.base.models.items import QuotaCounter, SubEventItem
 from pretix.base.models.orders import OrderFee, OrderPayment, OrderRefund
 from pretix.base.payment import FreeOrderProvider
 from pretix.base.reldate import RelativeDate, RelativeDateWrapper
+from pretix.base.services import tickets
 from pretix.base.services.invoices import generate_invoice
 from pretix.base.services.orders import (
     OrderChangeManager, OrderError, _create_order, approve_order, cancel_order,
     deny_order, expire_orders, send_download_reminders, send_expiry_warnings,
 )
+from pretix.base.services.tickets import invalidate_cache
 from pretix.base.signals import register_sales_channels
 from pretix.plugins.banktransfer.payment import BankTransfer
 from pretix.testutils.scope import classscope
@@ -193,6 +196,43 @@ def test_expiring(event):
     assert o2.invoices.last().is_cancellation is True
 
 
+@pytest.mark.django_db
+def test_expiring_log_written_per_chunk(event):
+    orders = [
+        Order.objects.create(
+            code='FO{}'.format(i), event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING, locale='en',
+            datetime=now(), expires=now() - timedelta(days=10),
+            total=12,
+        ) for i in range(3)
+    ]
+    with mock.patch('pretix.base.services.orders.EXPIRE_CHUNK_SIZE', 2), \
+            mock.patch.object(LogEntry, '_bulk_save', wraps=LogEntry._bulk_save) as bulk_save:
+        expire_orders(None)
+    assert bulk_save.call_count == 2
+    for o in orders:
+        o.refresh_from_db()
+        assert o.status == Order.STATUS_EXPIRED
+        assert o.all_logentries().filter(action_type='pretix.event.order.expired').exists()
+
+
+@pytest.mark.django_db
+def test_expiring_failure_discards_log(event):
+    o = Order.objects.create(
+        code='FO2', event=event, email='dummy@dummy.test',
+        status=Order.STATUS_PENDING, locale='en',
+        datetime=now(), expires=now() - timedelta(days=10),
+        total=12,
+    )
+    generate_invoice(o)
+    with mock.patch('pretix.base.services.orders.generate_cancellation', side_effect=ValueError):
+        with pytest.raises(ValueError):
+            expire_orders(None)
+    o.refresh_from_db()
+    assert o.status == Order.STATUS_PENDING
+    assert not o.all_logentries().filter(action_type='pretix.event.order.expired').exists()
+
+
 @pytest.mark.django_db
 def test_expiring_paid_invoice(event):
     o2 = Order.objects.create(
@@ -994,6 +1034,26 @@ class OrderChangeManagerTests(TestCase):
         assert self.op1.canceled
         assert self.op1.addons.first().canceled
 
+    @classscope(attr='o')
+    @override_settings(PRETIX_QUOTA_COUNTERS=True)
+    def test_cancel_with_addon_updates_quota_counters(self):
+        self.shirt.category = self.event.categories.create(name='Add-ons', is_addon=True)
+        self.ticket.addons.create(addon_category=self.shirt.category)
+        shirt_quota = self.event.quotas.create(name='Shirts', size=10)
+        shirt_quota.items.add(self.shirt)
+        self.ocm.add_position(self.shirt, None, Decimal('13.00'), self.op1)
+        self.ocm.commit()
+        assert QuotaCounter.objects.get(quota=shirt_quota).pending_orders == 1
+        assert QuotaCounter.objects.get(quota=self.quota).pending_orders == 3
+
+        self.order.refresh_from_db()
+        self.ocm = OrderChangeManager(self.order, None)
+        self.ocm.cancel(self.op1)
+        self.ocm.commit()
+        assert QuotaCounter.objects.get(quota=shirt_quota).pending_orders == 0
+        assert QuotaCounter.objects.get(quota=self.quota).pending_orders == 1
+        assert shirt_quota.availability() == (Quota.AVAILABILITY_OK, 10)
+
     @classscope(attr='o')
     def test_free_to_paid(self):
         self.order.status = Order.STATUS_PAID
@@ -2454,3 +2514,64 @@ def test_issue_when_paid_and_changed(event):
     op2 = order.positions.last()
     gc2 = op2.issued_gift_cards.get()
     assert gc2.value == op2.price
+
+
+@pytest.mark.django_db(transaction=True)
+def test_pregenerate_tickets_when_paid(event, settings):
+    settings.HAS_CELERY = True
+    event.plugins += ',pretix.plugins.ticketoutputpdf'
+    event.save()
+    event.settings.ticketoutput_pdf__enabled = True
+    event.settings.ticket_download = True
+    ticket = Item.objects.create(event=event, name='Early-bird ticket',
+                                 default_price=Decimal('23.00'), admission=True)
+    cp1 = CartPosition.objects.create(
+        item=ticket, price=23, expires=now() + timedelta(days=1), event=event, cart_id="123"
+    )
+    order = _create_order(event, email='dummy@example.org', positions=[cp1],
+                          now_dt=now(), payment_provider=BankTransfer(event),
+                          locale='de')[0]
+    assert not CachedCombinedTicket.objects.filter(order=order).exists()
+    order.payments.first().confirm()
+
+    op = order.positions.first()
+    assert CachedCombinedTicket.objects.get(order=order, provider='pdf').file
+    ct = CachedTicket.objects.get(order_position=op, provider='pdf')
+    assert ct.file
+
+    invalidate_cache(event.pk, order=order.pk)
+    assert CachedTicket.objects.get(order_position=op, provider='pdf').pk != ct.pk
+
+
+@pytest.mark.django_db
+def test_pregenerate_tickets_after_invalidation_chunked(event, settings, monkeypatch):
+    settings.HAS_CELERY = True
+    ticket = Item.objects.create(event=event, name='Early-bird ticket', default_price=Decimal('23.00'))
+    orders = []
+    for i in range(3):
+        o = Order.objects.create(event=event, status=Order.STATUS_PAID, expires=now() + timedelta(days=10),
+                                 total=23, locale='en')
+        op = OrderPosition.objects.create(order=o, item=ticket, price=Decimal('23.00'))
+        CachedTicket.objects.create(order_position=op, provider='pdf', type='application/pdf')
+        orders.append(o.pk)
+
+    monkeypatch.setattr(tickets, 'PREGENERATION_CHUNK_SIZE', 2)
+    with mock.patch('pretix.base.services.tickets.pregenerate_tickets.apply_async') as apply_async:
+        invalidate_cache(event.pk, provider='pdf')
+    assert [c[1]['kwargs']['orders'] for c in apply_async.call_args_list] == [orders[:2], orders[2:]]
+    assert not CachedTicket.objects.exists()
+
+    # Only the orders of the invalidated product are scheduled, no matter how many there are
+    other = Item.objects.create(event=event, name='Other ticket', default_price=Decimal('23.00'))
+    o = Order.objects.create(event=event, status=Order.STATUS_PAID, expires=now() + timedelta(days=10),
+                             total=23, locale='en')
+    op = OrderPosition.objects.create(order=o, item=other, price=Decimal('23.00'))
+    CachedTicket.objects.create(order_position=op, provider='pdf', type='application/pdf')
+    for pk in orders:
+        CachedTicket.objects.create(order_position=Order.objects.get(pk=pk).positions.first(), provider='pdf',
+                                    type='application/pdf')
+    monkeypatch.setattr(tickets, 'PREGENERATION_CHUNK_SIZE', 1)
+    with mock.patch('pretix.base.services.tickets.pregenerate_tickets.apply_async') as apply_async:
+        invalidate_cache(event.pk, item=ticket.pk)
+    assert [c[1]['kwargs']['orders'] for c in apply_async.call_args_list] == [[pk] for pk in orders]
+    assert CachedTicket.objects.get().order_position == op
@@ -0,0 +1,134 @@
+from datetime import timedelta
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Event, Organizer
+from pretix.base.services import periodic
+from pretix.base.services.periodic import (
+    filter_shard, get_job_name, periodic_job, run_periodic_job, schedule_jobs,
+    send_periodic_task,
+)
+from pretix.base.signals import periodic_task
+
+calls = []
+
+
+def simple_job(sender, **kwargs):
+    calls.append(kwargs)
+
+
+def hourly_job(sender, **kwargs):
+    calls.append(kwargs)
+
+
+@scopes_disabled()
+def sharded_job(sender, **kwargs):
+    calls.append(set(filter_shard(Event.objects.all(), 'pk', **kwargs).values_list('slug', flat=True)))
+
+
+def failing_job(sender, **kwargs):
+    raise ValueError('Job failed')
+
+
+def overrunning_job(sender, **kwargs):
+    # Our lock expired while we were running and the next run took it
+    cache.set('pretix_periodic_job_running_{}_0'.format(get_job_name(overrunning_job)), 'later')
+
+
+def signal_receiver(sender, **kwargs):
+    calls.append('signal')
+
+
+@pytest.fixture(autouse=True)
+def jobs(monkeypatch):
+    del calls[:]
+    monkeypatch.setattr(periodic, '_jobs', {})
+    registered = {
+        'simple_job': periodic_job()(simple_job),
+        'hourly_job': periodic_job(interval=timedelta(hours=1))(hourly_job),
+        'sharded_job': periodic_job(sharded=True)(sharded_job),
+        'failing_job': periodic_job()(failing_job),
+    }
+    yield registered
+
+
+@pytest.fixture
+def locmem_cache():
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+        cache.clear()
+        yield
+
+
+@pytest.mark.django_db
+def test_runperiodic_runs_each_job():
+    call_command('runperiodic', tasks=get_job_name(simple_job))
+    assert calls == [{}]
+
+
+@pytest.mark.django_db
+def test_runperiodic_raises_errors():
+    with pytest.raises(ValueError):
+        call_command('runperiodic', tasks=','.join([get_job_name(failing_job), get_job_name(simple_job)]))
+    assert calls == [{}]
+
+
+@pytest.mark.django_db
+def test_interval(locmem_cache):
+    schedule_jobs([get_job_name(hourly_job)])
+    schedule_jobs([get_job_name(hourly_job)])
+    assert len(calls) == 1
+
+
+@pytest.mark.django_db
+def test_no_overlapping_runs(locmem_cache):
+    cache.add('pretix_periodic_job_running_{}_0'.format(get_job_name(simple_job)), 'true')
+    run_periodic_job(get_job_name(simple_job))
+    assert calls == []
+
+    cache.clear()
+    run_periodic_job(get_job_name(simple_job))
+    assert calls == [{}]
+
+
+@pytest.mark.django_db
+def test_sharded(settings):
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    for i in range(5):
+        Event.objects.create(organizer=o, name='Dummy', slug='dummy{}'.format(i), date_from=now())
+
+    settings.PRETIX_PERIODIC_SHARDS = 1
+    schedule_jobs([get_job_name(sharded_job)])
+    assert calls == [{'dummy0', 'dummy1', 'dummy2', 'dummy3', 'dummy4'}]
+
+    del calls[:]
+    settings.PRETIX_PERIODIC_SHARDS = 3
+    schedule_jobs([get_job_name(sharded_job)])
+    assert len(calls) == 3
+    assert set.union(*calls) == {'dummy0', 'dummy1', 'dummy2', 'dummy3', 'dummy4'}
+    assert sum(len(c) for c in calls) == 5
+
+
+@pytest.mark.django_db
+def test_lock_of_later_run_kept(locmem_cache):
+    periodic_job(timeout=1)(overrunning_job)
+    run_periodic_job(get_job_name(overrunning_job))
+    assert cache.get('pretix_periodic_job_running_{}_0'.format(get_job_name(overrunning_job))) == 'later'
+
+
+@pytest.mark.django_db
+def test_signal_receivers(jobs):
+    periodic._jobs[get_job_name(send_periodic_task)] = send_periodic_task
+    periodic_task.connect(signal_receiver, dispatch_uid='test_signal_receiver')
+    periodic_task.connect(jobs['simple_job'], dispatch_uid='test_simple_job')
+    try:
+        call_command('runperiodic', tasks=get_job_name(send_periodic_task))
+        # Registered jobs connected to the signal are not run again as part of the signal
+        assert calls == ['signal']
+    finally:
+        periodic_task.disconnect(dispatch_uid='test_signal_receiver')
+        periodic_task.disconnect(dispatch_uid='test_simple_job')
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.test import TestCase
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
@@ -55,3 +57,41 @@ class SettingsTestCase(TestCase):
 
         self.assertIsNone(sandbox.bar)
         self.assertIsNone(sandbox['baz'])
+
+    def test_load_settings(self):
+        event2 = Event.objects.create(
+            organizer=self.organizer, name='Dummy', slug='dummy2',
+            date_from=now(),
+        )
+        self.global_settings.settings.set('test_global', 'global')
+        self.organizer.settings.set('test_default', 'orga')
+        self.event.settings.set('waiting_list_enabled', True)
+        event2.settings.set('test_default', 'event')
+
+        with scopes_disabled():
+            events = list(Event.objects.filter(organizer=self.organizer).order_by('slug'))
+        with self.assertNumQueries(4):
+            views = settings.load_settings(events)
+        with self.assertNumQueries(0):
+            self.assertTrue(views[events[0]].waiting_list_enabled)
+            self.assertFalse(views[events[1]].waiting_list_enabled)
+            self.assertEqual(views[events[0]].test_default, 'orga')
+            self.assertEqual(views[events[1]]['test_default'], 'event')
+            self.assertEqual(views[events[1]].get('test_global'), 'global')
+            self.assertEqual(views[events[1]].get('test_unknown', default='foo'), 'foo')
+            self.assertEqual(events[0].settings.test_default, 'orga')
+            self.assertEqual(events[1].organizer.settings.test_global, 'global')
+
+        with self.assertRaises(AttributeError):
+            views[events[0]].test_default = 'foo'
+
+    def test_load_settings_without_hierarkey_internals(self):
+        self.organizer.settings.set('test_default', 'orga')
+        self.event.settings.set('waiting_list_enabled', True)
+
+        with scopes_disabled():
+            events = list(Event.objects.filter(organizer=self.organizer))
+        with mock.patch.object(settings, 'HIERARKEY_PROXY_ATTRIBUTES', ('_does_not_exist',)):
+            views = settings.load_settings(events)
+        self.assertTrue(views[events[0]].waiting_list_enabled)
+        self.assertEqual(views[events[0]].test_default, 'orga')
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+import pytz
+from django.utils import formats
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import (
+    Event, Order, OrderFee, OrderPayment, OrderPosition, OrderRollup,
+    Organizer, SalesRollup, SalesRollupInvalidation,
+)
+from pretix.base.services.stats import (
+    order_overview, refresh_all_sales_rollups, refresh_sales_rollups,
+)
+from pretix.control.views.dashboards import base_widgets
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now(), plugins='pretix.plugins.banktransfer'
+    )
+    event.settings.timezone = 'Europe/Berlin'
+    with scope(organizer=o):
+        yield event
+
+
+@pytest.fixture
+def item(event):
+    return event.items.create(name='Ticket', default_price=23, admission=True)
+
+
+def _order(event, item, dt, status=Order.STATUS_PENDING, count=1, fee=Decimal('0.00')):
+    o = Order.objects.create(
+        event=event, status=status, datetime=dt, expires=dt + timedelta(days=10),
+        total=count * Decimal('23.00') + fee, email='dummy@dummy.test'
+    )
+    for i in range(count):
+        OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'))
+    if fee:
+        OrderFee.objects.create(order=o, fee_type=OrderFee.FEE_TYPE_PAYMENT, internal_type='banktransfer', value=fee)
+    return o
+
+
+def _pay(order, dt):
+    order.payments.create(provider='manual', amount=order.total, state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+                          payment_date=dt)
+    order.status = Order.STATUS_PAID
+    order.save()
+
+
+@pytest.mark.django_db
+def test_overview(event, item):
+    tz = pytz.timezone('Europe/Berlin')
+    day1 = tz.localize(datetime(2019, 12, 1, 12, 0, 0))
+    day2 = tz.localize(datetime(2019, 12, 2, 0, 30, 0))
+
+    o1 = _order(event, item, day1, count=2, fee=Decimal('1.50'))
+    _pay(o1, day2)
+    _order(event, item, day1, count=1)
+    o3 = _order(event, item, day2, count=3)
+    p = o3.positions.first()
+    p.canceled = True
+    p.save()
+
+    refresh_sales_rollups(event)
+    items, total = order_overview(event, fees=True)
+    ticket = items[0][1][0]
+    assert ticket.num['paid'] == (2, Decimal('46.00'), Decimal('46.00'))
+    assert ticket.num['pending'] == (3, Decimal('69.00'), Decimal('69.00'))
+    assert ticket.num['canceled'] == (1, Decimal('23.00'), Decimal('23.00'))
+    assert ticket.num['total'] == (5, Decimal('115.00'), Decimal('115.00'))
+    assert items[1][1][0].num['paid'] == (1, Decimal('1.50'), Decimal('1.50'))
+
+    items, total = order_overview(event, date_filter='order_date', date_from=day1.date(), date_until=day1.date())
+    assert items[0][1][0].num['total'] == (3, Decimal('69.00'), Decimal('69.00'))
+    items, total = order_overview(event, date_filter='last_payment_date', date_from=day2.date())
+    assert items[0][1][0].num['total'] == (2, Decimal('46.00'), Decimal('46.00'))
+
+    assert OrderRollup.objects.get(event=event, order_date=day1.date(), status=Order.STATUS_PAID).total == Decimal('47.50')
+    assert not SalesRollupInvalidation.objects.exists()
+
+
+@pytest.mark.django_db
+def test_incremental_refresh(event, item):
+    tz = pytz.timezone('Europe/Berlin')
+    day1 = tz.localize(datetime(2019, 12, 1, 12, 0, 0))
+    day2 = tz.localize(datetime(2019, 12, 2, 12, 0, 0))
+    o1 = _order(event, item, day1)
+    _order(event, item, day2)
+    refresh_sales_rollups(event)
+    day2_rows = set(SalesRollup.objects.filter(order_date=day2.date()).values_list('pk', flat=True))
+
+    _pay(o1, day2)
+    assert SalesRollupInvalidation.objects.filter(order_id=o1.pk).exists()
+    # Reading rebuilds the outdated days before the numbers are used
+    items, total = order_overview(event)
+    assert items[0][1][0].num['paid'] == (1, Decimal('23.00'), Decimal('23.00'))
+    assert items[0][1][0].num['pending'] == (1, Decimal('23.00'), Decimal('23.00'))
+    assert not SalesRollupInvalidation.objects.exists()
+    # Only the day of the changed order has been rebuilt
+    assert set(SalesRollup.objects.filter(order_date=day2.date()).values_list('pk', flat=True)) == day2_rows
+
+
+@pytest.mark.django_db
+def test_unrelated_changes_do_not_mark(event, item):
+    o = _order(event, item, now(), fee=Decimal('1.50'))
+    refresh_sales_rollups(event)
+
+    o = Order.objects.get(pk=o.pk)
+    o.email = 'other@dummy.test'
+    o.save()
+    p = o.positions.first()
+    p.attendee_name_parts = {'full_name': 'Peter'}
+    p.save()
+    o.payments.create(provider='manual', amount=o.total)
+    assert not SalesRollupInvalidation.objects.exists()
+
+    p = OrderPosition.objects.get(pk=p.pk)
+    p.price = Decimal('20.00')
+    p.save()
+    assert SalesRollupInvalidation.objects.filter(order_id=o.pk).exists()
+
+
+@pytest.mark.django_db
+def test_timezone_change(event, item):
+    tz = pytz.timezone('Europe/Berlin')
+    _order(event, item, tz.localize(datetime(2019, 12, 2, 0, 30, 0)))
+    refresh_sales_rollups(event)
+    assert SalesRollup.objects.get().order_date == datetime(2019, 12, 2).date()
+
+    event.settings.timezone = 'UTC'
+    refresh_sales_rollups(event)
+    assert SalesRollup.objects.get().order_date == datetime(2019, 12, 1).date()
+
+
+@pytest.mark.django_db
+def test_timezone_change_periodic(event, item):
+    tz = pytz.timezone('Europe/Berlin')
+    _order(event, item, tz.localize(datetime(2019, 12, 2, 0, 30, 0)))
+    refresh_sales_rollups(event)
+    assert not SalesRollupInvalidation.objects.exists()
+
+    # No order has changed, the job still needs to notice the new timezone
+    event.settings.timezone = 'UTC'
+    refresh_all_sales_rollups(None)
+    assert SalesRollup.objects.get().order_date == datetime(2019, 12, 1).date()
+
+
+@pytest.mark.django_db
+def test_dashboard_widgets(event, item):
+    o1 = _order(event, item, now(), count=2)
+    _pay(o1, now())
+    _order(event, item, now(), count=1)
+    refresh_sales_rollups(event)
+    widgets = base_widgets(event)
+    assert '>3<' in widgets[0]['content']
+    assert '>2<' in widgets[1]['content']
+    assert formats.localize(Decimal('46.00')) in widgets[2]['content']
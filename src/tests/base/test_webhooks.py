@@ -1,14 +1,24 @@
 import json
+import os
 from datetime import timedelta
 from decimal import Decimal
 
 import pytest
 import responses
+from django.core.cache import cache
 from django.db import transaction
+from django.test import override_settings
 from django.utils.timezone import now
+from django_redis import get_redis_connection
 from django_scopes import scopes_disabled
 
-from pretix.base.models import Event, Item, Order, OrderPosition, Organizer
+from pretix.api.webhooks import (
+    _queue_key, deliver_webhooks, get_subscribed_webhooks, notify_webhooks,
+    schedule_webhook_batches, send_webhook_batch,
+)
+from pretix.base.models import (
+    Event, Item, LogEntry, Order, OrderPosition, Organizer,
+)
 
 
 @pytest.fixture
@@ -200,3 +210,209 @@ def test_webhook_disable_gone(event, order, webhook, monkeypatch_on_commit):
     assert len(responses.calls) == 1
     webhook.refresh_from_db()
     assert not webhook.enabled
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_deliver_batch(event, order, webhook):
+    responses.add(responses.POST, 'https://google.com', status=200)
+    responses.add(responses.POST, 'https://google.com', status=500)
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with scopes_disabled():
+        le1 = order.log_action('pretix.event.order.placed', {})
+        le2 = order.log_action('pretix.event.order.paid', {})
+        le3 = order.log_action('pretix.event.order.paid', {})
+        failed = deliver_webhooks(webhook, [
+            (le1.pk, 'pretix.event.order.placed'),
+            (le2.pk, 'pretix.event.order.paid'),
+            (le3.pk, 'pretix.event.order.paid'),
+            (le3.pk, 'pretix.event.unknown'),
+        ])
+        assert failed == [(le2.pk, 'pretix.event.order.paid')]
+        assert [json.loads(force_str(c.request.body))['notification_id'] for c in responses.calls] == [
+            le1.pk, le2.pk, le3.pk
+        ]
+        assert sorted((c.return_code, c.success) for c in webhook.calls.all()) == [
+            (200, True), (200, True), (500, False)
+        ]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_deliver_batch_stops_when_gone(event, order, webhook):
+    responses.add(responses.POST, 'https://google.com', status=410)
+    with scopes_disabled():
+        le1 = order.log_action('pretix.event.order.placed', {})
+        le2 = order.log_action('pretix.event.order.paid', {})
+        failed = deliver_webhooks(webhook, [
+            (le1.pk, 'pretix.event.order.placed'),
+            (le2.pk, 'pretix.event.order.paid'),
+        ])
+    assert failed == []
+    assert len(responses.calls) == 1
+    webhook.refresh_from_db()
+    assert not webhook.enabled
+
+
+@pytest.fixture
+def real_cache():
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                           REAL_CACHE_USED=True):
+        cache.clear()
+        yield
+
+
+@pytest.mark.django_db
+def test_webhook_index_invalidation(real_cache, event, organizer, webhook, django_assert_num_queries,
+                                    monkeypatch_on_commit):
+    assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.paid') == [webhook.pk]
+    with django_assert_num_queries(0):
+        assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.paid') == [webhook.pk]
+        assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.changed.item') == []
+        assert get_subscribed_webhooks(organizer.pk, event.pk + 1, 'pretix.event.order.paid') == []
+
+    with scopes_disabled():
+        webhook.listeners.create(action_type='pretix.event.order.changed.*')
+    assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.changed.item') == [webhook.pk]
+
+    webhook.limit_events.clear()
+    assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.paid') == []
+
+    webhook.all_events = True
+    webhook.save()
+    assert get_subscribed_webhooks(organizer.pk, event.pk + 1, 'pretix.event.order.paid') == [webhook.pk]
+
+    webhook.enabled = False
+    webhook.save()
+    assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.paid') == []
+
+
+@pytest.mark.django_db
+def test_webhook_index_invalidated_on_commit(real_cache, event, organizer, webhook):
+    assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.paid') == [webhook.pk]
+    webhook.enabled = False
+    webhook.save()
+    # The test runs in a transaction that is never committed
+    assert get_subscribed_webhooks(organizer.pk, event.pk, 'pretix.event.order.paid') == [webhook.pk]
+
+
+@pytest.mark.django_db
+def test_webhook_not_enqueued_without_subscribers(real_cache, event, order, webhook, monkeypatch):
+    calls = []
+    monkeypatch.setattr(notify_webhooks, 'apply_async', lambda args: calls.append(args))
+    with scopes_disabled():
+        order.log_action('pretix.event.order.changed.item', {})
+        assert calls == []
+        le = order.log_action('pretix.event.order.paid', {})
+        assert calls == [(le.pk,)]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_trigger_bulk_log(event, order, webhook, monkeypatch_on_commit):
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with transaction.atomic():
+        with LogEntry.bulk_log(batch_size=2):
+            le1 = order.log_action('pretix.event.order.placed', {})
+            le2 = order.log_action('pretix.event.order.paid', {})
+            le3 = order.log_action('pretix.event.order.paid', {})
+    assert [json.loads(force_str(c.request.body))['notification_id'] for c in responses.calls] == [
+        le1.pk, le2.pk, le3.pk
+    ]
+
+
+@pytest.fixture
+def redis_queue(settings):
+    # The queue is processed with Lua scripts, so these tests need a real Redis server.
+    # The database given here is flushed before and after every test.
+    url = os.environ.get('PRETIX_TEST_REDIS')
+    if not url:
+        pytest.skip('PRETIX_TEST_REDIS is not set')
+    settings.HAS_REDIS = True
+    settings.CACHES = dict(settings.CACHES, redis={
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': url,
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    })
+    rc = get_redis_connection('redis')
+    rc.flushdb()
+    yield rc
+    rc.flushdb()
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batch_keeps_foreign_flag(event, order, webhook, redis_queue):
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with scopes_disabled():
+        le = order.log_action('pretix.event.order.paid', {})
+    queue = _queue_key(webhook.pk)
+    redis_queue.rpush(queue, json.dumps([le.pk, 'pretix.event.order.paid']))
+    redis_queue.set(queue + '_scheduled', 'other')
+
+    # A task whose flag has expired and been taken over must neither deliver nor release the flag
+    send_webhook_batch(webhook.pk, 'stale')
+    assert len(responses.calls) == 0
+    assert redis_queue.llen(queue) == 1
+    assert redis_queue.get(queue + '_scheduled') == b'other'
+
+    send_webhook_batch(webhook.pk, 'other')
+    assert len(responses.calls) == 1
+    assert redis_queue.llen(queue) == 0
+    assert not redis_queue.exists(queue + '_scheduled')
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_sweep_schedules_orphaned_queue(event, order, webhook, redis_queue):
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with scopes_disabled():
+        le = order.log_action('pretix.event.order.paid', {})
+    queue = _queue_key(webhook.pk)
+    redis_queue.rpush(queue, json.dumps([le.pk, 'pretix.event.order.paid']))
+
+    schedule_webhook_batches(sender=None)
+    assert len(responses.calls) == 1
+    assert redis_queue.llen(queue) == 0
+    assert not redis_queue.exists(queue + '_scheduled')
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_deleted_order_skipped(event, order, webhook):
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with scopes_disabled():
+        deleted = Order.objects.create(
+            code='BAR', event=event, email='dummy@dummy.test', status=Order.STATUS_PAID,
+            datetime=now(), expires=now() + timedelta(days=10), total=Decimal('0.00'),
+        )
+        le1 = deleted.log_action('pretix.event.order.paid', {})
+        deleted.delete()
+        le2 = order.log_action('pretix.event.order.paid', {})
+        failed = deliver_webhooks(webhook, [(le1.pk, 'pretix.event.order.paid'), (le2.pk, 'pretix.event.order.paid')])
+    assert failed == []
+    assert [json.loads(force_str(c.request.body))['notification_id'] for c in responses.calls] == [le2.pk]
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batch_deleted_order_does_not_block_queue(event, order, webhook, redis_queue):
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with scopes_disabled():
+        deleted = Order.objects.create(
+            code='BAR', event=event, email='dummy@dummy.test', status=Order.STATUS_PAID,
+            datetime=now(), expires=now() + timedelta(days=10), total=Decimal('0.00'),
+        )
+        le1 = deleted.log_action('pretix.event.order.paid', {})
+        deleted.delete()
+        le2 = order.log_action('pretix.event.order.paid', {})
+    queue = _queue_key(webhook.pk)
+    redis_queue.rpush(queue, json.dumps([le1.pk, 'pretix.event.order.paid']))
+    redis_queue.rpush(queue, json.dumps([le2.pk, 'pretix.event.order.paid']))
+    redis_queue.set(queue + '_scheduled', 'token')
+
+    send_webhook_batch(webhook.pk, 'token')
+    assert [json.loads(force_str(c.request.body))['notification_id'] for c in responses.calls] == [le2.pk]
+    assert redis_queue.llen(queue) == 0
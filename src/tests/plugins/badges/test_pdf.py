@@ -1,6 +1,7 @@
 from datetime import timedelta
 from decimal import Decimal
 from io import BytesIO
+from unittest import mock
 
 import pytest
 from django.utils.timezone import now
@@ -68,3 +69,36 @@ def test_generate_pdf(env):
     assert ftype == 'application/pdf'
     pdf = PdfFileReader(BytesIO(buf))
     assert pdf.numPages == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("processes", [1, 2])
+def test_generate_pdf_chunked(env, settings, processes):
+    settings.PDF_RENDER_PROCESSES = processes
+    event, order, shirt = env
+    event.badge_layouts.create(name="Default", default=True)
+    with scope(organizer=event.organizer):
+        for i in range(3):
+            OrderPosition.objects.create(
+                order=order, item=shirt, price=12, attendee_name_parts={}, secret='abc{}'.format(i)
+            )
+    progress = []
+    e = BadgeExporter(event, progress.append)
+    with mock.patch('pretix.plugins.badges.exporters.PAGES_PER_CHUNK', 2):
+        fname, ftype, buf = e.render({
+            'items': [shirt.pk],
+            'rendering': 'one',
+            'include_pending': True
+        })
+    pdf = PdfFileReader(BytesIO(buf))
+    assert pdf.numPages == 5
+    assert progress == [33, 67, 100]
+
+    # Incomplete sheets are printed as well
+    fname, ftype, buf = e.render({
+        'items': [shirt.pk],
+        'rendering': 'a4_a6l',
+        'include_pending': True
+    })
+    pdf = PdfFileReader(BytesIO(buf))
+    assert pdf.numPages == 2
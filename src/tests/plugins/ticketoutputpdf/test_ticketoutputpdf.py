@@ -1,15 +1,27 @@
+import os
+import time
 from datetime import timedelta
 from decimal import Decimal
 from io import BytesIO
+from unittest import mock
 
 import pytest
+from django.db import connections
 from django.utils.timezone import now
 from django_scopes import scope
 from PyPDF2 import PdfFileReader
+from PyPDF2.generic import (
+    DecodedStreamObject, DictionaryObject, NameObject, NumberObject,
+    RectangleObject,
+)
+from PyPDF2.pdf import PageObject
 
+from pretix.base import pdf
 from pretix.base.models import (
     Event, Item, ItemVariation, Order, OrderPosition, Organizer,
 )
+from pretix.base.pdf import Renderer
+from pretix.plugins.ticketoutputpdf.exporters import AllTicketsPDF
 from pretix.plugins.ticketoutputpdf.ticketoutput import PdfTicketOutput
 
 
@@ -51,3 +63,126 @@ def test_generate_pdf(env0):
         assert ftype == 'application/pdf'
         pdf = PdfFileReader(BytesIO(buf))
         assert pdf.numPages == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("processes", [1, 2])
+def test_all_tickets_pdf(env0, settings, processes):
+    settings.PDF_RENDER_PROCESSES = processes
+    event, order = env0
+    order.status = Order.STATUS_PAID
+    order.save()
+    with scope(organizer=event.organizer):
+        e = AllTicketsPDF(event)
+        with mock.patch('pretix.plugins.ticketoutputpdf.exporters.PAGES_PER_CHUNK', 1):
+            fname, ftype, buf = e.render({'order_by': 'code'})
+    assert ftype == 'application/pdf'
+    pdf = PdfFileReader(BytesIO(buf))
+    assert pdf.numPages == 2
+
+
+@pytest.mark.django_db
+def test_all_tickets_pdf_without_processes(env0, settings, monkeypatch, caplog):
+    settings.PDF_RENDER_PROCESSES = 2
+    monkeypatch.setattr(pdf, '_render_pool_unavailable', False)
+    event, order = env0
+    order.status = Order.STATUS_PAID
+    order.save()
+    with scope(organizer=event.organizer):
+        e = AllTicketsPDF(event)
+        with mock.patch('pretix.plugins.ticketoutputpdf.exporters.PAGES_PER_CHUNK', 1), \
+                mock.patch('billiard.context.ForkContext.Pool',
+                           side_effect=AssertionError('daemonic processes are not allowed to have children')) as p:
+            for i in range(2):
+                fname, ftype, buf = e.render({'order_by': 'code'})
+                assert PdfFileReader(BytesIO(buf)).numPages == 2
+    assert p.call_count == 1
+    assert len([r for r in caplog.records if 'Could not start PDF rendering processes' in r.getMessage()]) == 1
+
+
+@pytest.mark.django_db
+def test_render_worker_keeps_inherited_connections(monkeypatch):
+    conn = connections['default']
+    conn.ensure_connection()
+    inherited = conn.connection
+    monkeypatch.setattr(pdf, '_worker_inherited_connections', [])
+    try:
+        pdf._init_render_worker(None)
+        # The worker must not use the connection, but it must not deallocate it either
+        assert conn.connection is None
+        assert pdf._worker_inherited_connections == [inherited]
+    finally:
+        conn.connection = inherited
+
+
+@pytest.mark.django_db
+def test_renderer_caches(env0):
+    event, order = env0
+    with scope(organizer=event.organizer):
+        o = PdfTicketOutput(event)
+        r1 = Renderer(event, o._default_layout(), o._get_default_background())
+        r2 = Renderer(event, o._default_layout(), o._get_default_background())
+    assert r1.bg_pdf is r2.bg_pdf
+    assert r1.variables is r2.variables
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(not os.environ.get('PRETIX_BENCHMARK'), reason="benchmarks only run on demand")
+def test_benchmark_generate(env0, capsys):
+    event, order = env0
+    n = 200
+    with scope(organizer=event.organizer):
+        op = order.positions.first()
+        o = PdfTicketOutput(event)
+        o.generate(op)
+        t0 = time.perf_counter()
+        for i in range(n):
+            o.generate(op)
+        duration = time.perf_counter() - t0
+    with capsys.disabled():
+        print('\n{:.1f} tickets per second'.format(n / duration))
+
+
+@pytest.mark.django_db
+def test_background_shared(env0):
+    event, order = env0
+    with scope(organizer=event.organizer):
+        o = PdfTicketOutput(event)
+        fname, ftype, buf = o.generate_order(order)
+    pdf = PdfFileReader(BytesIO(buf))
+    assert pdf.numPages == 2
+    refs = {
+        page['/Resources'].raw_get('/XObject').getObject().raw_get('/PretixBackground0').idnum
+        for page in pdf.pages
+    }
+    assert len(refs) == 1
+
+
+class _UnflattenedPdf:
+    def __init__(self, page):
+        self.page = page
+
+    def getPage(self, i):
+        return self.page
+
+
+def test_background_inherited_page_attributes():
+    resources = DictionaryObject({NameObject('/Font'): DictionaryObject()})
+    parent = DictionaryObject({
+        NameObject('/Type'): NameObject('/Pages'),
+        NameObject('/Resources'): resources,
+        NameObject('/MediaBox'): RectangleObject([0, 0, 200, 100]),
+        NameObject('/Rotate'): NumberObject(90),
+    })
+    contents = DecodedStreamObject()
+    contents.setData(b'0 0 m 200 100 l S')
+    page = PageObject()
+    page[NameObject('/Parent')] = parent
+    page[NameObject('/Contents')] = contents
+    bg_pdf = _UnflattenedPdf(page)
+
+    form = pdf._get_background_form(bg_pdf)
+    assert form['/Resources'] is resources
+    assert list(form['/BBox']) == [0, 0, 200, 100]
+    assert list(form['/Matrix']) == [0, -1, 1, 0, 0, 200]
+    assert list(pdf.get_background_box(bg_pdf)) == [0, 0, 100, 200]
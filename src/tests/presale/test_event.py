@@ -6,18 +6,20 @@ from json import loads
 from django.conf import settings
 from django.core import mail
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
-from django_scopes import scopes_disabled
+from django_scopes import scope, scopes_disabled
+from i18nfield.strings import LazyI18nString
 from pytz import timezone
 from tests.base import SoupTest
 
 from pretix.base.channels import SalesChannel
 from pretix.base.models import (
-    Event, Item, ItemCategory, ItemVariation, Order, Organizer, Quota, Team,
-    User, WaitingListEntry,
+    Event, Item, ItemCategory, ItemVariation, Order, Organizer, Quota,
+    SubEventSortKey, Team, User, WaitingListEntry,
 )
 from pretix.base.models.items import SubEventItem, SubEventItemVariation
+from pretix.presale.views.event import get_catalog_items
 
 
 class FoobarSalesChannel(SalesChannel):
@@ -213,6 +215,66 @@ class ItemDisplayTest(EventTestMixin, SoupTest):
         content = self.client.get('/%s/%s/' % (self.orga.slug, self.event.slug)).rendered_content
         self.assertLess(content.index('Cool SE'), content.index('Epic SE'))
 
+        self.event.settings.frontpage_subevent_ordering = 'name_descending'
+        content = self.client.get('/%s/%s/' % (self.orga.slug, self.event.slug)).rendered_content
+        self.assertLess(content.index('Epic SE'), content.index('Cool SE'))
+
+    def test_subevent_list_ordering_translated(self):
+        self.event.has_subevents = True
+        self.event.settings.locales = ['en', 'de']
+        self.event.save()
+        with scopes_disabled():
+            self.event.subevents.create(name=LazyI18nString({'en': 'Apple SE', 'de': 'Zitrone SE'}),
+                                        date_from=now() + datetime.timedelta(days=1), active=True)
+            self.event.subevents.create(name='Banana SE', date_from=now() + datetime.timedelta(days=2), active=True)
+
+        self.event.settings.frontpage_subevent_ordering = 'name_ascending'
+        content = self.client.get('/%s/%s/' % (self.orga.slug, self.event.slug)).rendered_content
+        self.assertLess(content.index('Apple SE'), content.index('Banana SE'))
+        self.client.get('/locale/set?locale=de')
+        content = self.client.get('/%s/%s/' % (self.orga.slug, self.event.slug)).rendered_content
+        self.assertLess(content.index('Banana SE'), content.index('Zitrone SE'))
+
+        with scopes_disabled():
+            se = self.event.subevents.order_by('date_from').last()
+            se.name = 'Aardvark SE'
+            se.save()
+        content = self.client.get('/%s/%s/' % (self.orga.slug, self.event.slug)).rendered_content
+        self.assertLess(content.index('Aardvark SE'), content.index('Zitrone SE'))
+
+    def test_subevent_list_ordering_locale_added(self):
+        self.event.has_subevents = True
+        self.event.settings.locales = ['en']
+        self.event.save()
+        with scopes_disabled():
+            self.event.subevents.create(name=LazyI18nString({'en': 'Apple SE', 'de': 'Zitrone SE'}),
+                                        date_from=now() + datetime.timedelta(days=1), active=True)
+            self.event.subevents.create(name='Banana SE', date_from=now() + datetime.timedelta(days=2), active=True)
+            assert not SubEventSortKey.objects.filter(locale='de').exists()
+
+        # Adding a language creates the keys right away, the front page only reads them
+        self.event.settings.locales = ['en', 'de']
+        with scopes_disabled():
+            assert SubEventSortKey.objects.filter(locale='de').count() == 2
+        self.event.settings.frontpage_subevent_ordering = 'name_ascending'
+        self.client.get('/locale/set?locale=de')
+        content = self.client.get('/%s/%s/' % (self.orga.slug, self.event.slug)).rendered_content
+        self.assertLess(content.index('Banana SE'), content.index('Zitrone SE'))
+
+    def test_subevent_list_pagination(self):
+        self.event.has_subevents = True
+        self.event.save()
+        with scopes_disabled():
+            for i in range(55):
+                self.event.subevents.create(name='Date {:02d}'.format(i), active=True,
+                                            date_from=now() + datetime.timedelta(days=i + 1))
+        content = self.client.get('/%s/%s/' % (self.orga.slug, self.event.slug)).rendered_content
+        self.assertIn('Date 49', content)
+        self.assertNotIn('Date 50', content)
+        content = self.client.get('/%s/%s/?page=2' % (self.orga.slug, self.event.slug)).rendered_content
+        self.assertIn('Date 54', content)
+        self.assertNotIn('Date 49', content)
+
     def test_subevent_calendar(self):
         self.event.settings.event_list_type = 'calendar'
         self.event.has_subevents = True
@@ -1228,3 +1290,55 @@ class EventSlugBanlistValidatorTest(EventTestMixin, SoupTest):
                 event.save()
 
         self.assertEqual(Event.objects.filter(name='download').count(), 0)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    }
+})
+class CatalogSnapshotTest(EventTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        with scopes_disabled():
+            self.quota = Quota.objects.create(event=self.event, name='Quota', size=2)
+            self.item = Item.objects.create(event=self.event, name='Early-bird ticket', default_price=0)
+            self.quota.items.add(self.item)
+
+    def test_snapshot_reused(self):
+        with scope(organizer=self.orga):
+            items = get_catalog_items(self.event)
+            assert [i.pk for i in items] == [self.item.pk]
+            items[0].name = 'Changed'
+            with self.assertNumQueries(1):
+                items = get_catalog_items(self.event)
+            assert [(i.pk, str(i.name)) for i in items] == [(self.item.pk, 'Early-bird ticket')]
+            assert items[0]._subevent_quotas == [self.quota]
+
+    def test_snapshot_quotas_fresh(self):
+        with scope(organizer=self.orga):
+            assert get_catalog_items(self.event)[0]._subevent_quotas[0].cached_availability_time is None
+            Quota.objects.filter(pk=self.quota.pk).update(cached_availability_time=now(), cached_availability_number=1)
+            q = get_catalog_items(self.event)[0]._subevent_quotas[0]
+            assert q.cached_availability_time is not None
+            assert q.cached_availability_number == 1
+
+    def test_snapshot_invalidated(self):
+        with scope(organizer=self.orga):
+            assert len(get_catalog_items(self.event)) == 1
+            item2 = Item.objects.create(event=self.event, name='Late-bird ticket', default_price=0)
+            assert len(get_catalog_items(self.event)) == 1
+            self.quota.items.add(item2)
+            assert len(get_catalog_items(self.event)) == 2
+            self.quota.items.remove(self.item)
+            assert [i.pk for i in get_catalog_items(self.event)] == [item2.pk]
+
+    def test_sale_period_checked(self):
+        with scope(organizer=self.orga):
+            self.item.available_from = now() + datetime.timedelta(seconds=1)
+            self.item.save()
+            assert get_catalog_items(self.event) == []
+            with self.assertNumQueries(0):
+                assert get_catalog_items(self.event) == []
+            assert len(self.event.cache.get('catalog:0:web:0:')) == 1
@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 
 import pytest
+from django.core.cache import cache
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 from pytz import UTC
@@ -138,6 +140,45 @@ def test_calendar(env, client):
     assert 'October 2017' in r.rendered_content
 
 
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_calendar_cache_invalidated(env, client):
+    cache.clear()
+    o = Organizer.objects.get(pk=env[0].pk)
+    o.settings.event_list_type = 'calendar'
+    e = Event.objects.create(
+        organizer=o, name='MRMCD2017', slug='2017',
+        date_from=datetime(now().year + 1, 9, 1, tzinfo=UTC),
+        live=True, is_public=True
+    )
+    se = Event.objects.create(
+        organizer=o, name='MRMCD series', slug='series',
+        date_from=datetime(now().year + 1, 9, 1, tzinfo=UTC),
+        live=True, is_public=True, has_subevents=True
+    )
+    with scopes_disabled():
+        subevent = se.subevents.create(name='Workshop', active=True, date_from=datetime(now().year + 1, 9, 3, tzinfo=UTC))
+    url = '/mrmcd/?style=calendar&month=9&year=%d' % (now().year + 1)
+    r = client.get(url)
+    assert 'MRMCD2017' in r.rendered_content
+    assert 'Workshop' in r.rendered_content
+
+    r = client.get(url)
+    assert 'MRMCD2017' in r.rendered_content
+
+    e.name = 'MRMCD2018'
+    e.save()
+    r = client.get(url)
+    assert 'MRMCD2017' not in r.rendered_content
+    assert 'MRMCD2018' in r.rendered_content
+
+    subevent.name = 'Lecture'
+    subevent.save()
+    r = client.get(url)
+    assert 'Workshop' not in r.rendered_content
+    assert 'Lecture' in r.rendered_content
+
+
 @pytest.mark.django_db
 def test_attributes_in_calendar(env, client):
     env[0].settings.event_list_type = 'calendar'
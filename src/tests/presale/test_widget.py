@@ -430,9 +430,27 @@ class WidgetCartTest(CartTestMixin, TestCase):
                      'event_url': 'http://example.com/ccc/30c3/', 'subevent': se1.pk, 'location': ''},
                     {'name': 'Future', 'date_range': 'Jan. 4, 2019 11:00', 'availability': {'color': 'green', 'text': 'Book now'},
                      'event_url': 'http://example.com/ccc/30c3/', 'subevent': se2.pk, 'location': ''}
-                ]
+                ],
+                'has_more_events': False,
             }
 
+    def test_subevent_list_offset(self):
+        self.event.has_subevents = True
+        self.event.save()
+        with scopes_disabled():
+            for i in range(55):
+                self.event.subevents.create(name="Date {}".format(i), active=True,
+                                            date_from=now() + datetime.timedelta(days=i + 1))
+
+        data = json.loads(self.client.get('/%s/%s/widget/product_list' % (self.orga.slug, self.event.slug)).content.decode())
+        assert len(data['events']) == 50
+        assert data['events'][0]['name'] == 'Date 0'
+        assert data['has_more_events']
+
+        data = json.loads(self.client.get('/%s/%s/widget/product_list?offset=50' % (self.orga.slug, self.event.slug)).content.decode())
+        assert [e['name'] for e in data['events']] == ['Date 50', 'Date 51', 'Date 52', 'Date 53', 'Date 54']
+        assert not data['has_more_events']
+
     def test_subevent_calendar(self):
         self.event.has_subevents = True
         self.event.settings.timezone = 'Europe/Berlin'